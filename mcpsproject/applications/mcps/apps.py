@@ -1,6 +1,23 @@
+from pathlib import Path
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class McpsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'applications.mcps'
+
+    def ready(self):
+        from . import cache, checks, metrics, realtime, webhooks
+
+        metrics.registry.enabled = getattr(settings, 'MCP_METRICS_ENABLED', False)
+        multiprocess_dir = getattr(settings, 'MCP_METRICS_MULTIPROCESS_DIR', None)
+        if metrics.registry.enabled and multiprocess_dir:
+            metrics.registry.multiprocess_dir = Path(multiprocess_dir)
+            metrics.registry.multiprocess_dir.mkdir(parents=True, exist_ok=True)
+        for module in (cache, webhooks, realtime):
+            metrics.registry.register_collector(module.collect_metrics)
+
+        if not settings.DEBUG:
+            checks.report_deploy_checks()
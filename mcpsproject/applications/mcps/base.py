@@ -1,23 +1,231 @@
 from abc import ABC, abstractmethod #Define una clase base abstracta para las aplicaciones MCP
-from typing import Any, Dict, List, Optional
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NewType, Optional, Union, get_args, get_origin, get_type_hints
 import asyncio
+import inspect
 import logging
 
+from . import metrics
+
+# Fecha en formato YYYY-MM-DD. Se usa en las anotaciones de los métodos MCP para validarla antes de llamar a la API.
+ISODate = NewType('ISODate', str)
+
+_MISSING = object()
+
+
+class InvalidParamsError(ValueError):
+    """Los parámetros de una llamada no cumplen la firma del método MCP."""
+
+
+def mcp_method(description: str, parameters: Optional[Dict[str, str]] = None, name: Optional[str] = None, proves_access: bool = True, cache_ttl: Optional[int] = None):
+    """
+    Registra un método del plugin como método MCP.
+    Los metadatos de get_available_methods y la validación de parámetros se generan a partir
+    de la firma del método, una sola vez por clase.
+
+    Args:
+        description (str): Descripción del método para Claude.
+        parameters (Optional[Dict[str, str]]): Descripción de cada parámetro. Debe describir exactamente
+            los parámetros de la firma; si no, la clase falla al crearse.
+        name (Optional[str]): Nombre público del método. Por defecto, el nombre de la función.
+        proves_access (bool): Si una respuesta correcta demuestra que las credenciales del usuario tienen
+            acceso al recurso, porque siempre consulta a Google. False para métodos que responden con datos locales.
+        cache_ttl (Optional[int]): Segundos que se cachea el resultado. Por defecto, MCP_CACHE_TTL; 0 para
+            no cachearlo nunca, p. ej. en datos en tiempo real.
+
+    Returns:
+        Callable: El decorador.
+    """
+    def decorator(func: Callable) -> Callable:
+        func._mcp_method = {
+            'name': name or func.__name__,
+            'description': description,
+            'parameters': parameters or {},
+            'proves_access': proves_access,
+            'cache_ttl': cache_ttl,
+        }
+        return func
+    return decorator
+
+
+def _compile_coercer(annotation: Any, param_name: str) -> Callable[[Any], Any]:
+    """
+    Compila una función que valida y convierte un valor según la anotación del parámetro.
+    """
+    if annotation is Any or annotation is inspect.Parameter.empty:
+        return lambda value: value
+
+    def fail(value, expected):
+        raise InvalidParamsError(f"El parámetro '{param_name}' debe ser {expected}, no {value!r}.")
+
+    origin = get_origin(annotation)
+    if origin is Union:
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        inner = _compile_coercer(args[0] if len(args) == 1 else Any, param_name)
+        return lambda value: None if value is None else inner(value)
+
+    if origin in (list, List):
+        args = get_args(annotation)
+        item = _compile_coercer(args[0] if args else Any, param_name)
+
+        def coerce_list(value):
+            if isinstance(value, str):
+                value = [value]
+            if not isinstance(value, (list, tuple)):
+                fail(value, 'una lista')
+            return [item(element) for element in value]
+        return coerce_list
+
+    if origin in (dict, Dict) or annotation in (dict, Dict):
+        return lambda value: value if isinstance(value, dict) else fail(value, 'un diccionario')
+
+    if annotation is ISODate:
+        def coerce_date(value):
+            try:
+                datetime.strptime(value, '%Y-%m-%d')
+            except (TypeError, ValueError):
+                fail(value, 'una fecha YYYY-MM-DD')
+            return value
+        return coerce_date
+
+    if annotation is bool:
+        def coerce_bool(value):
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.lower() in ('true', 'false'):
+                return value.lower() == 'true'
+            fail(value, 'un booleano')
+        return coerce_bool
+
+    if annotation in (int, float):
+        def coerce_number(value):
+            if isinstance(value, bool):
+                fail(value, annotation.__name__)
+            try:
+                number = annotation(value)
+            except (TypeError, ValueError):
+                fail(value, annotation.__name__)
+            if annotation is int and isinstance(value, float) and value != number:
+                fail(value, 'int')
+            return number
+        return coerce_number
+
+    if annotation is str:
+        return lambda value: value if isinstance(value, str) else fail(value, 'un texto')
+
+    return lambda value: value
+
+
+def _signature_params(func: Callable) -> List[inspect.Parameter]:
+    """
+    Devuelve los parámetros de un método MCP que se pueden pasar por nombre, sin self.
+    """
+    return [
+        param for param in list(inspect.signature(func).parameters.values())[1:]
+        if param.kind not in (param.VAR_POSITIONAL, param.VAR_KEYWORD)
+    ]
+
+
+def _check_parameters(cls: type, attr_name: str, func: Callable, spec: Dict) -> List[str]:
+    """
+    Comprueba que las descripciones de @mcp_method coinciden con la firma y devuelve los nombres en orden.
+    """
+    names = [param.name for param in _signature_params(func)]
+    missing = [name for name in names if name not in spec['parameters']]
+    extra = [name for name in spec['parameters'] if name not in names]
+    if missing or extra:
+        raise TypeError(
+            f"Los parámetros de @mcp_method de {cls.__name__}.{attr_name} no coinciden con su firma"
+            f" (sin describir: {', '.join(missing) or '-'}; no existen: {', '.join(extra) or '-'})."
+        )
+    return names
+
+
+def _compile_validator(func: Callable, method_name: str) -> Callable[[Dict], Dict]:
+    """
+    Compila el validador de parámetros de un método MCP a partir de su firma.
+    """
+    hints = get_type_hints(func)
+    specs = []
+    for param in _signature_params(func):
+        default = _MISSING if param.default is inspect.Parameter.empty else param.default
+        specs.append((param.name, default, _compile_coercer(hints.get(param.name, Any), param.name)))
+    allowed = frozenset(name for name, _, _ in specs)
+
+    def validate(params: Dict) -> Dict:
+        unknown = params.keys() - allowed
+        if unknown:
+            raise InvalidParamsError(f"Parámetros no soportados por {method_name}: {', '.join(sorted(unknown))}.")
+        kwargs = {}
+        for name, default, coerce in specs:
+            value = params.get(name, _MISSING)
+            if value is _MISSING:
+                if default is _MISSING:
+                    raise InvalidParamsError(f"Falta el parámetro obligatorio '{name}' de {method_name}.")
+                kwargs[name] = default
+            else:
+                kwargs[name] = coerce(value)
+        return kwargs
+    return validate
+
 class BaseApplication(ABC):
     """Esta es la clase base para todas las aplicaciones MCP.
     Proporciona una interfaz común y métodos básicos que deben ser implementados por todas las aplicaciones.
     """
 
-    def __init__(self, credentials: Dict, config: Dict, user_id: str):
+    # Tabla de despacho y metadatos generados por __init_subclass__ a partir de los métodos @mcp_method.
+    # Cada entrada es (nombre del atributo, validador, spec): el método se resuelve en cada llamada,
+    # así que una subclase puede sobrescribirlo sin volver a decorarlo.
+    _method_table: Dict[str, tuple] = {}
+    _method_metadata: List[Dict] = []
+
+    # Slug del MCPProvider del que se ha creado el plugin; etiqueta las métricas del proveedor
+    provider_slug: Optional[str] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Instrumenta las operaciones definidas o heredadas sin instrumentar, una sola vez por función
+        for operation in metrics.PLUGIN_OPERATIONS:
+            func = getattr(cls, operation)
+            if not getattr(func, '_mcp_instrumented', False):
+                setattr(cls, operation, metrics.instrument_plugin_operation(func, operation))
+        table = dict(cls._method_table)
+        for attr_name, attr in cls.__dict__.items():
+            spec = getattr(attr, '_mcp_method', None)
+            if spec is not None:
+                names = _check_parameters(cls, attr_name, attr, spec)
+                spec = {**spec, 'parameters': {name: spec['parameters'][name] for name in names}}
+                table[spec['name']] = (attr_name, _compile_validator(attr, spec['name']), spec)
+        cls._method_table = table
+        cls._method_metadata = [
+            {
+                'name': spec['name'],
+                'description': spec['description'],
+                'parameters': dict(spec['parameters']),
+            }
+            for _, _, spec in table.values()
+        ]
+
+    def __init__(self, credentials: Dict, config: Dict, user_id: str, provider_slug: Optional[str] = None):
         self.credentials = credentials
         self.config = config
         self.user_id = user_id
+        if provider_slug is not None:
+            self.provider_slug = provider_slug
         self.logger = logging.getLogger(f"mcp.{self.__class__.__name__}")
 
     #Usamos métodos abstractos para definir la interfaz que deben implementar las subclases.
     # Estos métodos no tienen implementación en esta clase base, pero deben ser implementados por las subclases concretas.
     # Las funciones asíncronas permiten que las subclases realicen operaciones de E/S sin bloquear el hilo principal, #lo que es útil para aplicaciones que interactúan con APIs externas o bases de datos.
 
+    @property
+    def metrics_provider(self) -> str:
+        """
+        Proveedor con el que se etiquetan las métricas del plugin: el slug, como en las de la caché,
+        o el nombre de la clase si el plugin no se ha creado desde una conexión.
+        """
+        return self.provider_slug or type(self).__name__
+
     @abstractmethod
     async def authenticate(self) -> bool:
         """
@@ -26,19 +234,18 @@ class BaseApplication(ABC):
         """
         pass
 
-    @abstractmethod
     async def get_available_methods(self) -> List[Dict]:
         """
         Método para obtener los métodos disponibles de la aplicación.
-        Debe ser implementado por las subclases.
+        Por defecto, devuelve los métodos registrados con @mcp_method.
         """
-        pass
+        return [dict(method) for method in self._method_metadata]
 
-    @abstractmethod
     async def execute_method(self, method_name: str, params: Dict) -> Dict:
         """
         Método para ejecutar un método específico de la aplicación.
-        Debe ser implementado por las subclases.
+        Por defecto, despacha a los métodos registrados con @mcp_method validando antes los parámetros,
+        de forma que una llamada incorrecta se rechaza sin hacer ninguna petición de red.
         
         Args:
             method_name (str): El nombre del método a ejecutar.
@@ -46,8 +253,30 @@ class BaseApplication(ABC):
         
         Returns:
             Any: El resultado de la ejecución del método.
+        
+        Raises:
+            ValueError: Si el método no existe.
+            InvalidParamsError: Si los parámetros no son válidos.
         """
-        pass
+        entry = self._method_table.get(method_name)
+        if entry is None:
+            raise ValueError(f"Método {method_name} no implementado.")
+        attr_name, validate, _ = entry
+        return await getattr(self, attr_name)(**validate(params or {}))
+
+    def canonical_params(self, method_name: str, params: Dict) -> Dict:
+        """
+        Devuelve los parámetros de una llamada tal y como los recibirá el método: validados, convertidos
+        y con los valores por defecto. Dos llamadas equivalentes dan los mismos parámetros canónicos.
+
+        Raises:
+            ValueError: Si el método no existe.
+            InvalidParamsError: Si los parámetros no son válidos.
+        """
+        entry = self._method_table.get(method_name)
+        if entry is None:
+            raise ValueError(f"Método {method_name} no implementado.")
+        return entry[1](params or {})
 
     async def refresh_token(self) -> bool:
         """
@@ -75,6 +304,9 @@ class BaseApplication(ABC):
         key_data = f"{self.user_id}:{method}:{str(sorted(params.items()))}"
         return hashlib.md5(key_data.encode()).hexdigest()
     
+# Nombre con el que los plugins importan la clase base
+BaseMCPPlugin = BaseApplication
+
 class AnalyticsMCPPlugin(BaseMCPPlugin):
     """Clase base para plugins de análisis de datos en MCP.
     Proporciona métodos comunes para la autenticación y ejecución de análisis.
@@ -95,7 +327,7 @@ class AnalyticsMCPPlugin(BaseMCPPlugin):
         pass
 
     @abstractmethod
-    async def get_rea_time_data(self) -> Dict:
+    async def get_real_time_data(self) -> Dict:
         """
         Método para obtener datos en tiempo real.
         Debe ser implementado por las subclases.
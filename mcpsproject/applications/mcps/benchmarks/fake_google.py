@@ -0,0 +1,359 @@
+"""
+API de Google falsa y en proceso para los benchmarks y tests.
+
+Sirve Search Console y la GA4 Data API a nivel HTTP: los plugins usan los servicios reales de
+googleapiclient (construidos con el documento de discovery) sobre un transporte `httplib2` falso,
+así que la codificación de las peticiones, los batch multipart y el parseo de las respuestas son
+los de producción. Latencia, tamaño de página, errores, cuota y permisos por token son configurables.
+"""
+from collections import Counter, deque
+from email.parser import Parser
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlparse
+import datetime
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+import httplib2
+from googleapiclient.discovery import build
+
+from mcps_plugins.google.analytics import GoogleAnalytics4MCP
+from mcps_plugins.google.search_console import GoogleSearchConsoleMCP
+
+# Máximo de filas por página de searchanalytics().query, como en la API real.
+GSC_MAX_ROW_LIMIT = 25000
+
+_SITES_PATH = re.compile(r'^/webmasters/v3/sites(?:/(?P<site>[^/]+))?(?P<query>/searchAnalytics/query)?$')
+_PROPERTY_PATH = re.compile(r'^/v1beta/properties/(?P<property>[^/:]+):(?P<method>runReport|runRealtimeReport)$')
+
+
+class _Failure(Exception):
+    """Error HTTP que el transporte falso devuelve como respuesta."""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+
+
+class FakeGoogleAPI:
+    """
+    Estado compartido de la API falsa: configuración, contadores de llamadas y cuota.
+
+    Args:
+        latency (float): Segundos que tarda cada petición HTTP.
+        jitter (float): Variación aleatoria máxima, en segundos, que se suma a la latencia.
+        total_rows (int): Filas que tiene cada sitio para cualquier consulta de searchanalytics.
+        error_rate (float): Probabilidad de que una petición falle con un 500.
+        quota_per_minute (Optional[int]): Peticiones permitidas por minuto antes de responder 429.
+        seed (int): Semilla para que los datos y los errores sean reproducibles.
+        site_access (Optional[Dict[str, Set[str]]]): Sitios y propiedades a los que tiene acceso cada token.
+            None da acceso a todo; con un diccionario, el resto de peticiones responden 403.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, total_rows: int = 5000, error_rate: float = 0.0, quota_per_minute: Optional[int] = None, seed: int = 0, site_access: Optional[Dict[str, Set[str]]] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.total_rows = total_rows
+        self.error_rate = error_rate
+        self.quota_per_minute = quota_per_minute
+        self.site_access = site_access
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.window = deque()
+        # Cada incremento cambia una parte de las filas de los informes en tiempo real
+        self.realtime_tick = 0
+        self._rows_cache: Dict[tuple, List[Dict]] = {}
+
+    def service(self, token: Optional[str] = None):
+        """
+        Servicio de googleapiclient para Search Console conectado a la API falsa.
+        """
+        return build('searchconsole', 'v1', http=FakeHttp(self, token), static_discovery=True)
+
+    def ga4_service(self, token: Optional[str] = None):
+        """
+        Servicio de googleapiclient para la GA4 Data API conectado a la API falsa.
+        """
+        return build('analyticsdata', 'v1beta', http=FakeHttp(self, token), static_discovery=True)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls.clear()
+            self.window.clear()
+
+    def http_call(self, method: str) -> None:
+        """
+        Simula una petición HTTP: la cuenta, aplica la cuota y los errores y espera la latencia.
+        """
+        with self.lock:
+            self.calls[method] += 1
+            now = time.monotonic()
+            if self.quota_per_minute is not None:
+                while self.window and now - self.window[0] > 60:
+                    self.window.popleft()
+                if len(self.window) >= self.quota_per_minute:
+                    self.calls['quota_exceeded'] += 1
+                    raise _Failure(429, 'Quota exceeded')
+                self.window.append(now)
+            delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0)
+        time.sleep(delay)
+        self.maybe_fail()
+
+    def maybe_fail(self) -> None:
+        with self.lock:
+            failed = self.error_rate and self.random.random() < self.error_rate
+            if failed:
+                self.calls['errors'] += 1
+        if failed:
+            raise _Failure(500, 'Backend Error')
+
+    def check_access(self, token: Optional[str], resource: str) -> None:
+        if self.site_access is not None and resource not in self.site_access.get(token, ()):
+            with self.lock:
+                self.calls['forbidden'] += 1
+            raise _Failure(403, 'User does not have sufficient permission for site')
+
+    def search_analytics(self, site_url: str, body: Dict) -> Dict:
+        dimensions = body.get('dimensions') or ['page']
+        rows = self._rows(site_url, tuple(dimensions), body.get('startDate', ''), body.get('endDate', ''))
+        start = body.get('startRow', 0)
+        limit = min(body.get('rowLimit') or 1000, GSC_MAX_ROW_LIMIT)
+        page = rows[start:start + limit]
+        return {'rows': page, 'responseAggregationType': 'byPage'} if page else {'responseAggregationType': 'byPage'}
+
+    def run_report(self, property_id: str, body: Dict) -> Dict:
+        limit = int(body.get('limit') or 10000)
+        seed = int(hashlib.md5(f"{property_id}:{json.dumps(body, sort_keys=True)}".encode()).hexdigest()[:8], 16)
+        return ga4_report(min(limit, self.total_rows), seed, body.get('dimensions'), body.get('metrics'))
+
+    def run_realtime_report(self, property_id: str, body: Dict) -> Dict:
+        report = ga4_report(min(int(body.get('limit') or 50), 250), int(hashlib.md5(property_id.encode()).hexdigest()[:8], 16), body.get('dimensions'), body.get('metrics'))
+        # Solo cambian una de cada cinco filas con cada tick, como los usuarios activos de unas pocas páginas
+        for index, row in enumerate(report.get('rows', [])):
+            if index % 5 == 0:
+                row['metricValues'][0]['value'] = str(int(row['metricValues'][0]['value']) + self.realtime_tick)
+        report['kind'] = 'analyticsData#runRealtimeReport'
+        return report
+
+    def _rows(self, site_url: str, dimensions: tuple, start_date: str, end_date: str) -> List[Dict]:
+        key = (site_url, dimensions, start_date, end_date)
+        rows = self._rows_cache.get(key)
+        if rows is None:
+            seed = int(hashlib.md5(repr(key).encode()).hexdigest()[:8], 16)
+            rows = self._rows_cache[key] = search_console_rows(site_url, dimensions, self.total_rows, seed, start_date, end_date)
+        return rows
+
+
+def search_console_rows(site_url: str, dimensions: tuple, total_rows: int, seed: int = 0, date: str = '2025-01-01', end_date: str = '') -> List[Dict]:
+    """
+    Genera filas de searchanalytics ordenadas por clicks, como las devuelve la API.
+    Como en la API, cada combinación de claves aparece una sola vez: la última dimensión
+    es única por fila y el resto se repiten. Las filas con 'date' se reparten por los días del rango.
+    """
+    rng = random.Random(seed)
+    first_day = _parse_date(date) or datetime.date(2025, 1, 1)
+    days = max((_parse_date(end_date) or first_day) - first_day, datetime.timedelta()).days + 1
+    values = {
+        'page': lambda i, unique: f"{site_url.rstrip('/')}/pagina-{i if unique else i % 997}/",
+        'query': lambda i, unique: f"consulta {i if unique else i % 3001}",
+        'date': lambda i, unique: (first_day + datetime.timedelta(days=i % days)).isoformat(),
+        'country': lambda i, unique: ('esp', 'mex', 'arg', 'usa')[i % 4],
+        'device': lambda i, unique: ('DESKTOP', 'MOBILE', 'TABLET')[i % 3],
+    }
+    last = len(dimensions) - 1
+    rows = []
+    for i in range(total_rows):
+        impressions = rng.randrange(1, 20000)
+        clicks = rng.randrange(0, impressions // 10 + 1)
+        rows.append({
+            'keys': [values.get(dimension, lambda i, unique: str(i))(i, index == last) for index, dimension in enumerate(dimensions)],
+            'clicks': clicks,
+            'impressions': impressions,
+            'ctr': clicks / impressions,
+            'position': rng.uniform(1, 60),
+        })
+    rows.sort(key=lambda row: row['clicks'], reverse=True)
+    return rows
+
+
+def _parse_date(value: str) -> Optional[datetime.date]:
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def ga4_report(rows: int, seed: int = 0, dimensions: Optional[List[Dict]] = None, metrics: Optional[List[Dict]] = None) -> Dict:
+    """
+    Genera una respuesta de runReport de la GA4 Data API.
+    """
+    rng = random.Random(seed)
+    dimension_names = [dimension['name'] for dimension in dimensions or [{'name': 'pagePath'}, {'name': 'date'}]]
+    metric_names = [metric['name'] for metric in metrics or [{'name': 'screenPageViews'}, {'name': 'activeUsers'}]]
+    values = {
+        'pagePath': lambda i: f"/pagina-{i % 997}/",
+        'unifiedScreenName': lambda i: f"Página {i % 997}",
+        'date': lambda i: '20250101',
+        'country': lambda i: ('Spain', 'Mexico', 'Argentina', 'United States')[i % 4],
+        'deviceCategory': lambda i: ('desktop', 'mobile', 'tablet')[i % 3],
+    }
+    return {
+        'dimensionHeaders': [{'name': name} for name in dimension_names],
+        'metricHeaders': [{'name': name, 'type': 'TYPE_INTEGER'} for name in metric_names],
+        'rows': [
+            {
+                'dimensionValues': [{'value': values.get(name, lambda i: str(i))(i)} for name in dimension_names],
+                'metricValues': [{'value': str(rng.randrange(1, 50000))} for _ in metric_names],
+            }
+            for i in range(rows)
+        ],
+        'rowCount': rows,
+        'kind': 'analyticsData#runReport',
+    }
+
+
+class FakeHttp:
+    """
+    Transporte con la interfaz de `httplib2.Http` que responde con la API falsa.
+
+    Args:
+        api (FakeGoogleAPI): Estado de la API falsa.
+        token (Optional[str]): Token del usuario, para aplicar `site_access`. Sin él se usa el de la
+            cabecera Authorization, como cuando googleapiclient envuelve el transporte con las credenciales.
+    """
+
+    def __init__(self, api: FakeGoogleAPI, token: Optional[str] = None):
+        self.api = api
+        self.token = token
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        path = urlparse(uri).path
+        token = self.token if self.token is not None else _bearer_token(headers or {})
+        try:
+            if path == '/batch':
+                self.api.http_call('batch')
+                return self._batch(body, headers or {}, token)
+            call, handler = self._route(method, path, body, token)
+            self.api.http_call(call)
+            return _response(200, handler())
+        except _Failure as failure:
+            return _error_response(failure)
+
+    def close(self):
+        pass
+
+    def _route(self, method: str, path: str, body, token: Optional[str]) -> Tuple[str, callable]:
+        payload = json.loads(body) if body else {}
+        match = _SITES_PATH.match(path)
+        if match:
+            site_url = unquote(match['site']) if match['site'] else None
+            if match['query'] and method == 'POST':
+                return 'searchanalytics.query', lambda: self._checked(token, site_url, lambda: self.api.search_analytics(site_url, payload))
+            if site_url is None and method == 'GET':
+                return 'sites.list', lambda: {'siteEntry': []}
+            if method == 'GET':
+                return 'sites.get', lambda: self._checked(token, site_url, lambda: {'siteUrl': site_url, 'permissionLevel': 'siteFullUser'})
+        match = _PROPERTY_PATH.match(path)
+        if match and method == 'POST':
+            property_id = match['property']
+            handler = self.api.run_report if match['method'] == 'runReport' else self.api.run_realtime_report
+            return f"properties.{match['method']}", lambda: self._checked(token, property_id, lambda: handler(property_id, payload))
+        raise _Failure(404, f"No encontrado: {method} {path}")
+
+    def _checked(self, token: Optional[str], resource: str, handler):
+        self.api.check_access(token, resource)
+        return handler()
+
+    def _batch(self, body, headers: Dict, token: Optional[str]) -> Tuple[httplib2.Response, bytes]:
+        """
+        Responde a una petición batch multipart/mixed con una parte application/http por petición.
+        """
+        if isinstance(body, bytes):
+            body = body.decode()
+        message = Parser().parsestr(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part in message.get_payload():
+            request_line, rest = part.get_payload().split('\n', 1)
+            method, path, _ = request_line.split(' ', 2)
+            inner_body = rest.split('\n\n', 1)[1] if '\n\n' in rest else rest.split('\r\n\r\n', 1)[-1]
+            try:
+                call, handler = self._route(method, urlparse(path).path, inner_body or None, token)
+                with self.api.lock:
+                    self.api.calls[f"batch:{call}"] += 1
+                self.api.maybe_fail()
+                status, reason, content = 200, 'OK', json.dumps(handler())
+            except _Failure as failure:
+                status, reason, content = failure.status, failure.reason, json.dumps(_error_body(failure))
+            content_id = part['Content-ID'][1:-1]
+            parts.append(
+                f"--{boundary}\r\n"
+                f"Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{content}\r\n"
+            )
+        content = ''.join(parts) + f"--{boundary}--\r\n"
+        return httplib2.Response({'status': 200, 'content-type': f'multipart/mixed; boundary={boundary}'}), content.encode()
+
+
+def _bearer_token(headers: Dict) -> Optional[str]:
+    authorization = next((value for name, value in headers.items() if name.lower() == 'authorization'), '')
+    return authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+
+
+def _response(status: int, payload: Dict) -> Tuple[httplib2.Response, bytes]:
+    return httplib2.Response({'status': status, 'content-type': 'application/json; charset=UTF-8'}), json.dumps(payload).encode()
+
+
+def _error_body(failure: _Failure) -> Dict:
+    return {'error': {'code': failure.status, 'message': failure.reason}}
+
+
+def _error_response(failure: _Failure) -> Tuple[httplib2.Response, bytes]:
+    response, content = _response(failure.status, _error_body(failure))
+    response.reason = failure.reason
+    return response, content
+
+
+class FixedResponseHttp:
+    """
+    Transporte que responde siempre con el mismo cuerpo, para medir solo el cliente:
+    la construcción de la petición y el parseo de la respuesta de googleapiclient.
+    """
+
+    def __init__(self, content: bytes):
+        self.content = content
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        return httplib2.Response({'status': 200, 'content-type': 'application/json; charset=UTF-8'}), self.content
+
+
+# API falsa que usan los plugins falsos. Los benchmarks y tests la sustituyen con la configuración que necesitan.
+fake_api = FakeGoogleAPI()
+
+
+class FakeSearchConsoleMCP(GoogleSearchConsoleMCP):
+    """
+    Plugin real de Search Console conectado a la API falsa en lugar de a Google.
+    """
+
+    def _build_service(self):
+        return fake_api.service(self.credentials.get('token'))
+
+
+class FakeAnalyticsMCP(GoogleAnalytics4MCP):
+    """
+    Plugin real de GA4 conectado a la API falsa en lugar de a Google.
+    """
+
+    def _build_service(self):
+        return fake_api.ga4_service(self.credentials.get('token'))
@@ -0,0 +1,103 @@
+"""
+Benchmark de la serialización de resultados frente a JSON con payloads de Search Console.
+
+Uso:
+    python -m applications.mcps.benchmarks.serialization [--rows 1000 10000 25000] [--repeat 5]
+"""
+from typing import Callable, Dict, List
+import argparse
+import json
+import random
+import time
+import zlib
+
+from applications.mcps import serialization
+
+
+def search_console_payload(rows: int, dimensions: int = 2, seed: int = 0) -> Dict:
+    """
+    Genera una respuesta de searchanalytics().query con la forma y cardinalidad habituales.
+    """
+    rng = random.Random(seed)
+    pages = [f"https://www.example.com/blog/{rng.randrange(10 ** 6)}-articulo-de-ejemplo/" for _ in range(max(rows // 20, 1))]
+    queries = [f"consulta de ejemplo {rng.randrange(10 ** 6)}" for _ in range(max(rows // 3, 1))]
+    result = []
+    for _ in range(rows):
+        impressions = rng.randrange(1, 50000)
+        clicks = rng.randrange(0, impressions // 10 + 1)
+        keys = [rng.choice(pages), rng.choice(queries), '2025-01-01'][:dimensions]
+        result.append({
+            'keys': keys,
+            'clicks': clicks,
+            'impressions': impressions,
+            'ctr': clicks / impressions,
+            'position': rng.uniform(1, 80),
+        })
+    return {'rows': result, 'responseAggregationType': 'byPage'}
+
+
+def _best_of(func: Callable, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(row_counts: List[int], repeat: int) -> List[Dict]:
+    results = []
+    for rows in row_counts:
+        payload = search_console_payload(rows)
+        codecs = {
+            'json': (
+                lambda: json.dumps(payload).encode(),
+                lambda blob: json.loads(blob),
+            ),
+            'json+zlib': (
+                lambda: zlib.compress(json.dumps(payload).encode(), serialization.COMPRESSION_LEVEL),
+                lambda blob: json.loads(zlib.decompress(blob)),
+            ),
+            'mcpb': (
+                lambda: serialization.dumps(payload, compress_threshold=None),
+                serialization.loads,
+            ),
+            'mcpb+zlib': (
+                lambda: serialization.dumps(payload),
+                serialization.loads,
+            ),
+        }
+        for name, (encode, decode) in codecs.items():
+            blob = encode()
+            assert decode(blob) == payload
+            results.append({
+                'rows': rows,
+                'codec': name,
+                'bytes': len(blob),
+                'encode_ms': _best_of(encode, repeat) * 1000,
+                'decode_ms': _best_of(lambda: decode(blob), repeat) * 1000,
+            })
+        blob = serialization.dumps(payload)
+        results.append({
+            'rows': rows,
+            'codec': 'mcpb+zlib iter_rows',
+            'bytes': len(blob),
+            'encode_ms': float('nan'),
+            'decode_ms': _best_of(lambda: sum(1 for _ in serialization.iter_rows(blob)), repeat) * 1000,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 25000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'rows':>7} {'codec':<20} {'bytes':>11} {'encode ms':>10} {'decode ms':>10}")
+    for result in run(args.rows, args.repeat):
+        print(f"{result['rows']:>7} {result['codec']:<20} {result['bytes']:>11} {result['encode_ms']:>10.2f} {result['decode_ms']:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
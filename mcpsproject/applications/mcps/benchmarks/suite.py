@@ -0,0 +1,288 @@
+"""
+Suite de benchmarks de los MCP: microbenchmarks de las rutas calientes y prueba de carga
+concurrente de MCPManager.execute_claude_request sobre ASGI contra la API de Google falsa.
+
+Necesita la base de datos de tests; normalmente se ejecuta con `python manage.py mcp_benchmark`.
+"""
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import asyncio
+import json
+import statistics
+import time
+import timeit
+import uuid
+
+from cryptography.fernet import Fernet
+from django.contrib.auth import get_user_model
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.test import override_settings
+from googleapiclient.discovery import build
+
+from applications.mcps import serialization
+from applications.mcps.benchmarks import fake_google
+from applications.mcps.benchmarks.urls import BenchmarkManager
+from applications.mcps.cache import PluginResultCache, result_cache
+from applications.mcps.models import MCPCategory, MCPProvider, UserMCPConnection
+
+BASELINE_PATH = Path(__file__).with_name('baselines.json')
+
+# Empeoramiento relativo de las métricas de tiempo respecto a la línea base a partir del cual se
+# considera una regresión. Es holgado porque los tiempos varían bastante entre ejecuciones.
+DEFAULT_THRESHOLD = 0.5
+
+FAKE_PLUGIN_CLASS = 'applications.mcps.benchmarks.fake_google.FakeSearchConsoleMCP'
+SITE_URL = 'https://www.example.com/'
+
+# Ajustes con los que se ejecuta la suite: clave Fernet válida para las credenciales,
+# URLs del endpoint de chat simulado y una caché local limpia.
+BENCHMARK_SETTINGS = {
+    'SECRET_KEY': Fernet.generate_key().decode(),
+    'ROOT_URLCONF': 'applications.mcps.benchmarks.urls',
+    'ALLOWED_HOSTS': ['*'],
+    'CACHES': {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'mcp-benchmarks'}},
+}
+
+
+def _per_op_us(func: Callable, number: int) -> float:
+    timer = timeit.Timer(func)
+    return min(timer.repeat(repeat=7, number=number)) / number * 1e6
+
+
+def _connection(user, provider, index: int = 0) -> UserMCPConnection:
+    connection = UserMCPConnection(
+        user=user,
+        mcp_provider=provider,
+        display_name=f"benchmark-{index}",
+        config_data={'site_url': SITE_URL},
+    )
+    connection.credentials = {'token': 'fake-token', 'refresh_token': 'fake-refresh'}
+    return connection
+
+
+def create_fixtures(users: int) -> List:
+    """
+    Crea los usuarios, el proveedor falso de Search Console y una conexión activa por usuario.
+    """
+    category, _ = MCPCategory.objects.get_or_create(slug='benchmark', defaults={'name': 'Benchmark', 'icon': 'bench'})
+    provider, _ = MCPProvider.objects.get_or_create(
+        slug='gsc-benchmark',
+        defaults={
+            'name': 'Search Console (benchmark)',
+            'category': category,
+            'integration_type': 'oauth2',
+            'plugin_class': FAKE_PLUGIN_CLASS,
+        },
+    )
+    created = []
+    User = get_user_model()
+    for index in range(users):
+        user = User.objects.create(username=f"benchmark-{uuid.uuid4().hex[:12]}")
+        connection = _connection(user, provider, index)
+        connection.save()
+        created.append(user)
+    return created
+
+
+def run_microbenchmarks(number: int = 2000) -> Dict[str, float]:
+    """
+    Microbenchmarks de las operaciones que se repiten en cada petición.
+
+    Returns:
+        Dict[str, float]: Microsegundos por operación.
+    """
+    with override_settings(**BENCHMARK_SETTINGS):
+        user = get_user_model()(id=1, username='benchmark')
+        provider = MCPProvider(slug='gsc-benchmark', plugin_class=FAKE_PLUGIN_CLASS)
+        connection = _connection(user, provider)
+        plugin = connection.get_plugin()
+        params = {
+            'site_url': SITE_URL,
+            'start_date': '2025-01-01',
+            'end_date': '2025-01-31',
+            'dimensions': ['page', 'query'],
+            'row_limit': 1000,
+        }
+        validate = plugin._method_table['get_search_analytics'][1]
+
+        response = fake_google.FakeGoogleAPI(total_rows=1000).search_analytics(SITE_URL, {'rowLimit': 1000, 'dimensions': ['page', 'query']})
+        cached_blob = serialization.dumps(response)
+        # Clientes reales de googleapiclient sobre un transporte que responde siempre lo mismo:
+        # se mide la construcción de la petición y el parseo de la respuesta, sin red
+        gsc = build('searchconsole', 'v1', http=fake_google.FixedResponseHttp(json.dumps(response).encode()), static_discovery=True)
+        ga4 = build('analyticsdata', 'v1beta', http=fake_google.FixedResponseHttp(json.dumps(fake_google.ga4_report(1000)).encode()), static_discovery=True)
+        gsc_body = {'startDate': '2025-01-01', 'endDate': '2025-01-31', 'dimensions': ['page', 'query'], 'rowLimit': 1000}
+        ga4_body = {'dateRanges': [{'startDate': '2025-01-01', 'endDate': '2025-01-31'}], 'dimensions': [{'name': 'pagePath'}, {'name': 'date'}], 'metrics': [{'name': 'screenPageViews'}, {'name': 'activeUsers'}]}
+
+        return {
+            'cache_key_us': _per_op_us(lambda: plugin.get_cache_key('get_search_analytics', params), number),
+            'shared_cache_key_us': _per_op_us(lambda: PluginResultCache.shared_key('gsc', SITE_URL, 'get_search_analytics', params), number),
+            'credential_decrypt_us': _per_op_us(lambda: connection.credentials, number),
+            'plugin_construction_us': _per_op_us(connection.get_plugin, number),
+            'param_validation_us': _per_op_us(lambda: validate(params), number),
+            'parse_gsc_response_1k_us': _per_op_us(lambda: gsc.searchanalytics().query(siteUrl=SITE_URL, body=gsc_body).execute(), max(number // 100, 5)),
+            'decode_cached_gsc_1k_us': _per_op_us(lambda: serialization.loads(cached_blob), max(number // 100, 5)),
+            'parse_ga4_report_1k_us': _per_op_us(lambda: ga4.properties().runReport(property='properties/1', body=ga4_body).execute(), max(number // 100, 5)),
+        }
+
+
+async def asgi_post(application, path: str, body: bytes) -> Dict:
+    """
+    Envía un POST a una aplicación ASGI y devuelve el estado y el cuerpo de la respuesta.
+    """
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'POST',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [(b'host', b'benchmark'), (b'content-type', b'application/json')],
+        'client': ('127.0.0.1', 50000),
+        'server': ('benchmark', 80),
+    }
+    body_sent = False
+    disconnected = asyncio.Event()
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        # Django escucha desconexiones mientras atiende la petición: el cliente no se desconecta
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    response = {'status': None, 'body': b''}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif message['type'] == 'http.response.body':
+            response['body'] += message.get('body', b'')
+
+    try:
+        await application(scope, receive, send)
+    finally:
+        disconnected.set()
+    return response
+
+
+def run_load_test(
+    requests: int = 200,
+    concurrency: int = 20,
+    users: int = 10,
+    latency: float = 0.05,
+    error_rate: float = 0.0,
+    quota_per_minute: Optional[int] = None,
+    total_rows: int = 1000,
+    claude_latency: float = 0.0,
+) -> Dict[str, float]:
+    """
+    Prueba de carga de extremo a extremo: `requests` peticiones de chat por ASGI con como mucho
+    `concurrency` en vuelo, repartidas entre `users` usuarios conectados al mismo sitio.
+
+    Returns:
+        Dict[str, float]: Throughput, percentiles de latencia, errores y llamadas a la API falsa.
+    """
+    with override_settings(**BENCHMARK_SETTINGS):
+        caches['default'].clear()
+        result_cache.stats.reset()
+        fake_google.fake_api = fake_google.FakeGoogleAPI(
+            latency=latency,
+            total_rows=total_rows,
+            error_rate=error_rate,
+            quota_per_minute=quota_per_minute,
+        )
+        BenchmarkManager.claude_latency = claude_latency
+        BenchmarkManager.mcp_calls = [{
+            'mcp': 'gsc-benchmark',
+            'method': 'get_search_analytics',
+            'params': {'site_url': SITE_URL, 'start_date': '2025-01-01', 'end_date': '2025-01-31', 'dimensions': ['page']},
+        }]
+        bench_users = create_fixtures(users)
+        application = get_asgi_application()
+        return asyncio.run(_drive(application, bench_users, requests, concurrency))
+
+
+async def _drive(application, users: List, requests: int, concurrency: int) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def one(index: int):
+        nonlocal failures
+        body = json.dumps({'user_id': users[index % len(users)].pk, 'message': f"informe {index}"}).encode()
+        async with semaphore:
+            start = time.perf_counter()
+            response = await asgi_post(application, '/bench/chat/', body)
+            latencies.append(time.perf_counter() - start)
+        if response['status'] != 200 or any('error' in item for item in json.loads(response['body']).get('mcp_data', [])):
+            failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    calls = fake_google.fake_api.calls
+    cache_stats = result_cache.stats.snapshot()
+    return {
+        'throughput_rps': requests / elapsed,
+        'latency_p50_ms': statistics.median(latencies) * 1000,
+        'latency_p95_ms': latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)] * 1000,
+        'error_rate': failures / requests,
+        'upstream_sites_list': calls['sites.list'],
+        'upstream_searchanalytics_query': calls['searchanalytics.query'],
+        'shared_cache_hit_ratio': cache_stats['shared']['hit_ratio'],
+    }
+
+
+# Métricas en las que un valor mayor es mejor; en el resto, un valor menor es mejor.
+HIGHER_IS_BETTER = frozenset(('throughput_rps', 'shared_cache_hit_ratio'))
+
+# Métricas deterministas con la configuración por defecto: cualquier empeoramiento es una regresión.
+EXACT_METRICS = frozenset(('error_rate', 'upstream_sites_list', 'upstream_searchanalytics_query'))
+
+
+def compare(results: Dict[str, float], baselines: Dict[str, float], threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Compara los resultados con la línea base.
+
+    Args:
+        results (Dict[str, float]): Resultados de la ejecución actual.
+        baselines (Dict[str, float]): Línea base guardada.
+        threshold (float): Empeoramiento relativo tolerado en las métricas de tiempo y throughput.
+
+    Returns:
+        List[str]: Descripción de cada métrica que empeora más de lo tolerado.
+    """
+    regressions = []
+    for name, baseline in baselines.items():
+        value = results.get(name)
+        if value is None:
+            continue
+        if name in EXACT_METRICS:
+            if value > baseline:
+                regressions.append(f"{name}: {value:.2f} frente a {baseline:.2f} de línea base")
+            continue
+        if not baseline:
+            continue
+        change = (baseline - value) / baseline if name in HIGHER_IS_BETTER else (value - baseline) / baseline
+        if change > threshold:
+            regressions.append(f"{name}: {value:.2f} frente a {baseline:.2f} de línea base ({change:+.0%})")
+    return regressions
+
+
+def load_baselines(path: Path = BASELINE_PATH) -> Dict[str, float]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+def save_baselines(results: Dict[str, float], path: Path = BASELINE_PATH) -> None:
+    path.write_text(json.dumps({name: round(value, 3) for name, value in sorted(results.items())}, indent=4) + '\n')
@@ -0,0 +1,49 @@
+"""
+URLs de los benchmarks: un endpoint de chat que ejecuta MCPManager.execute_claude_request
+con Claude simulado, para la prueba de carga de extremo a extremo sobre ASGI.
+"""
+import asyncio
+import json
+
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+
+from applications.mcps.manager import MCPManager
+
+
+class BenchmarkManager(MCPManager):
+    """
+    MCPManager con las fases de Claude simuladas: pide los datos de Search Console
+    de todos los MCP activos y tarda `claude_latency` segundos en responder.
+    """
+
+    claude_latency = 0.0
+    mcp_calls = []
+
+    async def _analyze_message_for_mcp(self, message: str):
+        return list(self.active_plugins)
+
+    async def _send_claude_request(self, message: str, context):
+        if self.claude_latency:
+            await asyncio.sleep(self.claude_latency)
+        return {
+            'content': f"Respuesta simulada a: {message}",
+            'mcp_calls': [dict(call) for call in self.mcp_calls],
+        }
+
+
+@csrf_exempt
+async def chat(request):
+    payload = json.loads(request.body)
+    user = await get_user_model().objects.aget(pk=payload['user_id'])
+    manager = BenchmarkManager(user)
+    await manager.initialize_plugins()
+    response = await manager.execute_claude_request(payload['message'], payload.get('session_id', ''))
+    return JsonResponse(response)
+
+
+urlpatterns = [
+    path('bench/chat/', chat, name='bench-chat'),
+]
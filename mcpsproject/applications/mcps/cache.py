@@ -0,0 +1,362 @@
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import serialization
+
+# Segundos que se guarda el resultado de un método MCP en cualquiera de los dos niveles.
+DEFAULT_CACHE_TTL = 600
+
+# Segundos que se recuerda que una conexión ha obtenido datos de una propiedad en Google.
+ACCESS_GRANT_TTL = 24 * 3600
+
+# Parámetros que identifican la propiedad o sitio al que se refiere una llamada.
+RESOURCE_PARAMS = ('property_id', 'site_url')
+
+# Claves de config_data de una conexión que declaran las propiedades a las que tiene acceso.
+CONFIG_RESOURCE_KEYS = ('property_id', 'site_url', 'properties', 'sites')
+
+# Single-flight entre workers: segundos que dura el candado de una clave mientras un worker consulta a
+# Google, y cuánto esperan (sondeando la caché) los demás workers antes de consultar por su cuenta.
+SINGLE_FLIGHT_LOCK_TTL = 30
+SINGLE_FLIGHT_WAIT = 10
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+# Resultado con el que el líder de un single-flight avisa de que ha fallado
+_FETCH_FAILED = object()
+
+logger = logging.getLogger("mcp.cache")
+
+
+class CacheStats:
+    """
+    Contadores de aciertos y fallos por nivel de caché, proveedor y método.
+    El bucle de eventos los actualiza mientras el hilo de métricas los lee, así que ambos pasan por un candado.
+    """
+
+    TIERS = ('user', 'shared')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+
+    def hit(self, tier: str, provider: str = '', method: str = '') -> None:
+        with self.lock:
+            self._counter(tier, provider, method)['hits'] += 1
+
+    def miss(self, tier: str, provider: str = '', method: str = '') -> None:
+        with self.lock:
+            self._counter(tier, provider, method)['misses'] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Aciertos, fallos y ratio de aciertos por nivel.
+        """
+        totals = {tier: {'hits': 0, 'misses': 0} for tier in self.TIERS}
+        for (tier, _, _), counter in self._copy().items():
+            totals[tier]['hits'] += counter['hits']
+            totals[tier]['misses'] += counter['misses']
+        return {tier: self._with_ratio(counter) for tier, counter in totals.items()}
+
+    def by_method(self) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+        """
+        Aciertos, fallos y ratio de aciertos por (nivel, proveedor, método).
+        """
+        return {key: self._with_ratio(counter) for key, counter in self._copy().items()}
+
+    def _copy(self) -> Dict[Tuple[str, str, str], Dict[str, int]]:
+        with self.lock:
+            return {key: dict(counter) for key, counter in self.counters.items()}
+
+    def _counter(self, tier: str, provider: str, method: str) -> Dict[str, int]:
+        key = (tier, provider, method)
+        counter = self.counters.get(key)
+        if counter is None:
+            counter = self.counters[key] = {'hits': 0, 'misses': 0}
+        return counter
+
+    @staticmethod
+    def _with_ratio(counter: Dict[str, int]) -> Dict[str, Any]:
+        total = counter['hits'] + counter['misses']
+        return {**counter, 'hit_ratio': counter['hits'] / total if total else 0.0}
+
+
+class PluginResultCache:
+    """
+    Caché de dos niveles para los resultados de los métodos MCP.
+
+    - Nivel de usuario: llamadas sin propiedad identificable, con la clave de BaseApplication.get_cache_key.
+    - Nivel compartido: llamadas sobre una propiedad o sitio, con una clave por proveedor + propiedad
+      + consulta canónica que comparten todos los usuarios con acceso a esa propiedad.
+
+    Los resultados se guardan MCP_CACHE_TTL segundos o los que indique el `cache_ttl` del @mcp_method;
+    los métodos con cache_ttl=0, como los datos en tiempo real, no se cachean.
+
+    Antes de servir una entrada compartida se comprueba que la conexión del usuario está activa y
+    tiene acceso a la propiedad, ya sea porque la declara en su config_data o porque ya obtuvo
+    datos de ella de Google con sus propias credenciales.
+
+    Los fallos de una misma clave se agrupan (single-flight): dentro del proceso, las llamadas
+    concurrentes esperan a la primera; entre workers, un candado corto en la caché hace que solo
+    uno consulte a Google mientras los demás esperan a que escriba el resultado.
+    """
+
+    def __init__(self, cache_alias: Optional[str] = None, ttl: Optional[int] = None):
+        self.cache_alias = cache_alias or getattr(settings, 'MCP_CACHE_ALIAS', 'default')
+        self.ttl = ttl or getattr(settings, 'MCP_CACHE_TTL', DEFAULT_CACHE_TTL)
+        self.stats = CacheStats()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    async def get_or_fetch(self, connection, plugin, method: str, params: Dict) -> Any:
+        """
+        Devuelve el resultado cacheado del método o lo obtiene del plugin y lo guarda.
+
+        Args:
+            connection (UserMCPConnection): Conexión del usuario que hace la llamada.
+            plugin (BaseApplication): Plugin ya autenticado de esa conexión.
+            method (str): El nombre del método a ejecutar.
+            params (Dict): Los parámetros del método.
+
+        Returns:
+            Any: El resultado del método.
+
+        Raises:
+            InvalidParamsError: Si los parámetros no son válidos.
+        """
+        # Las claves se generan con los parámetros ya validados, convertidos y con los valores por defecto
+        params = plugin.canonical_params(method, params)
+        resource = self.resource_for(params)
+        provider = connection.mcp_provider.slug
+        ttl = self.ttl_for(plugin, method)
+        if not ttl:
+            # Métodos que no se cachean (datos en tiempo real): siempre con las credenciales del usuario
+            result = await plugin.execute_method(method, params)
+            if resource is not None and self.proves_access(plugin, method):
+                await self.grant(connection, resource)
+            return result
+        connection_generation_key = self._connection_generation_key(connection)
+        if resource is None:
+            generation = await self.cache.aget(connection_generation_key, 0)
+            key = f"mcp:user:{generation}:{plugin.get_cache_key(method, params)}"
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                self.stats.hit('user', provider, method)
+                return self._decode(cached)
+            self.stats.miss('user', provider, method)
+            result, _ = await self._single_flight(key, True, ttl, lambda: plugin.execute_method(method, params))
+            return result
+
+        resource_generation_key = self._resource_generation_key(provider, resource)
+        generations = await self.cache.aget_many([connection_generation_key, resource_generation_key])
+        grant_key = self._grant_key(connection, resource, generations.get(connection_generation_key, 0))
+        key = self.shared_key(provider, resource, method, params, generations.get(resource_generation_key, 0))
+
+        entries = await self.cache.aget_many([grant_key, key])
+        access = self.has_access(connection, resource, entries.get(grant_key))
+        if access and key in entries:
+            self.stats.hit('shared', provider, method)
+            return self._decode(entries[key])
+        self.stats.miss('shared', provider, method)
+
+        # Sin acceso no se espera al resultado de otro usuario: se consulta con las propias credenciales
+        result, fetched = await self._single_flight(key, access, ttl, lambda: plugin.execute_method(method, params))
+        # El permiso solo se registra si Google ha respondido con las credenciales del propio usuario
+        if fetched and self.proves_access(plugin, method):
+            await self.cache.aset(grant_key, True, ACCESS_GRANT_TTL)
+        return result
+
+    async def _single_flight(self, key: str, can_share: bool, ttl: int, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Obtiene el resultado de una clave ausente de la caché con una sola consulta por clave a la vez.
+
+        Args:
+            key (str): Clave de la caché.
+            can_share (bool): Si la llamada puede recibir el resultado que obtenga otra.
+            ttl (int): Segundos que se guarda el resultado.
+            fetch (Callable): Corrutina que consulta el plugin.
+
+        Returns:
+            Tuple[Any, bool]: El resultado y si lo ha obtenido esta llamada consultando el plugin.
+        """
+        leader = self._in_flight.get(key)
+        if leader is not None and can_share:
+            result = await asyncio.shield(leader)
+            if result is not _FETCH_FAILED:
+                return result, False
+        if leader is not None or not can_share:
+            return await self._fetch_and_store(key, ttl, fetch), True
+
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        result = _FETCH_FAILED
+        try:
+            lock_key = f"{key}:lock"
+            if not await self.cache.aadd(lock_key, True, SINGLE_FLIGHT_LOCK_TTL):
+                # Otro worker ya está consultando esta clave
+                cached = await self._wait_for(key)
+                if cached is not None:
+                    result = self._decode(cached)
+                    return result, False
+                result = await self._fetch_and_store(key, ttl, fetch)
+                return result, True
+            try:
+                result = await self._fetch_and_store(key, ttl, fetch)
+            finally:
+                await self.cache.adelete(lock_key)
+            return result, True
+        finally:
+            del self._in_flight[key]
+            future.set_result(result)
+
+    async def _fetch_and_store(self, key: str, ttl: int, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        result = await fetch()
+        await self.cache.aset(key, self._encode(result), ttl)
+        return result
+
+    async def _wait_for(self, key: str) -> Any:
+        deadline = time.monotonic() + SINGLE_FLIGHT_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+            cached = await self.cache.aget(key)
+            if cached is not None:
+                return cached
+        return None
+
+    async def has_grant(self, connection, resource: str) -> bool:
+        """
+        Comprueba si la conexión ya obtuvo datos de la propiedad de Google con sus propias credenciales.
+        A diferencia de has_access, no basta con que la propiedad esté en su config_data.
+        """
+        if connection.status != 'active':
+            return False
+        generation = await self.cache.aget(self._connection_generation_key(connection), 0)
+        return bool(await self.cache.aget(self._grant_key(connection, resource, generation)))
+
+    async def grant(self, connection, resource: str) -> None:
+        """
+        Registra que Google ha respondido sobre la propiedad con las credenciales de la conexión.
+        """
+        generation = await self.cache.aget(self._connection_generation_key(connection), 0)
+        await self.cache.aset(self._grant_key(connection, resource, generation), True, ACCESS_GRANT_TTL)
+
+    def has_access(self, connection, resource: str, granted: Optional[bool] = None) -> bool:
+        """
+        Comprueba si la conexión puede leer entradas compartidas de la propiedad.
+        """
+        if connection.status != 'active':
+            return False
+        return bool(granted) or resource in self.configured_resources(connection)
+
+    async def invalidate(self, connection_ids: Iterable = (), resources: Iterable[Tuple[str, str]] = ()) -> None:
+        """
+        Invalida en una sola escritura las entradas de varias conexiones y propiedades.
+        Las claves incluyen un número de generación, así que basta con cambiarlo para que las
+        entradas anteriores dejen de leerse y expiren solas.
+
+        Args:
+            connection_ids (Iterable): Conexiones cuyas entradas de usuario y permisos se invalidan.
+            resources (Iterable[Tuple[str, str]]): Pares (slug del proveedor, propiedad) cuyas entradas compartidas se invalidan.
+        """
+        generation = time.time_ns()
+        keys = {f"mcp:gen:conn:{connection_id}": generation for connection_id in connection_ids}
+        keys.update({self._resource_generation_key(provider, resource): generation for provider, resource in resources})
+        if keys:
+            await self.cache.aset_many(keys, None)
+
+    @staticmethod
+    def _encode(result: Any) -> Any:
+        # Los resultados se guardan en binario compacto; si no son serializables o no volverían
+        # iguales de la serialización (claves no string, tuplas...), tal cual
+        try:
+            return serialization.dumps(result)
+        except (TypeError, ValueError):
+            return result
+
+    @staticmethod
+    def _decode(cached: Any) -> Any:
+        return serialization.loads(cached) if serialization.is_serialized(cached) else cached
+
+    @staticmethod
+    def resource_for(params: Dict) -> Optional[str]:
+        for name in RESOURCE_PARAMS:
+            value = params.get(name)
+            if value:
+                return str(value)
+        return None
+
+    @staticmethod
+    def shared_key(provider: str, resource: str, method: str, params: Dict, generation: int = 0) -> str:
+        """
+        Genera la clave compartida a partir de la consulta canónica, sin datos del usuario.
+        """
+        canonical = json.dumps(params, sort_keys=True, separators=(',', ':'), default=str)
+        key_data = f"{provider}:{resource}:{generation}:{method}:{canonical}"
+        return f"mcp:shared:{hashlib.md5(key_data.encode()).hexdigest()}"
+
+    @staticmethod
+    def _grant_key(connection, resource: str, generation: int = 0) -> str:
+        return f"mcp:grant:{connection.id}:{generation}:{hashlib.md5(resource.encode()).hexdigest()}"
+
+    @staticmethod
+    def _connection_generation_key(connection) -> str:
+        return f"mcp:gen:conn:{connection.id}"
+
+    @staticmethod
+    def _resource_generation_key(provider: str, resource: str) -> str:
+        return f"mcp:gen:res:{provider}:{hashlib.md5(resource.encode()).hexdigest()}"
+
+    def ttl_for(self, plugin, method: str) -> int:
+        """
+        Segundos que se cachea el resultado del método: el cache_ttl de su @mcp_method o el de la caché.
+        """
+        entry = plugin._method_table.get(method)
+        ttl = entry[2].get('cache_ttl') if entry is not None else None
+        return self.ttl if ttl is None else ttl
+
+    @staticmethod
+    def proves_access(plugin, method: str) -> bool:
+        entry = plugin._method_table.get(method)
+        return entry is None or entry[2].get('proves_access', True)
+
+    @staticmethod
+    def configured_resources(connection) -> set:
+        return PluginResultCache.resources_in_config(connection.config_data)
+
+    @staticmethod
+    def resources_in_config(config: Optional[Dict]) -> set:
+        resources = set()
+        for name in CONFIG_RESOURCE_KEYS:
+            value = (config or {}).get(name)
+            if isinstance(value, (list, tuple)):
+                resources.update(str(item) for item in value)
+            elif value:
+                resources.add(str(value))
+        return resources
+
+
+result_cache = PluginResultCache()
+
+
+def collect_metrics():
+    """
+    Métricas de la caché de resultados por nivel, proveedor y método para el endpoint de métricas.
+    """
+    for (tier, provider, method), counter in result_cache.stats.by_method().items():
+        labels = {'tier': tier, 'provider': provider, 'method': method}
+        yield 'mcp_cache_hits_total', 'counter', labels, counter['hits']
+        yield 'mcp_cache_misses_total', 'counter', labels, counter['misses']
+        yield 'mcp_cache_hit_ratio', 'gauge', labels, counter['hit_ratio']
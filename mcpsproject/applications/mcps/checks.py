@@ -0,0 +1,104 @@
+"""
+Comprobaciones de arranque de la configuración de despliegue.
+
+Avisan de ajustes que funcionan pero penalizan el rendimiento en producción: base de datos sin
+pool ni conexiones persistentes, cachés que no se comparten entre workers, sesiones que consultan
+la base de datos en cada petición o una SECRET_KEY con la que no se pueden descifrar credenciales.
+También avisan de un endpoint de métricas activo sin token.
+Se ejecutan con `manage.py check --deploy` y al arrancar con DEBUG desactivado.
+"""
+import logging
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+logger = logging.getLogger(__name__)
+
+# Backends de caché que no se comparten entre procesos
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.database, deploy=True)
+def check_database(app_configs, **kwargs):
+    messages = []
+    for alias, config in settings.DATABASES.items():
+        if config.get('ENGINE', '').endswith('sqlite3'):
+            messages.append(Warning(
+                f"La base de datos '{alias}' usa SQLite.",
+                hint="SQLite serializa las escrituras; en producción usa PostgreSQL (settings/prod.py).",
+                id='mcps.W001',
+            ))
+            continue
+        pooled = bool(config.get('OPTIONS', {}).get('pool'))
+        conn_max_age = config.get('CONN_MAX_AGE', 0)
+        if not pooled and not conn_max_age:
+            messages.append(Warning(
+                f"La base de datos '{alias}' abre una conexión nueva en cada petición.",
+                hint="Activa el pool de psycopg (OPTIONS['pool']) o un CONN_MAX_AGE mayor que 0.",
+                id='mcps.W002',
+            ))
+        elif not pooled and not config.get('CONN_HEALTH_CHECKS'):
+            messages.append(Warning(
+                f"La base de datos '{alias}' usa conexiones persistentes sin CONN_HEALTH_CHECKS.",
+                hint="Las conexiones cortadas por el servidor fallarán en la primera consulta de la petición.",
+                id='mcps.W003',
+            ))
+    return messages
+
+
+@register(Tags.caches, deploy=True)
+def check_caches(app_configs, **kwargs):
+    messages = []
+    alias = getattr(settings, 'MCP_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    if backend in LOCAL_CACHE_BACKENDS:
+        messages.append(Warning(
+            f"La caché '{alias}' de los resultados de los plugins usa {backend.rsplit('.', 1)[-1]}.",
+            hint="Cada worker tendrá su propia caché: configura Redis o Memcached para compartirla.",
+            id='mcps.W004',
+        ))
+    if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.db':
+        messages.append(Warning(
+            "Las sesiones se leen de la base de datos en cada petición.",
+            hint="Usa SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db' con una caché compartida.",
+            id='mcps.W005',
+        ))
+    return messages
+
+
+@register(Tags.security, deploy=True)
+def check_metrics(app_configs, **kwargs):
+    if getattr(settings, 'MCP_METRICS_ENABLED', False) and not getattr(settings, 'MCP_METRICS_TOKEN', None):
+        return [Warning(
+            "El endpoint de métricas está activo y no pide token.",
+            hint="Define MCP_METRICS_TOKEN (se envía como 'Authorization: Bearer <token>') o desactiva MCP_METRICS_ENABLED.",
+            id='mcps.W006',
+        )]
+    return []
+
+
+@register(Tags.security, deploy=True)
+def check_secret_key(app_configs, **kwargs):
+    try:
+        Fernet(settings.SECRET_KEY)
+    except (ValueError, TypeError):
+        return [Error(
+            "SECRET_KEY no es una clave Fernet válida.",
+            hint="Las credenciales de las conexiones se cifran con ella; genera una con Fernet.generate_key().",
+            id='mcps.E001',
+        )]
+    return []
+
+
+def report_deploy_checks() -> None:
+    """
+    Registra en el log los avisos de despliegue al arrancar, sin impedir el arranque.
+    """
+    for check in (check_database, check_caches, check_metrics, check_secret_key):
+        for message in check(None):
+            log = logger.error if message.is_serious() else logger.warning
+            log("%s: %s %s", message.id, message.msg, message.hint or '')
@@ -0,0 +1,32 @@
+"""
+Eventos de ciclo de vida ASGI (lifespan) del proceso.
+
+El handler ASGI de Django solo atiende peticiones HTTP; este middleware responde al protocolo
+lifespan para que, al parar o reciclar un worker (max_requests), se apliquen los eventos de webhook
+que ya se han confirmado con 202 y siguen en memoria.
+"""
+from .webhooks import ingestor
+
+
+class LifespanMiddleware:
+    """
+    Envuelve la aplicación ASGI de Django y atiende los mensajes lifespan.
+
+    Args:
+        app: Aplicación ASGI de Django.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await ingestor.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta los microbenchmarks y la prueba de carga de los MCP contra la API de Google falsa "
+        "y compara los resultados con la línea base guardada. La línea base se genera con las "
+        "opciones por defecto, así que solo es comparable con ellas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Peticiones de la prueba de carga.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Peticiones en vuelo a la vez.')
+        parser.add_argument('--users', type=int, default=10, help='Usuarios conectados al mismo sitio.')
+        parser.add_argument('--latency', type=float, default=0.05, help='Latencia de la API falsa, en segundos.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Probabilidad de error 500 de la API falsa.')
+        parser.add_argument('--quota', type=int, default=None, help='Peticiones por minuto antes de responder 429.')
+        parser.add_argument('--rows', type=int, default=1000, help='Filas por respuesta de searchanalytics.')
+        parser.add_argument('--threshold', type=float, default=None, help='Empeoramiento relativo tolerado en las métricas de tiempo (0.5 = 50%%).')
+        parser.add_argument('--update-baseline', action='store_true', help='Guarda los resultados como nueva línea base.')
+        parser.add_argument('--skip-load', action='store_true', help='Ejecuta solo los microbenchmarks.')
+
+    def handle(self, *args, **options):
+        from applications.mcps.benchmarks import suite
+
+        # La prueba de carga crea usuarios y conexiones: se usa una base de datos de tests desechable
+        setup_test_environment()
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        old_config = runner.setup_databases()
+        try:
+            results = suite.run_microbenchmarks()
+            if not options['skip_load']:
+                results.update(suite.run_load_test(
+                    requests=options['requests'],
+                    concurrency=options['concurrency'],
+                    users=options['users'],
+                    latency=options['latency'],
+                    error_rate=options['error_rate'],
+                    quota_per_minute=options['quota'],
+                    total_rows=options['rows'],
+                ))
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        baselines = suite.load_baselines()
+        for name, value in sorted(results.items()):
+            baseline = baselines.get(name)
+            reference = f"  (línea base {baseline:.2f})" if baseline is not None else ''
+            self.stdout.write(f"{name:<32} {value:>12.2f}{reference}")
+
+        if options['update_baseline']:
+            suite.save_baselines(results)
+            self.stdout.write(self.style.SUCCESS(f"Línea base guardada en {suite.BASELINE_PATH}"))
+            return
+
+        threshold = options['threshold'] if options['threshold'] is not None else suite.DEFAULT_THRESHOLD
+        regressions = suite.compare(results, baselines, threshold)
+        if regressions:
+            raise CommandError("Regresiones de rendimiento:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS("Sin regresiones respecto a la línea base."))
@@ -1,8 +1,11 @@
 
 
+import asyncio
 import logging
 from typing import Dict, List
-from ...applications.mcps.models import UserMCPConnection
+from . import metrics
+from .cache import result_cache
+from .models import UserMCPConnection
 
 
 class MCPManager:
@@ -25,7 +28,7 @@ class MCPManager:
         return UserMCPConnection.objects.filter(
             user=self.user,
             status='active'
-            ).select_related('mcp_provider__category')
+            ).select_related('mcp_provider__category', 'user')
     
     async  def initialize_plugins(self):
         """
@@ -34,7 +37,7 @@ class MCPManager:
         Returns:
             None
         """
-        for connection in self.connection:
+        async for connection in self.connection:
             try:
                 plugin = connection.get_plugin()
                 if await plugin.authenticate():
@@ -44,6 +47,7 @@ class MCPManager:
                         "methods": await plugin.get_available_methods()
                         }
             except Exception as e:
+                metrics.count_init_error(connection.mcp_provider.slug)
                 logging.error(f"Error al inicializar el plugin {connection.mcp_provider.slug}: {e}")
 
     async def execute_claude_request(self, message:str, session_id:str) -> Dict:
@@ -58,17 +62,21 @@ class MCPManager:
             Dict: La respuesta de Claude.
         """
         # Analiza el mensaje que determinar los MCP que necesita ejecutar.
-        needed_mcp = await self._analyze_message_for_mcp(message)
+        with metrics.phase('analyze_message'):
+            needed_mcp = await self._analyze_message_for_mcp(message)
 
         #Crear un contexto para la solicitud de Claude.
-        context = await self._build_claude_context(needed_mcp)
+        with metrics.phase('build_context'):
+            context = await self._build_claude_context(needed_mcp)
 
         # Ejecutar la solicitud a Claude con el contexto.
-        response = await self._send_claude_request(message, context)
+        with metrics.phase('claude_request'):
+            response = await self._send_claude_request(message, context)
 
         # Procesar la respuesta de Claude para extraer los resultados de los MCP.
         if response.get('mcp_calls'):
-            mcp_resutls = await self._execute_mcp_calls(response['mcp_calls'])
+            with metrics.phase('execute_mcp_calls'):
+                mcp_resutls = await self._execute_mcp_calls(response['mcp_calls'])
             response['mcp_data'] = mcp_resutls
         
         return response
@@ -98,4 +106,34 @@ class MCPManager:
                     'category': plugin_info['connection'].config_data
                 })
                 context['available_methods'][mcp_slug] = plugin_info['methods']
-        return context
\ No newline at end of file
+        return context
+    
+    async def _execute_mcp_calls(self, mcp_calls: List[Dict]) -> List[Dict]:
+        """
+        Ejecuta en paralelo las llamadas a MCP pedidas por Claude, pasando por la caché de resultados.
+        
+        Args:
+            mcp_calls (List[Dict]): Llamadas con las claves 'mcp', 'method' y 'params'.
+        
+        Returns:
+            List[Dict]: El resultado o el error de cada llamada, en el mismo orden.
+        """
+        async def execute(call: Dict) -> Dict:
+            mcp_slug = call.get('mcp')
+            method = call.get('method')
+            plugin_info = self.active_plugins.get(mcp_slug)
+            if plugin_info is None:
+                return {'mcp': mcp_slug, 'method': method, 'error': f"MCP {mcp_slug} no está activo."}
+            try:
+                data = await result_cache.get_or_fetch(
+                    plugin_info['connection'],
+                    plugin_info['plugin'],
+                    method,
+                    call.get('params') or {},
+                )
+                return {'mcp': mcp_slug, 'method': method, 'data': data}
+            except Exception as e:
+                logging.error(f"Error al ejecutar {mcp_slug}.{method}: {e}")
+                return {'mcp': mcp_slug, 'method': method, 'error': str(e)}
+
+        return await asyncio.gather(*(execute(call) for call in mcp_calls))
@@ -0,0 +1,343 @@
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+# Límites (segundos) de los buckets de los histogramas de latencia.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Operaciones de los plugins que se instrumentan automáticamente en BaseApplication.
+PLUGIN_OPERATIONS = ('authenticate', 'execute_method', 'refresh_token')
+
+# Segundos entre volcados del estado de cada worker al directorio multiproceso.
+MULTIPROCESS_WRITE_INTERVAL = 5
+
+# Fichero del directorio multiproceso que acumula los contadores de los workers que ya han terminado.
+MULTIPROCESS_ARCHIVE = 'archive.json'
+
+_DISABLED = nullcontext()
+
+logger = logging.getLogger("mcp.metrics")
+
+
+class Histogram:
+    """
+    Histograma de buckets fijos con el formato de Prometheus.
+    """
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, counts: List[int], total: float, count: int) -> None:
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.sum += total
+        self.count += count
+
+
+class MetricsRegistry:
+    """
+    Registro en memoria de contadores e histogramas con etiquetas.
+    Con la instrumentación desactivada los wrappers solo comprueban `enabled` antes de llamar a la función original.
+
+    El registro es por proceso. Con varios workers, cada uno vuelca periódicamente su estado en
+    `multiprocess_dir` (MCP_METRICS_MULTIPROCESS_DIR) y render() agrega los de todos: los contadores
+    e histogramas se suman y los gauges se exportan con una etiqueta `worker`. Sin ese directorio,
+    cada scrape solo ve el worker que lo atiende.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.help: Dict[str, str] = {}
+        self.counters: Dict[str, Dict[Tuple, float]] = {}
+        self.histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]] = []
+        self.multiprocess_dir: Optional[Path] = None
+        # Los contadores se actualizan también desde los hilos de to_thread
+        self.lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+
+    def inc(self, name: str, labels: Tuple[Tuple[str, str], ...], value: float = 1) -> None:
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name: str, labels: Tuple[Tuple[str, str], ...], value: float) -> None:
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def describe(self, name: str, text: str) -> None:
+        self.help[name] = text
+
+    def register_collector(self, collector: Callable) -> None:
+        """
+        Registra una función que devuelve (nombre, tipo, etiquetas, valor) en cada exportación,
+        para publicar contadores que ya mantienen otros módulos sin duplicarlos.
+        """
+        self.collectors.append(collector)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self) -> Dict:
+        """
+        Devuelve el estado del proceso en un formato serializable en JSON.
+        """
+        with self.lock:
+            counters = {name: [[list(labels), value] for labels, value in series.items()] for name, series in self.counters.items()}
+            histograms = {
+                name: [[list(labels), list(histogram.counts), histogram.sum, histogram.count] for labels, histogram in series.items()]
+                for name, series in self.histograms.items()
+            }
+        collected = [
+            [name, kind, list(labels.items()), value]
+            for collector in self.collectors
+            for name, kind, labels, value in collector()
+        ]
+        return {'counters': counters, 'histograms': histograms, 'collected': collected}
+
+    def write_snapshot(self) -> None:
+        """
+        Vuelca el estado del proceso en el directorio multiproceso, de forma atómica.
+        """
+        if self.multiprocess_dir is None:
+            return
+        path = self.multiprocess_dir / f"{os.getpid()}.json"
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+    def start_multiprocess_writer(self, interval: float = MULTIPROCESS_WRITE_INTERVAL) -> None:
+        """
+        Arranca en el worker el hilo que vuelca su estado cada `interval` segundos y al terminar.
+        """
+        if self.multiprocess_dir is None or self._writer is not None:
+            return
+
+        def write_forever():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.write_snapshot()
+                except Exception as e:
+                    logger.error(f"Error al volcar las métricas del worker: {e}")
+
+        self._writer = threading.Thread(target=write_forever, name='mcp-metrics-writer', daemon=True)
+        self._writer.start()
+        atexit.register(self.write_snapshot)
+
+    def render(self) -> str:
+        """
+        Exporta las métricas en el formato de texto de Prometheus, agregando las de todos los
+        workers si hay directorio multiproceso.
+        """
+        snapshot = self.snapshot()
+        if self.multiprocess_dir is None:
+            return self._format(snapshot)
+        own = f"{os.getpid()}.json"
+        snapshots = [dict(snapshot, worker=str(os.getpid()))]
+        for path in self.multiprocess_dir.glob('*.json'):
+            if path.name == own:
+                continue
+            try:
+                snapshots.append(dict(json.loads(path.read_text()), worker=path.stem))
+            except (OSError, ValueError):
+                # El worker ha terminado o está reescribiendo su fichero
+                continue
+        return self._format(merge_snapshots(snapshots))
+
+    def _format(self, snapshot: Dict) -> str:
+        lines = []
+        for name, series in sorted(snapshot['counters'].items()):
+            self._header(lines, name, 'counter')
+            for labels, value in series:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, series in sorted(snapshot['histograms'].items()):
+            self._header(lines, name, 'histogram')
+            for labels, counts, total, count in series:
+                cumulative = 0
+                for bound, bucket in zip(LATENCY_BUCKETS + (float('inf'),), counts):
+                    cumulative += bucket
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + [('le', le)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        declared = set()
+        for name, kind, labels, value in snapshot['collected']:
+            if name not in declared:
+                self._header(lines, name, kind)
+                declared.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def _header(self, lines: List[str], name: str, kind: str) -> None:
+        if name in self.help:
+            lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+def merge_snapshots(snapshots: List[Dict]) -> Dict:
+    """
+    Agrega los snapshots de varios procesos: suma contadores e histogramas y, en los snapshots
+    con clave 'worker', añade esa etiqueta a los gauges, que no tiene sentido sumar.
+    """
+    counters: Dict[str, Dict[Tuple, float]] = {}
+    histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+    collected: Dict[Tuple, List] = {}
+    for snapshot in snapshots:
+        for name, series in snapshot.get('counters', {}).items():
+            merged = counters.setdefault(name, {})
+            for labels, value in series:
+                labels = _labels(labels)
+                merged[labels] = merged.get(labels, 0) + value
+        for name, series in snapshot.get('histograms', {}).items():
+            merged = histograms.setdefault(name, {})
+            for labels, counts, total, count in series:
+                merged.setdefault(_labels(labels), Histogram()).merge(counts, total, count)
+        for name, kind, labels, value in snapshot.get('collected', []):
+            labels = _labels(labels)
+            if kind == 'gauge' and 'worker' in snapshot:
+                labels += (('worker', snapshot['worker']),)
+            sample = collected.setdefault((name, labels), [name, kind, list(labels), 0])
+            sample[3] += value
+    return {
+        'counters': {name: [[list(labels), value] for labels, value in series.items()] for name, series in counters.items()},
+        'histograms': {
+            name: [[list(labels), histogram.counts, histogram.sum, histogram.count] for labels, histogram in series.items()]
+            for name, series in histograms.items()
+        },
+        'collected': sorted(collected.values(), key=lambda sample: sample[0]),
+    }
+
+
+def mark_process_dead(directory, pid: int) -> None:
+    """
+    Acumula los contadores e histogramas de un worker que ha terminado en el fichero de archivo
+    del directorio multiproceso y descarta sus gauges. Se llama desde el proceso maestro de gunicorn.
+    """
+    directory = Path(directory)
+    path = directory / f"{pid}.json"
+    try:
+        snapshot = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return
+    archive_path = directory / MULTIPROCESS_ARCHIVE
+    try:
+        archive = json.loads(archive_path.read_text())
+    except (OSError, ValueError):
+        archive = {}
+    snapshot['collected'] = [sample for sample in snapshot.get('collected', []) if sample[1] != 'gauge']
+
+    merged = merge_snapshots([archive, snapshot])
+    temporary = archive_path.with_suffix('.tmp')
+    temporary.write_text(json.dumps(merged))
+    os.replace(temporary, archive_path)
+    path.unlink(missing_ok=True)
+
+
+def _labels(labels) -> Tuple[Tuple[str, str], ...]:
+    return tuple((key, value) for key, value in labels)
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+registry.describe('mcp_plugin_call_seconds', 'Latencia de las operaciones de los plugins MCP.')
+registry.describe('mcp_plugin_calls_total', 'Operaciones de los plugins MCP por resultado.')
+registry.describe('mcp_upstream_calls_total', 'Peticiones HTTP a las APIs de los proveedores.')
+registry.describe('mcp_plugin_init_errors_total', 'Errores al inicializar plugins en MCPManager.')
+registry.describe('mcp_manager_phase_seconds', 'Latencia de cada fase de MCPManager.execute_claude_request.')
+registry.describe('mcp_manager_phase_total', 'Ejecuciones de cada fase de MCPManager por resultado.')
+
+
+def instrument_plugin_operation(func: Callable, operation: str) -> Callable:
+    """
+    Envuelve una operación asíncrona de un plugin para medir su latencia y resultado.
+    El proveedor de las etiquetas es el slug del plugin que recibe la llamada, como en las métricas de la caché.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        if not registry.enabled:
+            return await func(self, *args, **kwargs)
+        method = (args[0] if args else kwargs.get('method_name', kwargs.get('method', ''))) if operation == 'execute_method' else ''
+        if method and self._method_table and method not in self._method_table:
+            # Evita una serie nueva por cada nombre de método inventado
+            method = 'unknown'
+        labels = (('provider', self.metrics_provider), ('operation', operation), ('method', method))
+        status = 'error'
+        start = time.perf_counter()
+        try:
+            result = await func(self, *args, **kwargs)
+            status = 'ok' if result is not False else 'failed'
+            return result
+        finally:
+            registry.observe('mcp_plugin_call_seconds', labels, time.perf_counter() - start)
+            registry.inc('mcp_plugin_calls_total', labels + (('status', status),))
+    wrapper._mcp_instrumented = True
+    return wrapper
+
+
+def count_upstream(provider: str, method: str, calls: int = 1) -> None:
+    """
+    Cuenta peticiones HTTP a la API del proveedor.
+    """
+    if registry.enabled:
+        registry.inc('mcp_upstream_calls_total', (('provider', provider), ('method', method)), calls)
+
+
+def count_init_error(provider: str) -> None:
+    if registry.enabled:
+        registry.inc('mcp_plugin_init_errors_total', (('provider', provider),))
+
+
+def phase(name: str):
+    """
+    Context manager que mide una fase de MCPManager. Sin instrumentación no hace nada.
+    """
+    if not registry.enabled:
+        return _DISABLED
+    return _timed_phase(name)
+
+
+@contextmanager
+def _timed_phase(name: str):
+    labels = (('phase', name),)
+    status = 'error'
+    start = time.perf_counter()
+    try:
+        yield
+        status = 'ok'
+    finally:
+        registry.observe('mcp_manager_phase_seconds', labels, time.perf_counter() - start)
+        registry.inc('mcp_manager_phase_total', labels + (('status', status),))
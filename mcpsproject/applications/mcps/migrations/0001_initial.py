@@ -0,0 +1,66 @@
+# Generated by Django 5.2.3 on 2026-10-19 09:38
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MCPCategory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('slug', models.SlugField(unique=True)),
+                ('icon', models.CharField(max_length=100)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('order', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MCPProvider',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('slug', models.SlugField(unique=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('icon_url', models.URLField(blank=True)),
+                ('documentation_url', models.URLField(blank=True)),
+                ('integration_type', models.CharField(choices=[('rest_api', 'REST API'), ('soap_api', 'SOAP API'), ('oauth2', 'OAuth 2.0'), ('api_key', 'API Key'), ('webhook', 'Webhook'), ('custom', 'Custom Integration')], max_length=50)),
+                ('plugin_class', models.CharField(max_length=200)),
+                ('required_scopes', models.JSONField(default=list)),
+                ('webhook_events', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mcps.mcpcategory')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='UserMCPConnection',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('expired', 'Expired'), ('error', 'Error'), ('disabled', 'Disabled')], default='active', max_length=20)),
+                ('encrypted_credentials', models.TextField()),
+                ('display_name', models.CharField(blank=True, max_length=200, null=True)),
+                ('config_data', models.JSONField(default=dict)),
+                ('last_sync', models.DateTimeField(null=True)),
+                ('sync_frequency', models.IntegerField(default=3600)),
+                ('connected_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(null=True)),
+                ('mcp_provider', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mcps.mcpprovider')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'mcp_provider', 'display_name')},
+            },
+        ),
+    ]
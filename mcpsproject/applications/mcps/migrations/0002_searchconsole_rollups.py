@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-19 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcps', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchConsoleDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_url', models.CharField(max_length=500)),
+                ('dimension', models.CharField(choices=[('page', 'Page'), ('query', 'Query')], max_length=10)),
+                ('date', models.DateField()),
+                ('key', models.CharField(max_length=2000)),
+                ('clicks', models.IntegerField(default=0)),
+                ('impressions', models.IntegerField(default=0)),
+                ('position_sum', models.FloatField(default=0)),
+            ],
+            options={
+                'unique_together': {('site_url', 'dimension', 'date', 'key')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchConsoleRollupDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('site_url', models.CharField(max_length=500)),
+                ('dimension', models.CharField(choices=[('page', 'Page'), ('query', 'Query')], max_length=10)),
+                ('date', models.DateField()),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'unique_together': {('site_url', 'dimension', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-19 09:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcps', '0002_searchconsole_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MCPWebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(max_length=100)),
+                ('idempotency_key', models.CharField(max_length=255, unique=True)),
+                ('payload', models.JSONField(default=dict)),
+                ('received_at', models.DateTimeField()),
+                ('applied_at', models.DateTimeField(auto_now_add=True)),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_events', to='mcps.usermcpconnection')),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-19 09:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcps', '0003_webhook_events'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usermcpconnection',
+            index=models.Index(fields=['user', 'status'], name='mcps_conn_user_status_idx'),
+        ),
+    ]
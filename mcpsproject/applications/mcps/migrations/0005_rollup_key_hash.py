@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:02
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_key_hash(apps, schema_editor):
+    SearchConsoleDailyRollup = apps.get_model('mcps', 'SearchConsoleDailyRollup')
+    rollups = []
+    for rollup in SearchConsoleDailyRollup.objects.only('id', 'key').iterator():
+        rollup.key_hash = hashlib.sha256(rollup.key.encode()).hexdigest()
+        rollups.append(rollup)
+        if len(rollups) >= 1000:
+            SearchConsoleDailyRollup.objects.bulk_update(rollups, ['key_hash'])
+            rollups = []
+    SearchConsoleDailyRollup.objects.bulk_update(rollups, ['key_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcps', '0004_connection_user_status_index'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='searchconsoledailyrollup',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='searchconsoledailyrollup',
+            name='key_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_key_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='searchconsoledailyrollup',
+            unique_together={('site_url', 'dimension', 'date', 'key_hash')},
+        ),
+    ]
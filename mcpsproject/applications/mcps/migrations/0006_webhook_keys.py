@@ -0,0 +1,34 @@
+# Generated by Django 5.2.3 on 2026-10-19 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copy_event_keys(apps, schema_editor):
+    MCPWebhookEvent = apps.get_model('mcps', 'MCPWebhookEvent')
+    MCPWebhookKey = apps.get_model('mcps', 'MCPWebhookKey')
+    keys = [
+        MCPWebhookKey(connection_id=connection_id, idempotency_key=idempotency_key, received_at=received_at)
+        for connection_id, idempotency_key, received_at in MCPWebhookEvent.objects.values_list('connection_id', 'idempotency_key', 'received_at').iterator()
+    ]
+    MCPWebhookKey.objects.bulk_create(keys, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mcps', '0005_rollup_key_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MCPWebhookKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=255, unique=True)),
+                ('received_at', models.DateTimeField()),
+                ('connection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='webhook_keys', to='mcps.usermcpconnection')),
+            ],
+        ),
+        migrations.RunPython(copy_event_keys, migrations.RunPython.noop),
+    ]
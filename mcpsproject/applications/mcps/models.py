@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth import get_user_model
 import uuid
 import json
+import hashlib
 from cryptography.fernet import Fernet
 from django.conf import settings
 
@@ -102,6 +103,10 @@ class UserMCPConnection(models.Model):
 
     class Meta:
         unique_together = ['user', 'mcp_provider','display_name']
+        indexes = [
+            # Consulta caliente de MCPManager: conexiones activas de un usuario
+            models.Index(fields=['user', 'status'], name='mcps_conn_user_status_idx'),
+        ]
 
     @property
     def credentials(self):
@@ -132,4 +137,69 @@ class UserMCPConnection(models.Model):
             credentials=self.credentials,
             config=self.config_data,
             user_id=self.user.id,
-        )
\ No newline at end of file
+            provider_slug=self.mcp_provider.slug,
+        )
+
+class SearchConsoleRollupDay(models.Model):
+    """Día ya materializado en los rollups de Search Console.
+    Permite distinguir un día sin datos de un día que todavía no se ha calculado.
+    """
+
+    DIMENSION_CHOICES = [
+        ('page', 'Page'),
+        ('query', 'Query'),
+    ]
+
+    site_url = models.CharField(max_length=500)
+    dimension = models.CharField(max_length=10, choices=DIMENSION_CHOICES)
+    date = models.DateField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ['site_url', 'dimension', 'date']
+
+class SearchConsoleDailyRollup(models.Model):
+    """Agregado parcial exacto de una página o query de un sitio en un día.
+    La posición se guarda ponderada por impresiones para poder sumar varios días.
+    La unicidad se comprueba sobre el hash de la clave: una URL o query larga con caracteres
+    multibyte no cabe junto a site_url en una entrada de índice btree de PostgreSQL.
+    """
+
+    site_url = models.CharField(max_length=500)
+    dimension = models.CharField(max_length=10, choices=SearchConsoleRollupDay.DIMENSION_CHOICES)
+    date = models.DateField()
+    key = models.CharField(max_length=2000)
+    key_hash = models.CharField(max_length=64) # sha256 de key
+
+    clicks = models.IntegerField(default=0)
+    impressions = models.IntegerField(default=0)
+    position_sum = models.FloatField(default=0) # posición media * impresiones
+
+    class Meta:
+        unique_together = ['site_url', 'dimension', 'date', 'key_hash']
+
+    @staticmethod
+    def hash_key(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+class MCPWebhookEvent(models.Model):
+    """Evento de webhook de un proveedor ya aplicado.
+    La clave de idempotencia es única para que reenviar el mismo evento no lo aplique dos veces.
+    """
+
+    connection = models.ForeignKey(UserMCPConnection, on_delete=models.CASCADE, related_name='webhook_events')
+    event_type = models.CharField(max_length=100)
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField()
+    applied_at = models.DateTimeField(auto_now_add=True)
+
+class MCPWebhookKey(models.Model):
+    """Clave de idempotencia de un evento de webhook aceptado.
+    Se guardan también las de los eventos fusionados con otro posterior, que no tienen fila propia
+    en MCPWebhookEvent, para que su reenvío no se aplique en ningún worker ni tras reiniciar.
+    """
+
+    connection = models.ForeignKey(UserMCPConnection, on_delete=models.CASCADE, related_name='webhook_keys')
+    idempotency_key = models.CharField(max_length=255, unique=True)
+    received_at = models.DateTimeField()
@@ -0,0 +1,347 @@
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Intervalo de sondeo adaptativo (segundos): vuelve al mínimo cuando los datos cambian
+# y crece hasta el máximo mientras no cambian o Google devuelve errores.
+MIN_POLL_INTERVAL = 5
+MAX_POLL_INTERVAL = 60
+POLL_BACKOFF_FACTOR = 1.5
+
+# Errores seguidos con las credenciales de un suscriptor antes de sondear con las de otro.
+MAX_OWNER_FAILURES = 3
+
+# Segundos que sobrevive el candado de una propiedad a la última renovación del worker que la sondea,
+# además del intervalo máximo de sondeo. Si ese worker muere, otro toma el relevo al caducar.
+LEADER_LOCK_MARGIN = 30
+
+# Mensajes pendientes por suscriptor antes de considerarlo lento y reenviarle el snapshot completo.
+SUBSCRIBER_QUEUE_SIZE = 16
+
+logger = logging.getLogger("mcp.realtime")
+
+Fetch = Callable[[], Awaitable[Dict]]
+Check = Callable[[], Awaitable[None]]
+
+
+class SubscriptionRevoked(Exception):
+    """El suscriptor ya no puede leer la propiedad: su conexión se desactivó o perdió el acceso."""
+
+
+def row_key(row: Dict) -> Optional[Tuple]:
+    """
+    Devuelve las claves de dimensión de una fila de GA4 (dimensionValues) o de Search Console (keys).
+    """
+    if 'dimensionValues' in row:
+        return tuple(value.get('value') for value in row['dimensionValues'])
+    if 'keys' in row:
+        return tuple(row['keys'])
+    return None
+
+
+def _index_rows(rows: Any) -> Optional[Dict[Tuple, Dict]]:
+    if not isinstance(rows, list):
+        return None
+    index = {}
+    for row in rows:
+        key = row_key(row) if isinstance(row, dict) else None
+        if key is None or key in index:
+            return None
+        index[key] = row
+    return index
+
+
+def compute_delta(previous: Optional[Dict], current: Dict) -> Optional[Dict]:
+    """
+    Calcula las diferencias entre dos snapshots. Las filas se comparan por sus claves de dimensión,
+    así que un cambio en una fila solo envía esa fila y no el informe entero.
+
+    Args:
+        previous (Optional[Dict]): Snapshot anterior.
+        current (Dict): Snapshot nuevo.
+
+    Returns:
+        Optional[Dict]: {'changed': {...}, 'removed': [...], 'rows': {'upserted': [...], 'removed': [[...]]}}
+            o None si no hay cambios. 'rows' solo aparece si las filas de ambos snapshots tienen claves.
+    """
+    previous = previous or {}
+    delta = {}
+    previous_rows, current_rows = _index_rows(previous.get('rows')), _index_rows(current.get('rows'))
+    if previous_rows is not None and current_rows is not None:
+        upserted = [row for key, row in current_rows.items() if previous_rows.get(key) != row]
+        removed_rows = [list(key) for key in previous_rows if key not in current_rows]
+        if upserted or removed_rows:
+            delta['rows'] = {'upserted': upserted, 'removed': removed_rows}
+        skip = {'rows'}
+    else:
+        skip = set()
+
+    changed = {key: value for key, value in current.items() if key not in skip and previous.get(key, object()) != value}
+    removed = [key for key in previous if key not in current]
+    if not changed and not removed and not delta:
+        return None
+    return {'changed': changed, 'removed': removed, **delta}
+
+
+class PropertyPoller:
+    """
+    Sondea Google para una propiedad y reparte los cambios entre todos sus suscriptores.
+
+    Cada suscriptor aporta su propia función de sondeo, con sus credenciales. El poller usa la de
+    uno de ellos y pasa a la de otro suscriptor que siga conectado si ese suscriptor se va, si su
+    función lanza SubscriptionRevoked o si falla MAX_OWNER_FAILURES veces seguidas.
+
+    Entre workers, solo el poller que tiene el candado de la propiedad en la caché compartida
+    consulta a Google y deja allí el snapshot; los de los demás workers lo leen de la caché y
+    comprueban con `check` que la suscripción que los mantiene sigue siendo válida.
+    """
+
+    def __init__(self, key: Hashable, cache, min_interval: float = MIN_POLL_INTERVAL, max_interval: float = MAX_POLL_INTERVAL):
+        self.key = key
+        self.cache = cache
+        self.subscribers: Dict[asyncio.Queue, Tuple[Fetch, Optional[Check]]] = {}
+        self.owner: Optional[asyncio.Queue] = None
+        self.snapshot: Optional[Dict] = None
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.failures = 0
+        self.task: Optional[asyncio.Task] = None
+        digest = hashlib.md5(repr(key).encode()).hexdigest()
+        self.lock_key = f"mcp:realtime:lock:{digest}"
+        self.snapshot_key = f"mcp:realtime:snapshot:{digest}"
+        self.lock_ttl = int(max_interval) + LEADER_LOCK_MARGIN
+        self.token = uuid.uuid4().hex
+
+    def add(self, queue: asyncio.Queue, fetch: Fetch, check: Optional[Check] = None) -> None:
+        self.subscribers[queue] = (fetch, check)
+        if self.owner is None:
+            self.owner = queue
+
+    def remove(self, queue: asyncio.Queue) -> None:
+        self.subscribers.pop(queue, None)
+        if self.owner is queue:
+            # Se sigue sondeando con las credenciales de otro suscriptor
+            self.owner = next(iter(self.subscribers), None)
+            self.failures = 0
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def _run(self) -> None:
+        try:
+            while self.owner is not None:
+                owner = self.owner
+                try:
+                    data = await self._poll(owner)
+                except SubscriptionRevoked as e:
+                    logger.info(f"Suscriptor de {self.key} revocado, se sondea con otro: {e}")
+                    self._close(owner)
+                    continue
+                except Exception as e:
+                    logger.error(f"Error al obtener datos en tiempo real de {self.key}: {e}")
+                    self.interval = min(self.interval * POLL_BACKOFF_FACTOR, self.max_interval)
+                    self.failures += 1
+                    if self.failures >= MAX_OWNER_FAILURES:
+                        self._rebind(owner)
+                else:
+                    self.failures = 0
+                    if data is not None:
+                        self._update(data)
+                await asyncio.sleep(self.interval)
+        finally:
+            await self._release()
+
+    async def _poll(self, owner: asyncio.Queue) -> Optional[Dict]:
+        """
+        Obtiene el snapshot actual: de Google si este worker es el que sondea la propiedad o,
+        si no, el que ha dejado en la caché el worker que la sondea.
+        """
+        fetch, check = self.subscribers[owner]
+        if await self._lead():
+            data = await fetch()
+            await self.cache.aset(self.snapshot_key, data, self.lock_ttl)
+            return data
+        if check is not None:
+            await check()
+        return await self.cache.aget(self.snapshot_key)
+
+    async def _lead(self) -> bool:
+        """
+        Adquiere o renueva el candado de la propiedad en la caché compartida.
+        """
+        holder = await self.cache.aget(self.lock_key)
+        if holder == self.token:
+            await self.cache.atouch(self.lock_key, self.lock_ttl)
+            return True
+        return holder is None and await self.cache.aadd(self.lock_key, self.token, self.lock_ttl)
+
+    async def _release(self) -> None:
+        try:
+            if await self.cache.aget(self.lock_key) == self.token:
+                await self.cache.adelete(self.lock_key)
+        except Exception as e:
+            logger.error(f"Error al liberar el candado de tiempo real de {self.key}: {e}")
+
+    def _update(self, data: Dict) -> None:
+        if self.snapshot is None:
+            self.snapshot = data
+            self._publish({'type': 'snapshot', 'data': data})
+            self.interval = self.min_interval
+            return
+        delta = compute_delta(self.snapshot, data)
+        self.snapshot = data
+        if delta is not None:
+            self._publish({'type': 'delta', **delta})
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * POLL_BACKOFF_FACTOR, self.max_interval)
+
+    def _rebind(self, failing: asyncio.Queue) -> None:
+        """
+        Pasa a sondear con las credenciales de otro suscriptor cuando las del actual fallan una y
+        otra vez (token revocado que no se puede refrescar, errores 5xx persistentes...). El
+        suscriptor que falla queda el último por si vuelve a tocarle.
+        """
+        self.failures = 0
+        if failing not in self.subscribers or len(self.subscribers) < 2:
+            return
+        self.subscribers[failing] = self.subscribers.pop(failing)
+        self.owner = next(iter(self.subscribers))
+        logger.warning(f"Las credenciales del suscriptor de {self.key} fallan {MAX_OWNER_FAILURES} veces seguidas, se sondea con otro")
+
+    def _close(self, queue: asyncio.Queue) -> None:
+        """
+        Expulsa a un suscriptor revocado: deja de recibir datos y su canal se cierra.
+        """
+        self.remove(queue)
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait({'type': 'closed'})
+
+    def _publish(self, message: Dict) -> None:
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # El suscriptor no consume a tiempo: se descartan sus deltas pendientes
+                # y se le envía el snapshot completo para que se resincronice.
+                self._reset_queue(queue)
+
+    def _reset_queue(self, queue: asyncio.Queue) -> None:
+        while not queue.empty():
+            queue.get_nowait()
+        if self.snapshot is not None:
+            queue.put_nowait({'type': 'snapshot', 'data': self.snapshot})
+
+
+class RealTimeHub:
+    """
+    Hub de datos en tiempo real compartido por todos los usuarios del proceso.
+    Mantiene un único poller por propiedad mientras tenga suscriptores y, con una caché
+    compartida (Redis), una única consulta a Google por propiedad entre todos los workers.
+    """
+
+    def __init__(self, min_interval: float = MIN_POLL_INTERVAL, max_interval: float = MAX_POLL_INTERVAL, cache_alias: Optional[str] = None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.cache_alias = cache_alias or getattr(settings, 'MCP_CACHE_ALIAS', 'default')
+        self._pollers: Dict[Hashable, PropertyPoller] = {}
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def subscribe(self, key: Hashable, fetch: Fetch, check: Optional[Check] = None) -> asyncio.Queue:
+        """
+        Suscribe un nuevo consumidor a la propiedad, arrancando el poller si es el primero.
+
+        Args:
+            key (Hashable): Identificador de la propiedad, p. ej. (provider_slug, property_id).
+            fetch (Callable): Corrutina que obtiene un snapshot de la propiedad con las credenciales del consumidor.
+                Debe lanzar SubscriptionRevoked si el consumidor ya no tiene acceso.
+            check (Optional[Callable]): Corrutina que lanza SubscriptionRevoked si el consumidor ya no tiene
+                acceso. Se usa mientras el snapshot llega de otro worker y no se llama a `fetch`.
+
+        Returns:
+            asyncio.Queue: Cola en la que se recibirán los snapshots y deltas. Un mensaje 'closed' indica
+                que la suscripción se ha revocado.
+        """
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        poller = self._pollers.get(key)
+        if poller is None or poller.owner is None:
+            poller = self._pollers[key] = PropertyPoller(key, self.cache, self.min_interval, self.max_interval)
+            poller.add(queue, fetch, check)
+            poller.start()
+        else:
+            poller.add(queue, fetch, check)
+            if poller.snapshot is not None:
+                queue.put_nowait({'type': 'snapshot', 'data': poller.snapshot})
+        return queue
+
+    def unsubscribe(self, key: Hashable, queue: asyncio.Queue) -> None:
+        """
+        Elimina un consumidor y detiene el poller si era el último.
+        """
+        poller = self._pollers.get(key)
+        if poller is None:
+            return
+        poller.remove(queue)
+        if not poller.subscribers:
+            poller.stop()
+            del self._pollers[key]
+
+    async def stream(self, key: Hashable, fetch: Fetch, check: Optional[Check] = None, heartbeat: Optional[float] = None) -> AsyncIterator[Dict]:
+        """
+        Itera los mensajes de la propiedad hasta que el consumidor deja de leer o se revoca su suscripción.
+
+        Args:
+            key (Hashable): Identificador de la propiedad.
+            fetch (Callable): Corrutina que obtiene un snapshot con las credenciales del consumidor.
+            check (Optional[Callable]): Comprobación de acceso del consumidor, ver `subscribe`.
+            heartbeat (Optional[float]): Segundos sin mensajes tras los que se emite {'type': 'heartbeat'}.
+        """
+        queue = self.subscribe(key, fetch, check)
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    yield {'type': 'heartbeat'}
+                    continue
+                yield message
+                if message['type'] == 'closed':
+                    return
+        finally:
+            self.unsubscribe(key, queue)
+
+    def stats(self) -> Dict[str, Any]:
+        # El hilo de métricas llama a stats() mientras el bucle de eventos crea y borra pollers:
+        # list() copia los valores de una vez, sin soltar el GIL, en lugar de iterar el diccionario vivo
+        pollers = list(self._pollers.values())
+        return {
+            'pollers': len(pollers),
+            'subscribers': sum(len(poller.subscribers) for poller in pollers),
+        }
+
+
+hub = RealTimeHub()
+
+
+def collect_metrics():
+    """
+    Métricas del hub de tiempo real para el endpoint de métricas.
+    """
+    stats = hub.stats()
+    yield 'mcp_realtime_pollers', 'gauge', {}, stats['pollers']
+    yield 'mcp_realtime_subscribers', 'gauge', {}, stats['subscribers']
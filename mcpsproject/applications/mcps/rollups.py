@@ -0,0 +1,243 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .cache import ACCESS_GRANT_TTL, PluginResultCache, result_cache
+from .models import SearchConsoleDailyRollup, SearchConsoleRollupDay
+
+# Se guardan todas las filas que devuelve Google por sitio, día y dimensión, sin recortar: un rango se
+# responde sumando los agregados diarios, así que el top-N es exacto respecto a lo que Google devuelve
+# por día. Recortar cada día perdería las claves que quedan justo por debajo del corte todos los días.
+
+# GSC sigue ajustando los datos de los últimos días: se recalculan si el rollup es más viejo que REFRESH_INTERVAL.
+FRESHNESS_DAYS = 3
+REFRESH_INTERVAL = timedelta(hours=1)
+
+# Máximo de filas por página que acepta searchanalytics().query
+GSC_MAX_ROW_LIMIT = 25000
+
+logger = logging.getLogger("mcp.rollups")
+
+
+class SearchConsoleRollups:
+    """
+    Rollups diarios de páginas y queries de Search Console.
+    Responde top-N para cualquier rango de fechas sumando los agregados diarios ya
+    materializados y solo consulta a Google por los días que faltan o no son definitivos.
+
+    Los rollups son por sitio y no por usuario, así que antes de servirlos se comprueba que el
+    usuario del plugin tiene acceso al sitio.
+    """
+
+    def __init__(self, plugin):
+        self.plugin = plugin
+
+    async def top(self, site_url: str, dimension: str, start_date: str, end_date: str, limit: Optional[int] = 10) -> Dict:
+        """
+        Obtiene el top-N de páginas o queries de un rango de fechas.
+
+        Args:
+            site_url (str): URL del sitio web.
+            dimension (str): 'page' o 'query'.
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+            limit (Optional[int]): Número de filas a retornar. Por defecto es 10.
+
+        Returns:
+            Dict: Filas con el mismo formato que searchanalytics().query.
+
+        Raises:
+            PermissionError: Si el usuario no tiene acceso al sitio.
+        """
+        start, end = self._parse_range(start_date, end_date)
+        if dimension not in dict(SearchConsoleRollupDay.DIMENSION_CHOICES):
+            raise ValueError(f"Dimensión {dimension} no soportada en los rollups.")
+        await self.check_access(site_url)
+
+        missing = await sync_to_async(self._missing_days)(site_url, dimension, start, end)
+        # Cada tramo de días consecutivos se pide por separado para no volver a descargar los ya definitivos
+        for first_day, last_day in self._runs(missing):
+            await self.refresh(site_url, dimension, first_day, last_day)
+
+        rows = await sync_to_async(self._merge)(site_url, dimension, start, end, limit or 10)
+        return {'rows': rows, 'responseAggregationType': 'rollup'}
+
+    async def check_access(self, site_url: str) -> None:
+        """
+        Comprueba que el usuario puede leer el sitio: lo declara la configuración de su conexión,
+        ya lo verificó antes o Google se lo confirma ahora con sus propias credenciales.
+
+        Raises:
+            PermissionError: Si el usuario no tiene acceso al sitio.
+        """
+        if site_url in PluginResultCache.resources_in_config(self.plugin.config):
+            return
+        access_key = self._access_key(site_url)
+        if await result_cache.cache.aget(access_key):
+            return
+        if not await self.plugin.verify_site_access(site_url):
+            raise PermissionError(f"Sin acceso a los datos de {site_url}.")
+        await result_cache.cache.aset(access_key, True, ACCESS_GRANT_TTL)
+
+    async def refresh(self, site_url: str, dimension: str, start: date, end: date) -> None:
+        """
+        Materializa los rollups de un rango de días con una consulta (paginada) a Google.
+
+        Args:
+            site_url (str): URL del sitio web.
+            dimension (str): 'page' o 'query'.
+            start (date): Primer día a materializar.
+            end (date): Último día a materializar.
+        """
+        per_day: Dict[date, List[Dict]] = {}
+        start_row = 0
+        while True:
+            response = await self.plugin.get_search_analytics(
+                site_url,
+                start.isoformat(),
+                end.isoformat(),
+                ['date', dimension],
+                row_limit=GSC_MAX_ROW_LIMIT,
+                start_row=start_row,
+            )
+            rows = response.get('rows', [])
+            for row in rows:
+                day = date.fromisoformat(row['keys'][0])
+                per_day.setdefault(day, []).append(row)
+            if len(rows) < GSC_MAX_ROW_LIMIT:
+                break
+            start_row += len(rows)
+
+        await sync_to_async(self._store)(site_url, dimension, start, end, per_day)
+        logger.info(f"Rollups de {dimension} de {site_url} materializados del {start} al {end}")
+
+    def _missing_days(self, site_url: str, dimension: str, start: date, end: date) -> List[date]:
+        """
+        Devuelve los días del rango sin rollup o con un rollup todavía no definitivo.
+        """
+        now = timezone.now()
+        not_final_after = now.date() - timedelta(days=FRESHNESS_DAYS)
+        computed = dict(
+            SearchConsoleRollupDay.objects.filter(
+                site_url=site_url,
+                dimension=dimension,
+                date__range=(start, end),
+            ).values_list('date', 'computed_at')
+        )
+
+        missing = []
+        day = start
+        while day <= end:
+            computed_at = computed.get(day)
+            if computed_at is None:
+                missing.append(day)
+            elif day >= not_final_after and now - computed_at > REFRESH_INTERVAL:
+                missing.append(day)
+            day += timedelta(days=1)
+        return missing
+
+    @staticmethod
+    def _runs(days: List[date]) -> List[Tuple[date, date]]:
+        """
+        Agrupa una lista ordenada de días en tramos (primer día, último día) de días consecutivos.
+        """
+        runs = []
+        for day in days:
+            if runs and day - runs[-1][1] == timedelta(days=1):
+                runs[-1] = (runs[-1][0], day)
+            else:
+                runs.append((day, day))
+        return runs
+
+    def _store(self, site_url: str, dimension: str, start: date, end: date, per_day: Dict[date, List[Dict]]) -> None:
+        """
+        Sustituye los rollups del rango por los nuevos agregados y marca los días como calculados.
+        Dos workers pueden materializar a la vez el mismo rango en frío: las filas se insertan con
+        upsert para que el segundo actualice las del primero en lugar de fallar por la clave única.
+        """
+        now = timezone.now()
+        rollups = []
+        for day, rows in per_day.items():
+            for row in rows:
+                impressions = int(row.get('impressions', 0))
+                rollups.append(SearchConsoleDailyRollup(
+                    site_url=site_url,
+                    dimension=dimension,
+                    date=day,
+                    key=row['keys'][1],
+                    key_hash=SearchConsoleDailyRollup.hash_key(row['keys'][1]),
+                    clicks=int(row.get('clicks', 0)),
+                    impressions=impressions,
+                    position_sum=row.get('position', 0) * impressions,
+                ))
+
+        days = []
+        day = start
+        while day <= end:
+            days.append(SearchConsoleRollupDay(site_url=site_url, dimension=dimension, date=day, computed_at=now))
+            day += timedelta(days=1)
+
+        with transaction.atomic():
+            SearchConsoleDailyRollup.objects.filter(
+                site_url=site_url,
+                dimension=dimension,
+                date__range=(start, end),
+            ).delete()
+            SearchConsoleDailyRollup.objects.bulk_create(
+                rollups,
+                batch_size=1000,
+                update_conflicts=True,
+                unique_fields=['site_url', 'dimension', 'date', 'key_hash'],
+                update_fields=['key', 'clicks', 'impressions', 'position_sum'],
+            )
+            SearchConsoleRollupDay.objects.bulk_create(
+                days,
+                update_conflicts=True,
+                unique_fields=['site_url', 'dimension', 'date'],
+                update_fields=['computed_at'],
+            )
+
+    def _merge(self, site_url: str, dimension: str, start: date, end: date, limit: int) -> List[Dict]:
+        """
+        Suma los rollups diarios del rango y devuelve las filas ordenadas por clicks.
+        """
+        aggregates = (
+            SearchConsoleDailyRollup.objects
+            .filter(site_url=site_url, dimension=dimension, date__range=(start, end))
+            .values('key')
+            .annotate(
+                total_clicks=Sum('clicks'),
+                total_impressions=Sum('impressions'),
+                total_position=Sum('position_sum'),
+            )
+            .order_by('-total_clicks', '-total_impressions', 'key')[:limit]
+        )
+
+        rows = []
+        for aggregate in aggregates:
+            impressions = aggregate['total_impressions']
+            rows.append({
+                'keys': [aggregate['key']],
+                'clicks': aggregate['total_clicks'],
+                'impressions': impressions,
+                'ctr': aggregate['total_clicks'] / impressions if impressions else 0.0,
+                'position': aggregate['total_position'] / impressions if impressions else 0.0,
+            })
+        return rows
+
+    def _access_key(self, site_url: str) -> str:
+        return f"mcp:rollups:access:{self.plugin.user_id}:{hashlib.md5(site_url.encode()).hexdigest()}"
+
+    @staticmethod
+    def _parse_range(start_date: str, end_date: str):
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+        if start > end:
+            raise ValueError("start_date no puede ser posterior a end_date.")
+        return start, end
@@ -0,0 +1,296 @@
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+import json
+import struct
+import sys
+import zlib
+
+# Cabecera: MAGIC + versión + flags. La versión 2 añade a cada bloque de filas una columna con el
+# tipo original de ctr y position; los payloads de la versión 1 se siguen pudiendo leer.
+MAGIC = b'MCPB'
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+HEADER = struct.Struct('<4sBB')
+
+FLAG_COMPRESSED = 0x01
+FLAG_ROW_TABLE = 0x02
+
+# Tamaño del cuerpo a partir del cual se comprime con zlib, y nivel de compresión.
+COMPRESSION_THRESHOLD = 4096
+COMPRESSION_LEVEL = 3
+
+# Filas por bloque de la tabla de filas. Cada bloque se decodifica por separado,
+# así que iter_rows nunca tiene en memoria más de un bloque descomprimido.
+ROW_CHUNK_SIZE = 4096
+
+# Formato de las filas de searchanalytics().query, que se guardan en columnas
+ROW_FIELDS = frozenset(('keys', 'clicks', 'impressions', 'ctr', 'position'))
+
+# Tipo original de ctr y position por fila: Google devuelve enteros como 0 o 1 en el JSON
+ROW_INT_CTR = 0x01
+ROW_INT_POSITION = 0x02
+
+# Rangos que las columnas guardan sin pérdida: enteros de 64 bits y enteros exactos en un double
+_INT64_RANGE = range(-2 ** 63, 2 ** 63)
+_EXACT_FLOAT_INT_RANGE = range(-2 ** 53, 2 ** 53 + 1)
+
+# Tipos que JSON devuelve tal cual
+_JSON_SCALARS = (str, int, float, bool, type(None))
+
+_UINT32 = struct.Struct('<I')
+_CHUNK_HEADER = struct.Struct('<IBI')  # filas, dimensiones, bytes de la tabla de strings
+_LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+class SerializationError(ValueError):
+    """El blob no es un payload serializado válido o su versión no está soportada."""
+
+
+def dumps(payload: Any, compress_threshold: Optional[int] = COMPRESSION_THRESHOLD) -> bytes:
+    """
+    Serializa el resultado de un plugin en formato binario compacto.
+
+    Las filas de Search Console ('rows' en el primer nivel) se guardan en columnas tipadas con
+    una tabla de strings por bloque; el resto del payload se guarda como JSON compacto.
+    loads(dumps(payload)) siempre es igual al payload original.
+
+    Args:
+        payload (Any): Resultado del plugin, normalmente un Dict.
+        compress_threshold (Optional[int]): Bytes a partir de los que se comprime el cuerpo. None desactiva la compresión.
+
+    Returns:
+        bytes: El payload serializado, con cabecera versionada.
+
+    Raises:
+        SerializationError: Si el payload cambiaría al deserializarlo, p. ej. por claves no string o tuplas.
+    """
+    flags = 0
+    rows = payload.get('rows') if isinstance(payload, dict) else None
+    dimensions = _row_table_dimensions(rows)
+    if dimensions is not None:
+        flags |= FLAG_ROW_TABLE
+        payload = {key: value for key, value in payload.items() if key != 'rows'}
+
+    _check_lossless(payload)
+    envelope = json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode()
+    parts = [_UINT32.pack(len(envelope)), envelope]
+    if flags & FLAG_ROW_TABLE:
+        for start in range(0, len(rows), ROW_CHUNK_SIZE):
+            parts.append(_encode_chunk(rows[start:start + ROW_CHUNK_SIZE], dimensions))
+        parts.append(_CHUNK_HEADER.pack(0, 0, 0))
+    body = b''.join(parts)
+
+    if compress_threshold is not None and len(body) > compress_threshold:
+        flags |= FLAG_COMPRESSED
+        body = zlib.compress(body, COMPRESSION_LEVEL)
+    return HEADER.pack(MAGIC, VERSION, flags) + body
+
+
+def loads(blob: bytes) -> Any:
+    """
+    Deserializa un payload generado por dumps.
+
+    Args:
+        blob (bytes): El payload serializado.
+
+    Returns:
+        Any: El resultado original del plugin.
+    """
+    version, flags, reader = _open(blob)
+    payload = _read_envelope(reader)
+    if flags & FLAG_ROW_TABLE:
+        rows = []
+        for chunk in _iter_chunks(reader, version):
+            rows.extend(chunk)
+        payload['rows'] = rows
+    return payload
+
+
+def iter_rows(blob: bytes) -> Iterator[Dict]:
+    """
+    Itera las filas ('rows') de un payload sin decodificarlo entero.
+
+    Args:
+        blob (bytes): El payload serializado.
+
+    Yields:
+        Dict: Cada fila, con el mismo formato que en el payload original.
+    """
+    version, flags, reader = _open(blob)
+    payload = _read_envelope(reader)
+    if flags & FLAG_ROW_TABLE:
+        for chunk in _iter_chunks(reader, version):
+            yield from chunk
+    elif isinstance(payload, dict):
+        yield from payload.get('rows', [])
+
+
+def is_serialized(value: Any) -> bool:
+    return isinstance(value, (bytes, bytearray)) and value[:len(MAGIC)] == MAGIC
+
+
+def _row_table_dimensions(rows: Any) -> Optional[int]:
+    """
+    Devuelve el número de dimensiones si las filas se pueden guardar en columnas, o None si no.
+    """
+    if not isinstance(rows, list) or not rows:
+        return None
+    first_keys = rows[0].get('keys') if isinstance(rows[0], dict) else None
+    if not isinstance(first_keys, list) or len(first_keys) > 255:
+        return None
+    dimensions = len(first_keys)
+    for row in rows:
+        if not isinstance(row, dict) or row.keys() != ROW_FIELDS:
+            return None
+        keys = row['keys']
+        if not isinstance(keys, list) or len(keys) != dimensions:
+            return None
+        for key in keys:
+            if not isinstance(key, str) or '\x00' in key:
+                return None
+        for name in ('clicks', 'impressions'):
+            if type(row[name]) is not int or row[name] not in _INT64_RANGE:
+                return None
+        for name in ('ctr', 'position'):
+            value = row[name]
+            if type(value) is not float and (type(value) is not int or value not in _EXACT_FLOAT_INT_RANGE):
+                return None
+    return dimensions
+
+
+def _check_lossless(value: Any) -> None:
+    """
+    Comprueba que el valor vuelve igual de un JSON: solo dicts con claves string, listas y escalares JSON.
+    """
+    kind = type(value)
+    if kind is dict:
+        for key, item in value.items():
+            if type(key) is not str:
+                raise SerializationError(f"Clave {key!r} no string: JSON la convertiría en texto.")
+            _check_lossless(item)
+    elif kind is list:
+        for item in value:
+            _check_lossless(item)
+    elif kind not in _JSON_SCALARS:
+        raise SerializationError(f"Valor de tipo {kind.__name__} que JSON no devolvería igual.")
+
+
+def _encode_chunk(rows: List[Dict], dimensions: int) -> bytes:
+    strings: Dict[str, int] = {}
+    indexes = array('I')
+    for row in rows:
+        for key in row['keys']:
+            index = strings.get(key)
+            if index is None:
+                index = strings[key] = len(strings)
+            indexes.append(index)
+    string_table = '\x00'.join(strings).encode()
+
+    columns = [
+        indexes,
+        array('q', [row['clicks'] for row in rows]),
+        array('q', [row['impressions'] for row in rows]),
+        array('d', [row['ctr'] for row in rows]),
+        array('d', [row['position'] for row in rows]),
+        array('B', [
+            (ROW_INT_CTR if type(row['ctr']) is int else 0) | (ROW_INT_POSITION if type(row['position']) is int else 0)
+            for row in rows
+        ]),
+    ]
+    if not _LITTLE_ENDIAN:
+        for column in columns:
+            column.byteswap()
+    return b''.join([
+        _CHUNK_HEADER.pack(len(rows), dimensions, len(string_table)),
+        string_table,
+        *(column.tobytes() for column in columns),
+    ])
+
+
+def _iter_chunks(reader: '_BodyReader', version: int = VERSION) -> Iterator[List[Dict]]:
+    while True:
+        row_count, dimensions, table_size = _CHUNK_HEADER.unpack(reader.read(_CHUNK_HEADER.size))
+        if row_count == 0:
+            return
+        table = reader.read(table_size).decode()
+        strings = table.split('\x00') if table_size else ['']
+        indexes = _read_column(reader, 'I', row_count * dimensions)
+        clicks = _read_column(reader, 'q', row_count)
+        impressions = _read_column(reader, 'q', row_count)
+        ctr = _read_column(reader, 'd', row_count)
+        position = _read_column(reader, 'd', row_count)
+        row_flags = _read_column(reader, 'B', row_count) if version >= 2 else None
+        if row_flags is not None and any(row_flags):
+            ctr = [int(value) if flag & ROW_INT_CTR else value for value, flag in zip(ctr, row_flags)]
+            position = [int(value) if flag & ROW_INT_POSITION else value for value, flag in zip(position, row_flags)]
+
+        keys = [strings[index] for index in indexes]
+        yield [
+            {
+                'keys': keys[i * dimensions:(i + 1) * dimensions],
+                'clicks': clicks[i],
+                'impressions': impressions[i],
+                'ctr': ctr[i],
+                'position': position[i],
+            }
+            for i in range(row_count)
+        ]
+
+
+def _read_column(reader: '_BodyReader', typecode: str, length: int) -> array:
+    column = array(typecode)
+    column.frombytes(reader.read(column.itemsize * length))
+    if not _LITTLE_ENDIAN:
+        column.byteswap()
+    return column
+
+
+def _open(blob: bytes):
+    if len(blob) < HEADER.size:
+        raise SerializationError("Payload demasiado corto.")
+    magic, version, flags = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise SerializationError("El payload no tiene la cabecera esperada.")
+    if version not in SUPPORTED_VERSIONS:
+        raise SerializationError(f"Versión de serialización {version} no soportada.")
+    return version, flags, _BodyReader(blob, HEADER.size, bool(flags & FLAG_COMPRESSED))
+
+
+def _read_envelope(reader: '_BodyReader') -> Any:
+    (size,) = _UINT32.unpack(reader.read(_UINT32.size))
+    return json.loads(reader.read(size))
+
+
+class _BodyReader:
+    """
+    Lector secuencial del cuerpo que descomprime bajo demanda.
+    """
+
+    INPUT_CHUNK = 64 * 1024
+
+    def __init__(self, blob: bytes, offset: int, compressed: bool):
+        self.view = memoryview(blob)
+        self.offset = offset
+        self.decompressor = zlib.decompressobj() if compressed else None
+        self.buffer = bytearray()
+
+    def read(self, size: int) -> bytes:
+        if self.decompressor is None:
+            end = self.offset + size
+            if end > len(self.view):
+                raise SerializationError("Payload truncado.")
+            data = self.view[self.offset:end].tobytes()
+            self.offset = end
+            return data
+
+        while len(self.buffer) < size:
+            pending = self.decompressor.unconsumed_tail
+            if not pending:
+                pending = self.view[self.offset:self.offset + self.INPUT_CHUNK]
+                self.offset += len(pending)
+            if not pending:
+                raise SerializationError("Payload truncado.")
+            self.buffer += self.decompressor.decompress(pending, max(size - len(self.buffer), self.INPUT_CHUNK))
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
@@ -1,3 +1,1000 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import hmac
+import json
+import tempfile
+import threading
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import DataError, OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from applications.mcps import cache, checks, metrics, serialization
+from applications.mcps.base import BaseApplication, ISODate, InvalidParamsError, _compile_coercer, mcp_method
+from applications.mcps.benchmarks import fake_google, suite
+from applications.mcps.benchmarks.serialization import search_console_payload
+from applications.mcps.cache import SINGLE_FLIGHT_LOCK_TTL, result_cache
+from applications.mcps.lifespan import LifespanMiddleware
+from applications.mcps.models import MCPCategory, MCPProvider, MCPWebhookEvent, MCPWebhookKey, SearchConsoleDailyRollup, SearchConsoleRollupDay, UserMCPConnection
+from applications.mcps.realtime import MAX_OWNER_FAILURES, RealTimeHub, SubscriptionRevoked, compute_delta, hub
+from applications.mcps.rollups import SearchConsoleRollups
+from applications.mcps.webhooks import MAX_EVENT_ATTEMPTS, WebhookEvent, WebhookIngestor, idempotency_key_for
+
+
+class FakeGoogleAPITests(SimpleTestCase):
+
+    def test_search_analytics_paginates_like_the_api(self):
+        api = fake_google.FakeGoogleAPI(latency=0, total_rows=30)
+        service = api.service()
+        first = service.searchanalytics().query(siteUrl='https://a/', body={'rowLimit': 20}).execute()
+        second = service.searchanalytics().query(siteUrl='https://a/', body={'rowLimit': 20, 'startRow': 20}).execute()
+        self.assertEqual(len(first['rows']), 20)
+        self.assertEqual(len(second['rows']), 10)
+        self.assertEqual(api.calls['searchanalytics.query'], 2)
+
+    def test_errors_and_quota(self):
+        failing = fake_google.FakeGoogleAPI(latency=0, error_rate=1.0).service()
+        with self.assertRaises(HttpError):
+            failing.sites().list().execute()
+
+        limited = fake_google.FakeGoogleAPI(latency=0, quota_per_minute=1)
+        limited.service().sites().list().execute()
+        with self.assertRaises(HttpError) as raised:
+            limited.service().sites().list().execute()
+        self.assertEqual(raised.exception.resp.status, 429)
+
+    def test_ga4_reports_are_served_over_http(self):
+        api = fake_google.FakeGoogleAPI(latency=0, total_rows=20, site_access={'token': {'123'}})
+        report = api.ga4_service('token').properties().runReport(property='properties/123', body={'limit': 5}).execute()
+        self.assertEqual(len(report['rows']), 5)
+        self.assertEqual(api.calls['properties.runReport'], 1)
+        with self.assertRaises(HttpError) as raised:
+            api.ga4_service('other').properties().runRealtimeReport(property='properties/123', body={}).execute()
+        self.assertEqual(raised.exception.resp.status, 403)
+
+
+class MethodRegistryTests(SimpleTestCase):
+
+    def test_coercers(self):
+        as_int = _compile_coercer(int, 'n')
+        self.assertEqual(as_int('5'), 5)
+        self.assertEqual(as_int(5.0), 5)
+        for value in (5.5, True, 'cinco'):
+            with self.assertRaises(InvalidParamsError):
+                as_int(value)
+
+        as_bool = _compile_coercer(bool, 'flag')
+        self.assertIs(as_bool('True'), True)
+        self.assertIs(as_bool(False), False)
+        with self.assertRaises(InvalidParamsError):
+            as_bool(1)
+
+        as_list = _compile_coercer(List[int], 'ids')
+        self.assertEqual(as_list(['1', 2]), [1, 2])
+        self.assertEqual(_compile_coercer(List[str], 'names')('a'), ['a'])
+        with self.assertRaises(InvalidParamsError):
+            as_list({'a': 1})
+
+        optional = _compile_coercer(Optional[int], 'limit')
+        self.assertIsNone(optional(None))
+        self.assertEqual(optional('3'), 3)
+
+        as_date = _compile_coercer(ISODate, 'date')
+        self.assertEqual(as_date('2025-02-28'), '2025-02-28')
+        for value in ('2025-02-30', '28/02/2025', 20250228):
+            with self.assertRaises(InvalidParamsError):
+                as_date(value)
+
+    def test_parameter_descriptions_must_match_the_signature(self):
+        with self.assertRaises(TypeError):
+            class Missing(BaseApplication):
+                @mcp_method(description="", parameters={'site_url': ''})
+                async def report(self, site_url: str, limit: int = 10): ...
+
+        with self.assertRaises(TypeError):
+            class Extra(BaseApplication):
+                @mcp_method(description="", parameters={'site_url': '', 'limit': ''})
+                async def report(self, site_url: str): ...
+
+        class Ordered(BaseApplication):
+            @mcp_method(description="", parameters={'limit': 'Límite', 'site_url': 'Sitio'})
+            async def report(self, site_url: str, limit: int = 10): ...
+        self.assertEqual(list(Ordered._method_metadata[0]['parameters']), ['site_url', 'limit'])
+
+    def test_overrides_without_the_decorator_are_dispatched(self):
+        class Override(fake_google.FakeSearchConsoleMCP):
+            async def get_search_analytics(self, site_url, start_date, end_date, dimensions=None, row_limit=1000, start_row=0):
+                return {'override': row_limit}
+
+        plugin = Override(credentials={}, config={}, user_id=1)
+        result = asyncio.run(plugin.execute_method('get_search_analytics', {'site_url': 'https://a/', 'start_date': '2025-01-01', 'end_date': '2025-01-31', 'row_limit': '5'}))
+        self.assertEqual(result, {'override': 5})
+
+
+class SearchConsolePluginTests(SimpleTestCase):
+
+    def setUp(self):
+        fake_google.fake_api = fake_google.FakeGoogleAPI(latency=0, total_rows=50)
+        self.plugin = fake_google.FakeSearchConsoleMCP(credentials={}, config={}, user_id=1)
+
+    def test_invalid_params_are_rejected_before_any_request(self):
+        with self.assertRaises(InvalidParamsError):
+            asyncio.run(self.plugin.execute_method('get_search_analytics', {'site_url': 'https://a/', 'start_date': '01/01/2025', 'end_date': '2025-01-31'}))
+        self.assertEqual(sum(fake_google.fake_api.calls.values()), 0)
+
+    def test_multi_site_analytics_uses_batches(self):
+        sites = [f"https://site-{i}/" for i in range(120)]
+        result = asyncio.run(self.plugin.execute_method('get_multi_site_analytics', {'site_urls': sites, 'start_date': '2025-01-01', 'end_date': '2025-01-31'}))
+        self.assertEqual(len(result['sites']), 120)
+        self.assertEqual(fake_google.fake_api.calls['batch'], 3)
+
+    def test_multi_site_analytics_deduplicates_sites(self):
+        sites = ['https://a/', 'https://b/', 'https://a/']
+        result = asyncio.run(self.plugin.get_multi_site_analytics(sites, '2025-01-01', '2025-01-31'))
+        self.assertEqual(sorted(result['sites']), ['https://a/', 'https://b/'])
+        self.assertEqual(fake_google.fake_api.calls['batch:searchanalytics.query'], 2)
+
+    def test_per_part_errors_only_affect_their_site(self):
+        fake_google.fake_api.site_access = {None: {'https://a/', 'https://c/'}}
+        result = asyncio.run(self.plugin.get_multi_site_analytics(['https://a/', 'https://b/', 'https://c/'], '2025-01-01', '2025-01-31'))
+        self.assertEqual(sorted(result['sites']), ['https://a/', 'https://c/'])
+        self.assertEqual(list(result['errors']), ['https://b/'])
+        self.assertIn('403', result['errors']['https://b/'])
+        self.assertEqual(fake_google.fake_api.calls['batch'], 1)
+
+    def test_whole_batch_failure_reports_every_site_of_that_batch(self):
+        fake_google.fake_api.quota_per_minute = 1
+        sites = [f"https://site-{i}/" for i in range(4)]
+
+        async def collect():
+            return [result async for result in self.plugin.iter_multi_site_analytics(sites, '2025-01-01', '2025-01-31', batch_size=2, max_concurrency=1)]
+
+        with self.assertLogs('mcp.FakeSearchConsoleMCP', 'ERROR'):
+            results = asyncio.run(collect())
+        self.assertEqual(len(results), 4)
+        self.assertEqual(sum('data' in result for result in results), 2)
+        failed = [result for result in results if 'error' in result]
+        self.assertEqual(len(failed), 2)
+        self.assertTrue(all('429' in result['error'] for result in failed))
+
+    def test_invalid_batch_settings_are_rejected(self):
+        async def collect():
+            return [result async for result in self.plugin.iter_multi_site_analytics(['https://a/'], '2025-01-01', '2025-01-31', batch_size=0)]
+
+        with self.assertRaises(ValueError):
+            asyncio.run(collect())
+
+
+@override_settings(SECRET_KEY=suite.BENCHMARK_SETTINGS['SECRET_KEY'])
+class GoogleCredentialsTests(TestCase):
+    """Los plugins reales con las credenciales guardadas en la conexión, sobre el transporte falso."""
+
+    CREDENTIALS = {'token': 'stored', 'refresh_token': 'refresh', 'client_id': 'cliente', 'client_secret': 'secreto', 'scopes': ['https://www.googleapis.com/auth/webmasters.readonly']}
+
+    def setUp(self):
+        self.api = fake_google.FakeGoogleAPI(latency=0, total_rows=5, site_access={'stored': {'https://a/', '123'}})
+        self.category = MCPCategory.objects.create(name='Google', slug='google', icon='google')
+        self.user = get_user_model().objects.create(username='credenciales')
+
+    def plugin(self, slug, plugin_class, config):
+        provider = MCPProvider.objects.create(name=slug, slug=slug, category=self.category, integration_type='oauth2', plugin_class=plugin_class)
+        connection = UserMCPConnection(user=self.user, mcp_provider=provider, config_data=config)
+        connection.credentials = self.CREDENTIALS
+        connection.save()
+        return UserMCPConnection.objects.get(pk=connection.pk).get_plugin()
+
+    def transport(self):
+        # googleapiclient crea el httplib2.Http que envuelven las credenciales: se sustituye por el falso
+        return mock.patch('httplib2.Http', lambda *args, **kwargs: fake_google.FakeHttp(self.api))
+
+    def test_search_console_uses_the_stored_credentials(self):
+        plugin = self.plugin('gsc', 'mcps_plugins.google.search_console.GoogleSearchConsoleMCP', {})
+        with self.transport():
+            self.assertTrue(asyncio.run(plugin.authenticate()))
+            self.assertTrue(asyncio.run(plugin.verify_site_access('https://a/')))
+            self.assertFalse(asyncio.run(plugin.verify_site_access('https://b/')))
+            result = asyncio.run(plugin.execute_method('get_search_analytics', {'site_url': 'https://a/', 'start_date': '2025-01-01', 'end_date': '2025-01-31'}))
+            batch = asyncio.run(plugin.get_multi_site_analytics(['https://a/', 'https://b/'], '2025-01-01', '2025-01-31'))
+        self.assertEqual(len(result['rows']), 5)
+        self.assertEqual(list(batch['sites']), ['https://a/'])
+        self.assertEqual(list(batch['errors']), ['https://b/'])
+        self.assertEqual(self.api.calls['sites.list'], 1)
+
+    def test_ga4_uses_the_stored_credentials(self):
+        plugin = self.plugin('ga4', 'mcps_plugins.google.analytics.GoogleAnalytics4MCP', {'property_id': '123'})
+        with self.transport():
+            self.assertTrue(asyncio.run(plugin.authenticate()))
+            realtime = asyncio.run(plugin.execute_method('get_real_time_data', {}))
+            views = asyncio.run(plugin.execute_method('get_page_views', {'property_id': '123', 'start_date': '2025-01-01', 'end_date': '2025-01-31'}))
+            with self.assertRaises(PermissionError):
+                asyncio.run(plugin.get_real_time_data('456'))
+        self.assertEqual(realtime['kind'], 'analyticsData#runRealtimeReport')
+        self.assertEqual(len(views['rows']), 5)
+
+    def test_credentials_without_token_are_rejected(self):
+        plugin = self.plugin('gsc', 'mcps_plugins.google.search_console.GoogleSearchConsoleMCP', {})
+        plugin.credentials = {}
+        with self.assertRaises(ValueError):
+            plugin._build_service()
+
+
+def ga4_row(screen, users):
+    return {'dimensionValues': [{'value': screen}], 'metricValues': [{'value': str(users)}]}
+
+
+class RealTimeHubTests(SimpleTestCase):
+
+    def setUp(self):
+        # Sin candados ni snapshots de tiempo real de otros tests en la caché compartida
+        result_cache.cache.clear()
+
+    def counting_fetch(self, calls, name, revoked=False, failing=False):
+        async def fetch():
+            calls.append(name)
+            if revoked:
+                raise SubscriptionRevoked(name)
+            if failing:
+                raise RuntimeError(f"{name}: 503")
+            return {'rows': [ga4_row('Inicio', len(calls))]}
+        return fetch
+
+    def test_delta_only_contains_changed_rows(self):
+        previous = {'rows': [ga4_row('Inicio', 5), ga4_row('Blog', 3), ga4_row('Contacto', 1)], 'rowCount': 3}
+        current = {'rows': [ga4_row('Inicio', 7), ga4_row('Blog', 3), ga4_row('Precios', 2)], 'rowCount': 3}
+        delta = compute_delta(previous, current)
+        self.assertEqual(delta['rows'], {'upserted': [ga4_row('Inicio', 7), ga4_row('Precios', 2)], 'removed': [['Contacto']]})
+        self.assertEqual(delta['changed'], {})
+        self.assertIsNone(compute_delta(current, current))
+        # Sin claves de dimensión se compara el informe entero
+        self.assertEqual(compute_delta({'rows': [1]}, {'rows': [2]})['changed'], {'rows': [2]})
+
+    def test_subscribers_share_one_poller_until_the_last_leaves(self):
+        async def scenario():
+            hub, calls = RealTimeHub(min_interval=0.01, max_interval=0.01), []
+            first = hub.subscribe('property', self.counting_fetch(calls, 'first'))
+            second = hub.subscribe('property', self.counting_fetch(calls, 'second'))
+            self.assertEqual((await first.get())['type'], 'snapshot')
+            self.assertEqual((await second.get())['type'], 'snapshot')
+            self.assertEqual(hub.stats(), {'pollers': 1, 'subscribers': 2})
+            self.assertEqual((await second.get())['type'], 'delta')
+            self.assertEqual(set(calls), {'first'})
+            hub.unsubscribe('property', first)
+            hub.unsubscribe('property', second)
+            self.assertEqual(hub.stats(), {'pollers': 0, 'subscribers': 0})
+        asyncio.run(scenario())
+
+    def test_poller_rebinds_when_its_subscriber_leaves(self):
+        async def scenario():
+            hub, calls = RealTimeHub(min_interval=0.01, max_interval=0.01), []
+            first = hub.subscribe('property', self.counting_fetch(calls, 'first'))
+            second = hub.subscribe('property', self.counting_fetch(calls, 'second'))
+            await second.get()
+            hub.unsubscribe('property', first)
+            calls.clear()
+            await second.get()
+            self.assertEqual(set(calls), {'second'})
+            hub.unsubscribe('property', second)
+        asyncio.run(scenario())
+
+    def test_revoked_subscriber_is_closed_and_others_keep_streaming(self):
+        async def scenario():
+            hub, calls = RealTimeHub(min_interval=0.01, max_interval=0.01), []
+            revoked = hub.subscribe('property', self.counting_fetch(calls, 'revoked', revoked=True))
+            other = hub.subscribe('property', self.counting_fetch(calls, 'other'))
+            self.assertEqual(await revoked.get(), {'type': 'closed'})
+            self.assertEqual((await other.get())['type'], 'snapshot')
+            self.assertEqual(hub.stats(), {'pollers': 1, 'subscribers': 1})
+            hub.unsubscribe('property', revoked)
+            hub.unsubscribe('property', other)
+        asyncio.run(scenario())
+
+    def test_poller_rebinds_after_repeated_failures(self):
+        async def scenario():
+            hub, calls = RealTimeHub(min_interval=0.01, max_interval=0.01), []
+            failing = hub.subscribe('property', self.counting_fetch(calls, 'failing', failing=True))
+            other = hub.subscribe('property', self.counting_fetch(calls, 'other'))
+            with self.assertLogs('mcp.realtime', 'ERROR'):
+                self.assertEqual((await other.get())['type'], 'snapshot')
+            self.assertEqual(calls, ['failing'] * MAX_OWNER_FAILURES + ['other'])
+            # El suscriptor cuyas credenciales fallan sigue recibiendo los datos
+            self.assertEqual((await failing.get())['type'], 'snapshot')
+            hub.unsubscribe('property', failing)
+            hub.unsubscribe('property', other)
+        asyncio.run(scenario())
+
+    def test_only_one_worker_polls_google(self):
+        async def scenario():
+            # Dos hubs con la misma caché hacen de dos workers
+            workers, calls, checks = [RealTimeHub(min_interval=0.01, max_interval=0.01) for _ in range(2)], [], []
+
+            async def check():
+                checks.append('second')
+
+            first = workers[0].subscribe('property', self.counting_fetch(calls, 'first'))
+            await first.get()
+            second = workers[1].subscribe('property', self.counting_fetch(calls, 'second'), check)
+            self.assertEqual((await second.get())['type'], 'snapshot')
+            await second.get()
+            self.assertEqual(set(calls), {'first'})
+            self.assertTrue(checks)
+
+            # Si el worker que sondea se queda sin suscriptores, otro toma el relevo
+            workers[0].unsubscribe('property', first)
+            calls.clear()
+            while 'second' not in calls:
+                await asyncio.wait_for(second.get(), timeout=1)
+            self.assertEqual(set(calls), {'second'})
+            workers[1].unsubscribe('property', second)
+        asyncio.run(scenario())
+
+    def test_follower_subscriber_is_closed_when_revoked(self):
+        async def scenario():
+            workers, calls = [RealTimeHub(min_interval=0.01, max_interval=0.01) for _ in range(2)], []
+
+            async def revoked():
+                raise SubscriptionRevoked('second')
+
+            first = workers[0].subscribe('property', self.counting_fetch(calls, 'first'))
+            await first.get()
+            second = workers[1].subscribe('property', self.counting_fetch(calls, 'second'), revoked)
+            self.assertEqual(await second.get(), {'type': 'closed'})
+            self.assertEqual(workers[1].stats(), {'pollers': 1, 'subscribers': 0})
+            workers[0].unsubscribe('property', first)
+            workers[1].unsubscribe('property', second)
+        asyncio.run(scenario())
+
+    def test_ga4_real_time_data_streams_row_deltas(self):
+        fake_google.fake_api = fake_google.FakeGoogleAPI(latency=0, site_access={'token': {'123'}})
+        plugin = fake_google.FakeAnalyticsMCP(credentials={'token': 'token'}, config={'property_id': '123'}, user_id=1)
+
+        async def scenario():
+            hub = RealTimeHub(min_interval=0.01, max_interval=0.01)
+            queue = hub.subscribe(('ga4', '123'), lambda: plugin.execute_method('get_real_time_data', {}))
+            snapshot = await queue.get()
+            fake_google.fake_api.realtime_tick += 1
+            delta = await queue.get()
+            hub.unsubscribe(('ga4', '123'), queue)
+            return snapshot, delta
+
+        snapshot, delta = asyncio.run(scenario())
+        self.assertEqual(len(snapshot['data']['rows']), 50)
+        self.assertEqual(len(delta['rows']['upserted']), 10)
+        self.assertEqual(delta['rows']['removed'], [])
+
+
+@override_settings(SECRET_KEY=suite.BENCHMARK_SETTINGS['SECRET_KEY'])
+class RealTimeStreamViewTests(TestCase):
+
+    def setUp(self):
+        result_cache.cache.clear()
+        fake_google.fake_api = fake_google.FakeGoogleAPI(latency=0, site_access={'owner': {'123'}})
+        category = MCPCategory.objects.create(name='Google', slug='google', icon='google')
+        self.provider = MCPProvider.objects.create(name='GA4', slug='ga4', category=category, integration_type='oauth2', plugin_class='applications.mcps.benchmarks.fake_google.FakeAnalyticsMCP')
+
+    def connection(self, username):
+        connection = UserMCPConnection(user=get_user_model().objects.create(username=username), mcp_provider=self.provider, config_data={'property_id': '123'})
+        connection.credentials = {'token': username}
+        connection.save()
+        return connection
+
+    async def open_stream(self, connection):
+        await self.async_client.aforce_login(connection.user)
+        return await self.async_client.get(reverse('mcps:realtime-stream', args=[connection.id]))
+
+    async def disconnect(self, stream):
+        # Como al cerrar el cliente la conexión: se cancela la lectura pendiente del stream
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+    async def test_stream_sends_the_snapshot_after_checking_access(self):
+        connection = await sync_to_async(self.connection)('owner')
+        response = await self.open_stream(connection)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        stream = response.streaming_content
+        event, data = (await anext(stream)).decode().split('\n', 1)
+        self.assertEqual(event, 'event: snapshot')
+        self.assertEqual(len(json.loads(data.removeprefix('data: '))['data']['rows']), 50)
+        self.assertTrue(await result_cache.has_grant(connection, '123'))
+        self.assertEqual(hub.stats(), {'pollers': 1, 'subscribers': 1})
+
+        await self.disconnect(stream)
+        self.assertEqual(hub.stats(), {'pollers': 0, 'subscribers': 0})
+
+    async def test_subscriber_without_access_is_refused(self):
+        connection = await sync_to_async(self.connection)('outsider')
+        response = await self.open_stream(connection)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(fake_google.fake_api.calls['forbidden'], 1)
+        self.assertEqual(hub.stats(), {'pollers': 0, 'subscribers': 0})
+
+
+class WebhookIngestorTests(TestCase):
+
+    SECRET = 'secreto'
+
+    def setUp(self):
+        category = MCPCategory.objects.create(name='Google', slug='google', icon='google')
+        provider = MCPProvider.objects.create(name='Search Console', slug='gsc', category=category, integration_type='oauth2', plugin_class='mcps_plugins.google.search_console.GoogleSearchConsoleMCP')
+        user = get_user_model().objects.create(username='webhooks')
+        self.connection = UserMCPConnection.objects.create(user=user, mcp_provider=provider, encrypted_credentials='', config_data={'site_url': 'https://a/', 'webhook_secret': self.SECRET})
+        self.ingestor = WebhookIngestor(flush_interval=3600)
+
+    def tearDown(self):
+        if self.ingestor.task is not None:
+            self.ingestor.task.cancel()
+
+    def event(self, payload, signed=True, header=None):
+        body = json.dumps(payload).encode()
+        signature = hmac.new(self.SECRET.encode(), body, hashlib.sha256).hexdigest() if signed else None
+        return WebhookEvent(
+            connection_id=self.connection.id,
+            event_type='sitemap.updated',
+            idempotency_key=idempotency_key_for(self.connection.id, body, payload, header),
+            payload=payload,
+            body=body,
+            signature=signature,
+        )
+
+    async def stored_payloads(self):
+        return [payload async for payload in MCPWebhookEvent.objects.order_by('received_at').values_list('payload', flat=True)]
+
+    async def test_forged_events_do_not_suppress_the_real_one(self):
+        real = {'id': 'evt-1', 'site_url': 'https://a/', 'real': True}
+        forged = {'id': 'evt-1', 'site_url': 'https://a/', 'real': False}
+        self.ingestor.submit(self.event(forged, signed=False))
+        self.ingestor.submit(self.event(real))
+        self.ingestor.submit(self.event({**forged, 'id': 'evt-2'}, signed=False))
+
+        self.assertEqual(await self.ingestor.flush(), 1)
+        self.assertEqual(await self.stored_payloads(), [real])
+        self.assertEqual(self.ingestor.counters['invalid'], 2)
+
+    async def test_keys_are_remembered_only_once_stored(self):
+        payload = {'id': 'evt-1', 'site_url': 'https://a/'}
+        self.ingestor.submit(self.event(payload))
+        self.ingestor.submit(self.event(payload))
+        self.assertEqual(self.ingestor.counters['duplicates'], 0)
+        self.assertEqual(self.ingestor.pending_count, 2)
+
+        await self.ingestor.flush()
+        self.assertEqual(len(await self.stored_payloads()), 1)
+        self.ingestor.submit(self.event(payload))
+        self.assertEqual(self.ingestor.counters['duplicates'], 2)
+        self.assertEqual(self.ingestor.pending_count, 0)
+
+    async def test_valid_events_for_the_same_resource_are_coalesced(self):
+        self.ingestor.submit(self.event({'id': 'evt-1', 'site_url': 'https://a/'}))
+        self.ingestor.submit(self.event({'id': 'evt-2', 'site_url': 'https://a/'}))
+        self.assertEqual(await self.ingestor.flush(), 1)
+        self.assertEqual(await self.stored_payloads(), [{'id': 'evt-2', 'site_url': 'https://a/'}])
+        self.assertEqual(self.ingestor.counters['coalesced'], 1)
+        self.assertEqual(set(self.ingestor.recent_keys), {f"{self.connection.id}:evt-1", f"{self.connection.id}:evt-2"})
+
+    async def test_replays_of_coalesced_events_are_not_reapplied_by_other_workers(self):
+        self.ingestor.submit(self.event({'id': 'evt-1', 'site_url': 'https://a/'}))
+        self.ingestor.submit(self.event({'id': 'evt-2', 'site_url': 'https://a/'}))
+        await self.ingestor.flush()
+
+        other_worker = WebhookIngestor(flush_interval=3600)
+        other_worker.submit(self.event({'id': 'evt-1', 'site_url': 'https://a/'}))
+        self.assertEqual(await other_worker.flush(), 0)
+        self.assertEqual(other_worker.counters['duplicates'], 1)
+        self.assertEqual(await MCPWebhookKey.objects.acount(), 2)
+
+    async def test_failed_batches_are_requeued(self):
+        self.ingestor.submit(self.event({'id': 'evt-1', 'site_url': 'https://a/'}))
+        self.ingestor.submit(self.event({'id': 'evt-2', 'site_url': 'https://b/'}))
+        with mock.patch.object(self.ingestor, '_store', side_effect=OperationalError('base de datos caída')):
+            with self.assertRaises(OperationalError):
+                await self.ingestor.flush()
+        self.assertEqual(self.ingestor.pending_count, 2)
+        self.assertEqual(len(self.ingestor.recent_keys), 0)
+
+        self.assertEqual(await self.ingestor.flush(), 2)
+        self.assertEqual([payload['id'] for payload in await self.stored_payloads()], ['evt-1', 'evt-2'])
+
+    async def test_events_the_database_rejects_do_not_block_the_queue(self):
+        store = self.ingestor._store
+
+        def rejecting_store(events):
+            if any(event.event_type == 'poison' for event in events):
+                raise DataError('value too long for type character varying(100)')
+            return store(events)
+
+        poison = self.event({'id': 'evt-1', 'site_url': 'https://a/'})
+        poison.event_type = 'poison'
+        self.ingestor.submit(poison)
+        self.ingestor.submit(self.event({'id': 'evt-2', 'site_url': 'https://b/'}))
+        with mock.patch.object(self.ingestor, '_store', side_effect=rejecting_store), self.assertLogs('mcp.webhooks', 'WARNING'):
+            self.assertEqual(await self.ingestor.flush(), 1)
+            self.assertEqual(self.ingestor.pending_count, 1)
+            for _ in range(MAX_EVENT_ATTEMPTS - 1):
+                await self.ingestor.flush()
+        self.assertEqual(self.ingestor.pending_count, 0)
+        self.assertEqual(list(self.ingestor.dead_letter), [poison])
+        self.assertEqual(self.ingestor.counters['dead_lettered'], 1)
+        self.assertEqual([payload['id'] for payload in await self.stored_payloads()], ['evt-2'])
+
+    async def test_pending_events_are_applied_on_shutdown(self):
+        self.ingestor.submit(self.event({'id': 'evt-1', 'site_url': 'https://a/'}))
+        self.assertIsNotNone(self.ingestor.task)
+        await self.ingestor.close()
+        self.assertTrue(self.ingestor.task is None and self.ingestor.pending_count == 0)
+        self.assertEqual(len(await self.stored_payloads()), 1)
+
+    async def test_lifespan_shutdown_closes_the_ingestor(self):
+        messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with mock.patch('applications.mcps.lifespan.ingestor', self.ingestor):
+            self.ingestor.submit(self.event({'id': 'evt-1', 'site_url': 'https://a/'}))
+            await LifespanMiddleware(None)({'type': 'lifespan'}, receive, send)
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertEqual(len(await self.stored_payloads()), 1)
+
+    def test_intake_applies_events_before_responding_under_wsgi(self):
+        url = reverse('mcps:webhook-intake', args=[self.connection.id])
+        with mock.patch('applications.mcps.views.ingestor', self.ingestor):
+            for index in range(3):
+                body = json.dumps({'id': f"evt-{index}", 'site_url': f"https://{index}/"})
+                signature = hmac.new(self.SECRET.encode(), body.encode(), hashlib.sha256).hexdigest()
+                response = self.client.post(url, body, content_type='application/json', headers={'X-MCP-Event': 'sitemap.updated', 'X-MCP-Signature': signature})
+                self.assertEqual(response.status_code, 202)
+        self.assertEqual(MCPWebhookEvent.objects.count(), 3)
+        self.assertEqual(self.ingestor.pending_count, 0)
+        self.assertIsNone(self.ingestor.task)
+
+    def test_intake_rejects_event_types_longer_than_the_column(self):
+        url = reverse('mcps:webhook-intake', args=[self.connection.id])
+        response = self.client.post(url, '{}', content_type='application/json', headers={'X-MCP-Event': 'x' * 101})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_invalidation_errors_are_retried_without_reapplying(self):
+        self.ingestor.submit(self.event({'id': 'evt-1', 'site_url': 'https://a/'}))
+        with mock.patch('applications.mcps.webhooks.result_cache.invalidate', side_effect=RuntimeError('redis caído')), self.assertLogs('mcp.webhooks', 'ERROR'):
+            self.assertEqual(await self.ingestor.flush(), 1)
+        self.assertEqual(self.ingestor.pending_count, 0)
+        self.assertEqual(self.ingestor.stale_resources, {('gsc', 'https://a/')})
+
+        await self.ingestor.flush()
+        self.assertEqual(self.ingestor.stale_resources, set())
+        self.assertEqual(len(await self.stored_payloads()), 1)
+
+    def test_idempotency_header_is_scoped_to_the_connection(self):
+        self.assertNotEqual(idempotency_key_for('a', b'{}', {}, 'clave'), idempotency_key_for('b', b'{}', {}, 'clave'))
+
+
+class SearchConsoleRollupsTests(TestCase):
+
+    SITE = 'https://a/'
+
+    def setUp(self):
+        result_cache.cache.clear()
+        fake_google.fake_api = fake_google.FakeGoogleAPI(latency=0, total_rows=3000, site_access={'owner': {self.SITE}, 'viewer': {self.SITE}})
+        self.plugin = fake_google.FakeSearchConsoleMCP(credentials={'token': 'owner'}, config={'site_url': self.SITE}, user_id=1)
+
+    def top_pages(self, plugin, start_date, end_date, limit=10):
+        return plugin.execute_method('get_top_pages', {'site_url': self.SITE, 'start_date': start_date, 'end_date': end_date, 'limit': limit})
+
+    async def test_merge_sums_every_daily_row(self):
+        result = await self.top_pages(self.plugin, '2025-01-01', '2025-01-10', limit=5)
+
+        totals = defaultdict(lambda: [0, 0])
+        for row in fake_google.fake_api._rows(self.SITE, ('date', 'page'), '2025-01-01', '2025-01-10'):
+            totals[row['keys'][1]][0] += row['clicks']
+            totals[row['keys'][1]][1] += row['impressions']
+        expected = sorted(totals.items(), key=lambda item: (-item[1][0], -item[1][1], item[0]))[:5]
+        self.assertEqual([(row['keys'][0], row['clicks'], row['impressions']) for row in result['rows']], [(key, clicks, impressions) for key, (clicks, impressions) in expected])
+
+    async def test_days_are_filled_lazily_and_not_truncated(self):
+        await self.top_pages(self.plugin, '2025-01-01', '2025-01-05')
+        self.assertEqual(await SearchConsoleDailyRollup.objects.acount(), 3000)
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 1)
+
+        # Solo se piden a Google los días que faltan
+        await self.top_pages(self.plugin, '2025-01-01', '2025-01-10')
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 2)
+        self.assertEqual(await SearchConsoleRollupDay.objects.filter(date__gt='2025-01-05').acount(), 5)
+
+        await self.top_pages(self.plugin, '2025-01-03', '2025-01-08')
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 2)
+
+    async def test_each_run_of_missing_days_is_fetched_separately(self):
+        await self.top_pages(self.plugin, '2025-01-03', '2025-01-05')
+        computed = [day async for day in SearchConsoleRollupDay.objects.order_by('date').values_list('computed_at', flat=True)]
+
+        await self.top_pages(self.plugin, '2025-01-01', '2025-01-10')
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 3)
+        kept = [day async for day in SearchConsoleRollupDay.objects.filter(date__range=('2025-01-03', '2025-01-05')).order_by('date').values_list('computed_at', flat=True)]
+        self.assertEqual(kept, computed)
+        self.assertEqual(await SearchConsoleRollupDay.objects.acount(), 10)
+
+    async def test_concurrent_fills_of_the_same_days_do_not_collide(self):
+        rollups = SearchConsoleRollups(self.plugin)
+        await rollups.refresh(self.SITE, 'page', date(2025, 1, 1), date(2025, 1, 5))
+        # El borrado del segundo worker no ve las filas que el primero aún no había confirmado
+        with mock.patch('django.db.models.query.QuerySet.delete', return_value=(0, {})):
+            await rollups.refresh(self.SITE, 'page', date(2025, 1, 1), date(2025, 1, 5))
+        self.assertEqual(await SearchConsoleDailyRollup.objects.acount(), 3000)
+
+    async def test_only_recent_stale_days_are_refreshed(self):
+        today = timezone.now().date()
+        start, end = (today - timedelta(days=9)).isoformat(), today.isoformat()
+        await self.top_pages(self.plugin, start, end)
+        stale = timezone.now() - timedelta(hours=2)
+        await SearchConsoleRollupDay.objects.aupdate(computed_at=stale)
+
+        await self.top_pages(self.plugin, start, end)
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 2)
+        refreshed = [day async for day in SearchConsoleRollupDay.objects.filter(computed_at__gt=stale).values_list('date', flat=True)]
+        self.assertEqual(min(refreshed), today - timedelta(days=3))
+        self.assertEqual(len(refreshed), 4)
+
+    def connection(self, connection_id):
+        return SimpleNamespace(id=connection_id, status='active', config_data={}, mcp_provider=SimpleNamespace(slug='gsc'))
+
+    async def test_user_without_access_is_refused(self):
+        await self.top_pages(self.plugin, '2025-01-01', '2025-01-10')
+        outsider = fake_google.FakeSearchConsoleMCP(credentials={'token': 'outsider'}, config={}, user_id=2)
+        params = {'site_url': self.SITE, 'start_date': '2025-01-01', 'end_date': '2025-01-10'}
+
+        with self.assertRaises(PermissionError):
+            await result_cache.get_or_fetch(self.connection(2), outsider, 'get_top_pages', params)
+        self.assertEqual(fake_google.fake_api.calls['forbidden'], 1)
+        self.assertIsNone(await result_cache.cache.aget(result_cache._grant_key(self.connection(2), self.SITE)))
+
+    async def test_access_is_verified_once_with_the_users_credentials(self):
+        await self.top_pages(self.plugin, '2025-01-01', '2025-01-10')
+        self.assertEqual(fake_google.fake_api.calls['sites.get'], 0)
+
+        viewer = fake_google.FakeSearchConsoleMCP(credentials={'token': 'viewer'}, config={}, user_id=3)
+        await result_cache.get_or_fetch(self.connection(3), viewer, 'get_top_pages', {'site_url': self.SITE, 'start_date': '2025-01-01', 'end_date': '2025-01-10'})
+        await self.top_pages(viewer, '2025-01-01', '2025-01-05')
+        self.assertEqual(fake_google.fake_api.calls['sites.get'], 1)
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 1)
+        # La respuesta sale de los rollups y no de Google, así que no concede acceso a las entradas compartidas
+        self.assertIsNone(await result_cache.cache.aget(result_cache._grant_key(self.connection(3), self.SITE)))
+
+
+class SerializationTests(SimpleTestCase):
+
+    def test_search_console_rows_round_trip(self):
+        payload = search_console_payload(serialization.ROW_CHUNK_SIZE + 10)
+        payload['rows'][0].update(ctr=0, position=1)
+        for threshold in (None, serialization.COMPRESSION_THRESHOLD):
+            blob = serialization.dumps(payload, compress_threshold=threshold)
+            self.assertTrue(serialization.is_serialized(blob))
+            decoded = serialization.loads(blob)
+            self.assertEqual(decoded, payload)
+            self.assertIs(type(decoded['rows'][0]['ctr']), int)
+            self.assertIs(type(decoded['rows'][1]['ctr']), float)
+            self.assertEqual(list(serialization.iter_rows(blob)), payload['rows'])
+
+    def test_other_payloads_round_trip_as_json(self):
+        report = fake_google.ga4_report(20)
+        blob = serialization.dumps(report)
+        self.assertEqual(serialization.loads(blob), report)
+        self.assertEqual(list(serialization.iter_rows(blob)), report['rows'])
+        self.assertEqual(list(serialization.iter_rows(serialization.dumps({'siteEntry': []}))), [])
+
+    def test_lossy_payloads_are_cached_as_they_are(self):
+        for payload in ({1: 'uno'}, {'keys': ('a', 'b')}, {'rows': [{'keys': ['a'], 'clicks': 1}], 'sites': {'a', 'b'}}):
+            with self.assertRaises(serialization.SerializationError):
+                serialization.dumps(payload)
+            self.assertIs(result_cache._encode(payload), payload)
+
+    def test_reads_version_1_payloads(self):
+        rows = search_console_payload(10)['rows']
+        envelope = b'{}'
+        chunk = serialization._encode_chunk(rows, 2)[:-len(rows)]
+        blob = b''.join([
+            serialization.HEADER.pack(serialization.MAGIC, 1, serialization.FLAG_ROW_TABLE),
+            serialization._UINT32.pack(len(envelope)), envelope,
+            chunk, serialization._CHUNK_HEADER.pack(0, 0, 0),
+        ])
+        self.assertEqual(serialization.loads(blob), {'rows': rows})
+
+    def test_invalid_blobs_are_rejected(self):
+        blob = serialization.dumps(search_console_payload(10), compress_threshold=None)
+        for invalid in (blob[:-20], b'MCPB' + bytes([9, 0]) + blob[6:], b'JSON'):
+            with self.assertRaises(serialization.SerializationError):
+                serialization.loads(invalid)
+
+
+class PluginResultCacheTests(SimpleTestCase):
+
+    SITE = 'https://a/'
+    PARAMS = {'site_url': SITE, 'start_date': '2025-01-01', 'end_date': '2025-01-31'}
+
+    def setUp(self):
+        result_cache.cache.clear()
+        result_cache.stats.reset()
+        fake_google.fake_api = fake_google.FakeGoogleAPI(latency=0.02, total_rows=20, site_access={'owner': {self.SITE}, 'viewer': {self.SITE}})
+
+    def user(self, token, connection_id, config=None):
+        connection = SimpleNamespace(id=connection_id, status='active', config_data=config or {}, mcp_provider=SimpleNamespace(slug='gsc'))
+        return connection, fake_google.FakeSearchConsoleMCP(credentials={'token': token}, config=config or {}, user_id=connection_id)
+
+    def fetch(self, user, params=None):
+        return result_cache.get_or_fetch(*user, 'get_search_analytics', params or self.PARAMS)
+
+    def test_equivalent_params_share_one_entry(self):
+        owner = self.user('owner', 1, {'site_url': self.SITE})
+
+        async def scenario():
+            await self.fetch(owner)
+            await self.fetch(owner, {**self.PARAMS, 'row_limit': '1000', 'dimensions': None, 'start_row': 0})
+        asyncio.run(scenario())
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 1)
+
+    def test_user_without_access_or_grant_is_refused_the_shared_entry(self):
+        owner = self.user('owner', 1, {'site_url': self.SITE})
+        outsider = self.user('outsider', 2)
+
+        async def scenario():
+            await self.fetch(owner)
+            with self.assertRaises(HttpError):
+                await self.fetch(outsider)
+        asyncio.run(scenario())
+        self.assertEqual(result_cache.stats.snapshot()['shared']['hits'], 0)
+        self.assertEqual(fake_google.fake_api.calls['forbidden'], 1)
+
+    def test_concurrent_misses_make_one_upstream_call(self):
+        owner = self.user('owner', 1, {'site_url': self.SITE})
+        viewer = self.user('viewer', 2, {'site_url': self.SITE})
+        outsider = self.user('outsider', 3)
+
+        async def scenario():
+            return await asyncio.gather(
+                *(self.fetch(user) for user in [owner, viewer] * 5),
+                self.fetch(outsider),
+                return_exceptions=True,
+            )
+        results = asyncio.run(scenario())
+        self.assertTrue(all(result == results[0] for result in results[:10]))
+        # El usuario sin acceso no recibe el resultado de los demás: consulta con sus credenciales y falla
+        self.assertIsInstance(results[10], HttpError)
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 2)
+
+    def test_waits_for_another_worker_holding_the_lock(self):
+        owner = self.user('owner', 1, {'site_url': self.SITE})
+
+        async def scenario():
+            expected = await self.fetch(owner)
+            # Se simula otro worker: la entrada se borra y el candado está cogido hasta que la escribe de nuevo
+            result_cache.cache.clear()
+            params = owner[1].canonical_params('get_search_analytics', self.PARAMS)
+            key = result_cache.shared_key('gsc', self.SITE, 'get_search_analytics', params)
+            await result_cache.cache.aadd(f"{key}:lock", True, SINGLE_FLIGHT_LOCK_TTL)
+
+            async def other_worker():
+                await asyncio.sleep(0.1)
+                await result_cache.cache.aset(key, result_cache._encode(expected))
+            writer = asyncio.create_task(other_worker())
+            result = await self.fetch(owner)
+            await writer
+            return expected, result
+        expected, result = asyncio.run(scenario())
+        self.assertEqual(result, expected)
+        self.assertEqual(fake_google.fake_api.calls['searchanalytics.query'], 1)
+
+    def test_real_time_data_is_never_cached(self):
+        fake_google.fake_api.site_access = {'owner': {'123'}}
+        connection = SimpleNamespace(id=1, status='active', config_data={}, mcp_provider=SimpleNamespace(slug='ga4'))
+        plugin = fake_google.FakeAnalyticsMCP(credentials={'token': 'owner'}, config={'property_id': '123'}, user_id=1)
+
+        async def scenario():
+            first = await result_cache.get_or_fetch(connection, plugin, 'get_real_time_data', {'property_id': '123'})
+            fake_google.fake_api.realtime_tick += 1
+            second = await result_cache.get_or_fetch(connection, plugin, 'get_real_time_data', {'property_id': '123'})
+            return first, second, await result_cache.has_grant(connection, '123')
+        first, second, granted = asyncio.run(scenario())
+        self.assertNotEqual(first, second)
+        self.assertEqual(fake_google.fake_api.calls['properties.runRealtimeReport'], 2)
+        self.assertTrue(granted)
+
+    def test_methods_can_set_their_own_ttl(self):
+        class ShortLived(fake_google.FakeSearchConsoleMCP):
+            @mcp_method(description="", parameters={'site_url': ''}, cache_ttl=5)
+            async def get_sitemaps(self, site_url: str) -> Dict:
+                return {'sitemaps': []}
+
+        owner = (self.user('owner', 1)[0], ShortLived(credentials={}, config={}, user_id=1))
+        with mock.patch.object(result_cache.cache, 'aset', wraps=result_cache.cache.aset) as aset:
+            asyncio.run(result_cache.get_or_fetch(*owner, 'get_sitemaps', {'site_url': self.SITE}))
+        self.assertEqual(aset.call_args_list[0].args[2], 5)
+        self.assertEqual(result_cache.ttl_for(owner[1], 'get_search_analytics'), result_cache.ttl)
+
+
+class MetricsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.enabled = metrics.registry.enabled
+        metrics.registry.enabled = True
+        metrics.registry.reset()
+        fake_google.fake_api = fake_google.FakeGoogleAPI(latency=0, total_rows=10)
+
+    def tearDown(self):
+        metrics.registry.enabled = self.enabled
+        metrics.registry.multiprocess_dir = None
+        metrics.registry.reset()
+
+    def calls(self):
+        return {dict(labels)['method'] + ':' + dict(labels)['status']: value for labels, value in metrics.registry.counters['mcp_plugin_calls_total'].items()}
+
+    def test_plugin_operations_are_instrumented(self):
+        plugin = fake_google.FakeSearchConsoleMCP(credentials={}, config={}, user_id=1, provider_slug='gsc')
+
+        async def scenario():
+            await plugin.execute_method('get_search_analytics', {'site_url': 'https://a/', 'start_date': '2025-01-01', 'end_date': '2025-01-31'})
+            for method, params in (('get_search_analytics', {}), ('inventado', {})):
+                with self.assertRaises(ValueError):
+                    await plugin.execute_method(method, params)
+            self.assertIs(await plugin.authenticate(), True)
+        asyncio.run(scenario())
+
+        self.assertEqual(self.calls(), {'get_search_analytics:ok': 1, 'get_search_analytics:error': 1, 'unknown:error': 1, ':ok': 1})
+        latency = metrics.registry.histograms['mcp_plugin_call_seconds']
+        self.assertEqual(sum(histogram.count for histogram in latency.values()), 4)
+        upstream = {dict(labels)['method']: value for labels, value in metrics.registry.counters['mcp_upstream_calls_total'].items()}
+        self.assertEqual(upstream, {'searchanalytics.query': 1, 'sites.list': 1})
+        # Mismo proveedor que las métricas de la caché: el slug, no la clase del plugin
+        providers = {dict(labels)['provider'] for name in ('mcp_plugin_calls_total', 'mcp_upstream_calls_total') for labels in metrics.registry.counters[name]}
+        self.assertEqual(providers, {'gsc'})
+
+    def test_phase(self):
+        with metrics.phase('claude'):
+            pass
+        with self.assertRaises(RuntimeError), metrics.phase('mcp_calls'):
+            raise RuntimeError
+        totals = {tuple(value for _, value in labels): count for labels, count in metrics.registry.counters['mcp_manager_phase_total'].items()}
+        self.assertEqual(totals, {('claude', 'ok'): 1, ('mcp_calls', 'error'): 1})
+
+        metrics.registry.enabled = False
+        self.assertIs(metrics.phase('claude'), metrics._DISABLED)
+
+    def test_render_uses_the_prometheus_text_format(self):
+        labels = (('provider', 'Search "Console"'), ('operation', 'execute_method'))
+        metrics.registry.inc('mcp_plugin_calls_total', labels, 2)
+        metrics.registry.observe('mcp_plugin_call_seconds', labels, 0.03)
+        text = metrics.registry.render()
+
+        self.assertIn('# HELP mcp_plugin_calls_total ', text)
+        self.assertIn('# TYPE mcp_plugin_call_seconds histogram', text)
+        self.assertIn('mcp_plugin_calls_total{provider="Search \\"Console\\"",operation="execute_method"} 2', text)
+        self.assertIn('mcp_plugin_call_seconds_bucket{provider="Search \\"Console\\"",operation="execute_method",le="0.025"} 0', text)
+        self.assertIn('mcp_plugin_call_seconds_bucket{provider="Search \\"Console\\"",operation="execute_method",le="0.05"} 1', text)
+        self.assertIn('mcp_plugin_call_seconds_bucket{provider="Search \\"Console\\"",operation="execute_method",le="+Inf"} 1', text)
+        self.assertIn('mcp_plugin_call_seconds_count{provider="Search \\"Console\\"",operation="execute_method"} 1', text)
+
+    def test_counters_are_thread_safe(self):
+        def count():
+            for _ in range(20000):
+                metrics.count_upstream('gsc', 'batch')
+        threads = [threading.Thread(target=count) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(metrics.registry.counters['mcp_upstream_calls_total'][(('provider', 'gsc'), ('method', 'batch'))], 80000)
+
+    def test_multiprocess_render_aggregates_every_worker(self):
+        with tempfile.TemporaryDirectory() as directory:
+            metrics.registry.multiprocess_dir = Path(directory)
+            other = {
+                'counters': {'mcp_upstream_calls_total': [[[['provider', 'gsc'], ['method', 'batch']], 3]]},
+                'histograms': {},
+                'collected': [['mcp_webhook_pending', 'gauge', [], 7], ['mcp_webhook_batches_total', 'counter', [], 2]],
+            }
+            (Path(directory) / '999999.json').write_text(json.dumps(other))
+            metrics.count_upstream('gsc', 'batch')
+
+            text = metrics.registry.render()
+            self.assertIn('mcp_upstream_calls_total{provider="gsc",method="batch"} 4', text)
+            self.assertIn('mcp_webhook_pending{worker="999999"} 7', text)
+            self.assertIn('mcp_webhook_batches_total 2', text)
+
+            metrics.mark_process_dead(directory, 999999)
+            self.assertFalse((Path(directory) / '999999.json').exists())
+            text = metrics.registry.render()
+            self.assertIn('mcp_upstream_calls_total{provider="gsc",method="batch"} 4', text)
+            self.assertIn('mcp_webhook_batches_total 2', text)
+            self.assertNotIn('worker="999999"', text)
+
+    def test_cache_hit_ratios_per_provider_and_method(self):
+        stats = cache.CacheStats()
+        stats.hit('shared', 'gsc', 'get_search_analytics')
+        stats.miss('shared', 'gsc', 'get_search_analytics')
+        stats.miss('user', 'ga4', 'get_page_views')
+        with mock.patch.object(result_cache, 'stats', stats):
+            samples = {(name, labels.get('tier'), labels.get('method')): value for name, _, labels, value in cache.collect_metrics()}
+        self.assertEqual(samples[('mcp_cache_hit_ratio', 'shared', 'get_search_analytics')], 0.5)
+        self.assertEqual(samples[('mcp_cache_misses_total', 'user', 'get_page_views')], 1)
+        self.assertEqual(stats.snapshot()['shared'], {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+    def test_collectors_can_run_while_the_loop_updates_their_state(self):
+        stats = cache.CacheStats()
+        realtime = RealTimeHub()
+        done = threading.Event()
+
+        def update():
+            for i in range(20000):
+                stats.miss('shared', 'gsc', f"method_{i}")
+                realtime._pollers[i] = SimpleNamespace(subscribers={})
+                realtime._pollers.pop(i - 10, None)
+            done.set()
+        thread = threading.Thread(target=update)
+        thread.start()
+        with mock.patch.object(result_cache, 'stats', stats), mock.patch('applications.mcps.realtime.hub', realtime):
+            while not done.is_set():
+                metrics.registry.snapshot()
+        thread.join()
+        self.assertEqual(len(stats.by_method()), 20000)
+
+    @override_settings(MCP_METRICS_TOKEN='secreto')
+    def test_endpoint_requires_the_bearer_token(self):
+        self.assertEqual(self.client.get(reverse('mcps:metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('mcps:metrics'), HTTP_AUTHORIZATION='Bearer otro').status_code, 401)
+        self.assertEqual(self.client.get(reverse('mcps:metrics'), HTTP_AUTHORIZATION='Bearer secreto').status_code, 200)
+
+
+class LoadTestTests(TransactionTestCase):
+
+    def test_users_of_the_same_site_share_one_upstream_query(self):
+        results = suite.run_load_test(requests=12, concurrency=12, users=3, latency=0.02)
+        self.assertEqual(results['error_rate'], 0)
+        self.assertEqual(results['upstream_searchanalytics_query'], 1)
+        self.assertEqual(results['upstream_sites_list'], 12)
+
+
+class BaselineComparisonTests(SimpleTestCase):
+
+    def test_compare_flags_regressions(self):
+        baselines = {'latency_p50_ms': 100, 'throughput_rps': 50, 'upstream_sites_list': 10}
+        results = {'latency_p50_ms': 120, 'throughput_rps': 20, 'upstream_sites_list': 11}
+        regressions = suite.compare(results, baselines, threshold=0.5)
+        self.assertEqual([regression.split(':')[0] for regression in regressions], ['throughput_rps', 'upstream_sites_list'])
+
+
+class DeployChecksTests(SimpleTestCase):
+
+    @override_settings(
+        DATABASES={'default': {'ENGINE': 'django.db.backends.postgresql', 'CONN_MAX_AGE': 0, 'OPTIONS': {}}},
+        SESSION_ENGINE='django.contrib.sessions.backends.db',
+        MCP_METRICS_ENABLED=True,
+        MCP_METRICS_TOKEN=None,
+    )
+    def test_reports_settings_that_hurt_throughput(self):
+        messages = checks.check_database(None) + checks.check_caches(None) + checks.check_metrics(None) + checks.check_secret_key(None)
+        self.assertEqual([message.id for message in messages], ['mcps.W002', 'mcps.W004', 'mcps.W005', 'mcps.W006', 'mcps.E001'])
+
+    @override_settings(
+        DATABASES={'default': {'ENGINE': 'django.db.backends.postgresql', 'OPTIONS': {'pool': {'max_size': 10}}}},
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost:6379/0'}},
+        SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+        SECRET_KEY=suite.BENCHMARK_SETTINGS['SECRET_KEY'],
+        MCP_METRICS_ENABLED=True,
+        MCP_METRICS_TOKEN='token',
+    )
+    def test_production_profile_passes(self):
+        self.assertEqual(checks.check_database(None) + checks.check_caches(None) + checks.check_metrics(None) + checks.check_secret_key(None), [])
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'mcps'
+
+urlpatterns = [
+    path('connections/<uuid:connection_id>/realtime/', views.realtime_stream, name='realtime-stream'),
+    path('metrics/', views.metrics_endpoint, name='metrics'),
+    path('connections/<uuid:connection_id>/webhook/', views.webhook_intake, name='webhook-intake'),
+]
@@ -1,11 +1,152 @@
+import hmac
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 
+from . import metrics
+from .cache import result_cache
+from .models import MCPWebhookEvent, UserMCPConnection
+from .realtime import SubscriptionRevoked, hub
+from .webhooks import WebhookEvent, idempotency_key_for, ingestor
+
+# Segundos sin mensajes tras los que se envía un comentario SSE para mantener viva la conexión.
+SSE_HEARTBEAT_INTERVAL = 15
+
 class MCPProviderViewSet(viewsets.ReadOnlyModelViewSet):
     """
     ViewSet para manejar las operaciones relacionadas con los MCP Providers.
     """
-   
\ No newline at end of file
+
+
+async def realtime_stream(request, connection_id):
+    """
+    Canal SSE con los datos en tiempo real de la propiedad de una conexión del usuario.
+    Todos los usuarios que miran la misma propiedad comparten un único poller del hub, así que
+    antes de suscribirse se comprueba con Google que las credenciales del usuario pueden leerla.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    connection = await UserMCPConnection.objects.select_related('user', 'mcp_provider').filter(
+        id=connection_id,
+        user=user,
+        status='active',
+    ).afirst()
+    if connection is None:
+        return HttpResponse(status=404)
+
+    plugin = await sync_to_async(connection.get_plugin)()
+    if 'get_real_time_data' not in plugin._method_table:
+        return JsonResponse({'error': f"{connection.mcp_provider.name} no ofrece datos en tiempo real."}, status=400)
+
+    # La propiedad sale de la configuración de la propia conexión, nunca de la petición
+    property_id = connection.config_data.get('property_id') or connection.config_data.get('site_url') or str(connection.id)
+    key = (connection.mcp_provider.slug, property_id)
+
+    async def check():
+        # El poller puede estar sondeando con esta conexión para otros usuarios: se deja de usar
+        # en cuanto se desactiva o Google deniega el acceso
+        if not await UserMCPConnection.objects.filter(id=connection.id, status='active').aexists():
+            raise SubscriptionRevoked(f"La conexión {connection.id} ya no está activa.")
+
+    async def fetch():
+        await check()
+        try:
+            return await plugin.execute_method('get_real_time_data', {})
+        except PermissionError as e:
+            raise SubscriptionRevoked(str(e)) from e
+
+    # Los datos pueden llegar del sondeo de otro usuario: el acceso se verifica una vez con las
+    # credenciales de este usuario, o con el permiso que ya registró la caché al consultar a Google
+    if not await result_cache.has_grant(connection, property_id):
+        try:
+            await fetch()
+        except SubscriptionRevoked as e:
+            return JsonResponse({'error': str(e)}, status=403)
+        except Exception as e:
+            return JsonResponse({'error': f"No se pudo verificar el acceso a los datos en tiempo real: {e}"}, status=502)
+        await result_cache.grant(connection, property_id)
+
+    async def events():
+        async for message in hub.stream(key, fetch, check, heartbeat=SSE_HEARTBEAT_INTERVAL):
+            if message['type'] == 'heartbeat':
+                yield ": ping\n\n"
+            else:
+                yield f"event: {message['type']}\ndata: {json.dumps(message, default=str)}\n\n"
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@csrf_exempt
+@require_POST
+async def webhook_intake(request, connection_id):
+    """
+    Recibe un evento de webhook del proveedor de una conexión y lo encola sin tocar la base de datos.
+    La conexión, el tipo de evento y la firma se validan después, al aplicar el lote.
+
+    Con WSGI no hay un event loop que sobreviva a la petición para aplicar los lotes en segundo plano,
+    así que el evento se aplica antes de responder.
+    """
+    body = request.body
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'JSON no válido.'}, status=400)
+
+    event_type = request.headers.get('X-MCP-Event') or (payload.get('event') or payload.get('type') if isinstance(payload, dict) else None)
+    if not event_type:
+        return JsonResponse({'error': 'Falta el tipo de evento.'}, status=400)
+    event_type = str(event_type)
+    if len(event_type) > MCPWebhookEvent._meta.get_field('event_type').max_length:
+        return JsonResponse({'error': 'Tipo de evento demasiado largo.'}, status=400)
+
+    event = WebhookEvent(
+        connection_id=connection_id,
+        event_type=event_type,
+        idempotency_key=idempotency_key_for(connection_id, body, payload, request.headers.get('Idempotency-Key')),
+        payload=payload,
+        body=body,
+        signature=request.headers.get('X-MCP-Signature'),
+    )
+    background = isinstance(request, ASGIRequest)
+    if not ingestor.submit(event, background=background):
+        response = JsonResponse({'error': 'Cola de eventos llena.'}, status=503)
+        response['Retry-After'] = '5'
+        return response
+    if not background:
+        try:
+            await ingestor.flush()
+        except Exception:
+            # El evento sigue pendiente y la clave de idempotencia evita aplicarlo dos veces si se reenvía
+            response = JsonResponse({'error': 'No se pudo aplicar el evento.'}, status=503)
+            response['Retry-After'] = '5'
+            return response
+    return JsonResponse({'status': 'accepted', 'idempotency_key': event.idempotency_key}, status=202)
+
+
+def metrics_endpoint(request):
+    """
+    Exporta las métricas de los MCP en el formato de texto de Prometheus.
+    Si la instrumentación está desactivada (MCP_METRICS_ENABLED) responde 404.
+    """
+    if not metrics.registry.enabled:
+        return HttpResponse(status=404)
+    token = getattr(settings, 'MCP_METRICS_TOKEN', None)
+    # Comparación en tiempo constante para no filtrar el token por el tiempo de respuesta
+    if token and not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f"Bearer {token}".encode()):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
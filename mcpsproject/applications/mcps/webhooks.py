@@ -0,0 +1,396 @@
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import hmac
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.db import InterfaceError, OperationalError, transaction
+from django.utils import timezone
+
+from .cache import PluginResultCache, result_cache
+from .models import MCPWebhookEvent, MCPWebhookKey, UserMCPConnection
+
+# Eventos pendientes como máximo. Con el buffer lleno la intake responde 503 y el proveedor reintenta.
+MAX_BUFFER_SIZE = 10000
+
+# Eventos por lote y segundos máximos que espera un evento antes de aplicarse.
+BATCH_SIZE = 500
+FLUSH_INTERVAL = 1.0
+
+# Claves de idempotencia recientes que se recuerdan en memoria para descartar reenvíos sin ir a la base de datos.
+RECENT_KEYS_SIZE = 50000
+
+# Intentos de aplicar por separado un evento que hace fallar su lote antes de apartarlo, y cuántos
+# eventos apartados se conservan en memoria para inspeccionarlos.
+MAX_EVENT_ATTEMPTS = 3
+DEAD_LETTER_SIZE = 1000
+
+# Errores de la base de datos que no dependen del lote (caída, conexión cortada): el lote se reintenta entero.
+TRANSIENT_ERRORS = (OperationalError, InterfaceError)
+
+logger = logging.getLogger("mcp.webhooks")
+
+
+class WebhookEvent:
+    """
+    Evento recibido por la intake, pendiente de aplicar.
+    """
+
+    __slots__ = ('connection_id', 'event_type', 'idempotency_key', 'payload', 'body', 'signature', 'received_at', 'attempts')
+
+    def __init__(self, connection_id, event_type: str, idempotency_key: str, payload: Dict, body: bytes, signature: Optional[str] = None):
+        self.connection_id = connection_id
+        self.event_type = event_type
+        self.idempotency_key = idempotency_key
+        self.payload = payload
+        self.body = body
+        self.signature = signature
+        self.received_at = timezone.now()
+        self.attempts = 0
+
+    @property
+    def resource(self) -> Optional[str]:
+        return PluginResultCache.resource_for(self.payload) if isinstance(self.payload, dict) else None
+
+    @property
+    def coalesce_key(self):
+        return (self.connection_id, self.event_type, self.resource)
+
+
+def idempotency_key_for(connection_id, body: bytes, payload: Any, header: Optional[str] = None) -> str:
+    """
+    Obtiene la clave de idempotencia del evento: la cabecera, el id del evento o un hash del cuerpo.
+    Siempre incluye la conexión, para que una clave enviada a otra conexión no colisione con la suya.
+    """
+    if header:
+        return f"{connection_id}:{header}"[:255]
+    if isinstance(payload, dict):
+        for name in ('id', 'event_id'):
+            if payload.get(name):
+                return f"{connection_id}:{payload[name]}"[:255]
+    return f"{connection_id}:{hashlib.sha256(body).hexdigest()}"
+
+
+class WebhookIngestor:
+    """
+    Cola en memoria de eventos de webhook que se aplican por lotes.
+
+    La intake solo encola y descarta los eventos cuya clave de idempotencia ya se ha guardado.
+    Un worker aplica los eventos en lotes: valida firma y tipo, fusiona los válidos repetidos para la
+    misma conexión, tipo y propiedad quedándose con el último, y hace una escritura en base de datos
+    y una invalidación de caché por lote. Como la validación se hace al aplicar, un evento falso no
+    puede sustituir ni marcar como duplicado al evento real.
+
+    Si un lote falla por la base de datos caída se reintenta entero; si falla por sus datos, sus eventos
+    se aplican uno a uno y los que siguen fallando se apartan tras MAX_EVENT_ATTEMPTS intentos, para
+    que un evento que la base de datos rechaza no bloquee la cola.
+    """
+
+    def __init__(self, max_buffer: int = MAX_BUFFER_SIZE, batch_size: int = BATCH_SIZE, flush_interval: float = FLUSH_INTERVAL):
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # Eventos pendientes agrupados por conexión, tipo y propiedad, en orden de llegada
+        self.pending: "OrderedDict[tuple, List[WebhookEvent]]" = OrderedDict()
+        self.pending_count = 0
+        # Claves de idempotencia de eventos ya guardados
+        self.recent_keys: "OrderedDict[str, None]" = OrderedDict()
+        # Invalidaciones de eventos ya guardados que todavía no se han podido aplicar a la caché
+        self.stale_connections: Set = set()
+        self.stale_resources: Set[Tuple[str, str]] = set()
+        # Eventos que la base de datos rechaza una y otra vez
+        self.dead_letter: "deque[WebhookEvent]" = deque(maxlen=DEAD_LETTER_SIZE)
+        self.wakeup: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.closing = False
+        self.started_at = time.monotonic()
+        self.counters = {
+            'received': 0,
+            'duplicates': 0,
+            'coalesced': 0,
+            'rejected': 0,
+            'invalid': 0,
+            'applied': 0,
+            'batches': 0,
+            'errors': 0,
+            'dead_lettered': 0,
+        }
+        self.last_batch_seconds = 0.0
+
+    def submit(self, event: WebhookEvent, background: bool = True) -> bool:
+        """
+        Encola un evento sin hacer ninguna operación de E/S.
+
+        Args:
+            event (WebhookEvent): El evento recibido.
+            background (bool): Si se arranca el worker que aplica los lotes. Solo tiene sentido con un event
+                loop que sobrevive a la petición (ASGI); si no, quien encola debe llamar a flush().
+
+        Returns:
+            bool: False si el buffer está lleno y el evento no se ha aceptado.
+        """
+        self.counters['received'] += 1
+        if event.idempotency_key in self.recent_keys:
+            self.counters['duplicates'] += 1
+            return True
+
+        if self.pending_count >= self.max_buffer:
+            self.counters['rejected'] += 1
+            return False
+
+        self.pending.setdefault(event.coalesce_key, []).append(event)
+        self.pending_count += 1
+        if background and not self.closing:
+            self._ensure_worker()
+            if self.pending_count >= self.batch_size:
+                self.wakeup.set()
+        return True
+
+    async def flush(self) -> int:
+        """
+        Aplica todos los eventos pendientes. Si un lote falla por la base de datos caída vuelve al
+        principio de la cola; los eventos que fallan por sí mismos se reintentan en el siguiente flush.
+
+        Returns:
+            int: Número de eventos aplicados.
+        """
+        await self._invalidate()
+        applied = 0
+        retry: List[WebhookEvent] = []
+        try:
+            while self.pending:
+                batch = []
+                while self.pending and len(batch) < self.batch_size:
+                    batch.extend(self.pending.popitem(last=False)[1])
+                self.pending_count -= len(batch)
+                try:
+                    applied += await self._apply(batch)
+                except TRANSIENT_ERRORS:
+                    self._requeue(batch)
+                    raise
+                except Exception as e:
+                    logger.warning(f"Lote de {len(batch)} eventos de webhook rechazado, se aplican uno a uno: {e}")
+                    applied += await self._apply_each(batch, retry)
+        finally:
+            self._requeue(retry)
+        return applied
+
+    async def close(self) -> None:
+        """
+        Aplica los eventos pendientes al parar el proceso, esperando a que el worker termine su lote.
+        """
+        self.closing = True
+        if self.task is not None and not self.task.done():
+            self.wakeup.set()
+            await self.task
+        self.task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error al aplicar los eventos de webhook pendientes al parar: {e}")
+        if self.pending_count:
+            logger.error(f"Se pierden {self.pending_count} eventos de webhook pendientes al parar")
+
+    def metrics(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self.started_at
+        batches = self.counters['batches']
+        return {
+            **self.counters,
+            'pending': self.pending_count,
+            'avg_batch_size': self.counters['applied'] / batches if batches else 0.0,
+            'last_batch_seconds': self.last_batch_seconds,
+            'applied_per_second': self.counters['applied'] / uptime if uptime else 0.0,
+        }
+
+    def _remember(self, idempotency_keys: Set[str]) -> None:
+        for idempotency_key in idempotency_keys:
+            self.recent_keys[idempotency_key] = None
+        while len(self.recent_keys) > RECENT_KEYS_SIZE:
+            self.recent_keys.popitem(last=False)
+
+    async def _apply_each(self, events: List[WebhookEvent], retry: List[WebhookEvent]) -> int:
+        """
+        Aplica por separado los eventos de un lote rechazado para aislar los que fallan.
+        Los que fallan se añaden a `retry`, o se apartan si ya han agotado sus intentos.
+        """
+        applied = 0
+        for index, event in enumerate(events):
+            try:
+                applied += await self._apply([event])
+            except TRANSIENT_ERRORS:
+                self._requeue(events[index:])
+                raise
+            except Exception as e:
+                event.attempts += 1
+                if event.attempts < MAX_EVENT_ATTEMPTS:
+                    retry.append(event)
+                    continue
+                self.dead_letter.append(event)
+                self.counters['dead_lettered'] += 1
+                logger.error(f"Evento de webhook {event.idempotency_key} descartado tras {event.attempts} intentos: {e}")
+        return applied
+
+    def _requeue(self, batch: List[WebhookEvent]) -> None:
+        """
+        Devuelve un lote fallido al principio de la cola, por delante de los eventos que llegaron después.
+        """
+        if not batch:
+            return
+        restored: "OrderedDict[tuple, List[WebhookEvent]]" = OrderedDict()
+        for event in batch:
+            restored.setdefault(event.coalesce_key, []).append(event)
+        for key, events in self.pending.items():
+            restored.setdefault(key, []).extend(events)
+        self.pending = restored
+        self.pending_count += len(batch)
+
+    def _ensure_worker(self) -> None:
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while not self.closing:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                self.counters['errors'] += 1
+                logger.error(f"Error al aplicar eventos de webhook: {e}")
+
+    async def _apply(self, events: List[WebhookEvent]) -> int:
+        start = time.perf_counter()
+        applied, seen_keys, invalid, duplicates, coalesced = await sync_to_async(self._store)(events)
+        # Solo se recuerdan las claves de eventos válidos, y una vez guardados
+        self._remember(seen_keys)
+        self.counters['invalid'] += invalid
+        self.counters['duplicates'] += duplicates
+        self.counters['coalesced'] += coalesced
+        self.counters['applied'] += len(applied)
+        self.counters['batches'] += 1
+
+        self.stale_connections.update(connection.id for _, connection in applied)
+        self.stale_resources.update(
+            (connection.mcp_provider.slug, resource)
+            for event, connection in applied
+            for resource in ([event.resource] if event.resource else PluginResultCache.configured_resources(connection))
+        )
+        await self._invalidate()
+        self.last_batch_seconds = time.perf_counter() - start
+        return len(applied)
+
+    async def _invalidate(self) -> None:
+        """
+        Invalida la caché de los eventos guardados. Si falla, los eventos no se vuelven a aplicar:
+        la invalidación queda pendiente y se reintenta en el siguiente flush.
+        """
+        if not self.stale_connections and not self.stale_resources:
+            return
+        connection_ids, resources = self.stale_connections, self.stale_resources
+        self.stale_connections, self.stale_resources = set(), set()
+        try:
+            await result_cache.invalidate(connection_ids=connection_ids, resources=resources)
+        except Exception as e:
+            self.stale_connections |= connection_ids
+            self.stale_resources |= resources
+            self.counters['errors'] += 1
+            logger.error(f"Error al invalidar la caché de eventos de webhook, se reintentará: {e}")
+
+    def _store(self, events: List[WebhookEvent]) -> Tuple[List[tuple], Set[str], int, int, int]:
+        """
+        Valida el lote contra las conexiones, fusiona los eventos válidos repetidos y guarda en una
+        sola transacción los nuevos y las claves de idempotencia de todos los aceptados.
+
+        Returns:
+            Tuple: Pares (evento, conexión) aplicados, claves de idempotencia de los eventos válidos,
+                número de eventos inválidos, de ya aplicados y de fusionados.
+        """
+        connections = {
+            connection.id: connection
+            for connection in UserMCPConnection.objects.select_related('mcp_provider').filter(
+                id__in={event.connection_id for event in events},
+                status='active',
+            )
+        }
+        already_applied = set(
+            MCPWebhookKey.objects.filter(
+                idempotency_key__in=[event.idempotency_key for event in events],
+            ).values_list('idempotency_key', flat=True)
+        )
+
+        latest: "OrderedDict[tuple, tuple]" = OrderedDict()
+        accepted: List[MCPWebhookKey] = []
+        seen_keys = set()
+        invalid = duplicates = coalesced = 0
+        for event in events:
+            connection = connections.get(event.connection_id)
+            if connection is None or not self._is_valid(event, connection):
+                invalid += 1
+                continue
+            if event.idempotency_key in already_applied or event.idempotency_key in seen_keys:
+                seen_keys.add(event.idempotency_key)
+                duplicates += 1
+                continue
+            seen_keys.add(event.idempotency_key)
+            accepted.append(MCPWebhookKey(connection=connection, idempotency_key=event.idempotency_key, received_at=event.received_at))
+            if event.coalesce_key in latest:
+                coalesced += 1
+                del latest[event.coalesce_key]
+            latest[event.coalesce_key] = (event, connection)
+        valid = list(latest.values())
+        if not valid:
+            return valid, seen_keys, invalid, duplicates, coalesced
+
+        with transaction.atomic():
+            # Las claves de los eventos fusionados se guardan aunque el evento no tenga fila propia
+            MCPWebhookKey.objects.bulk_create(accepted, ignore_conflicts=True)
+            MCPWebhookEvent.objects.bulk_create(
+                [
+                    MCPWebhookEvent(
+                        connection=connection,
+                        event_type=event.event_type,
+                        idempotency_key=event.idempotency_key,
+                        payload=event.payload,
+                        received_at=event.received_at,
+                    )
+                    for event, connection in valid
+                ],
+                ignore_conflicts=True,
+            )
+            UserMCPConnection.objects.filter(
+                id__in={connection.id for _, connection in valid},
+            ).update(last_sync=timezone.now())
+        return valid, seen_keys, invalid, duplicates, coalesced
+
+    @staticmethod
+    def _is_valid(event: WebhookEvent, connection: UserMCPConnection) -> bool:
+        allowed_events = connection.mcp_provider.webhook_events
+        if allowed_events and event.event_type not in allowed_events:
+            return False
+        secret = (connection.config_data or {}).get('webhook_secret')
+        if secret:
+            expected = hmac.new(secret.encode(), event.body, hashlib.sha256).hexdigest()
+            signature = (event.signature or '').removeprefix('sha256=')
+            return hmac.compare_digest(expected, signature)
+        return True
+
+
+ingestor = WebhookIngestor()
+
+
+def collect_metrics():
+    """
+    Métricas de la ingesta de webhooks para el endpoint de métricas.
+    """
+    for outcome in ('received', 'duplicates', 'coalesced', 'rejected', 'invalid', 'applied', 'errors', 'dead_lettered'):
+        yield 'mcp_webhook_events_total', 'counter', {'outcome': outcome}, ingestor.counters[outcome]
+    yield 'mcp_webhook_batches_total', 'counter', {}, ingestor.counters['batches']
+    yield 'mcp_webhook_pending', 'gauge', {}, ingestor.pending_count
+    yield 'mcp_webhook_last_batch_seconds', 'gauge', {}, ingestor.last_batch_seconds
@@ -0,0 +1,47 @@
+"""
+Configuración de gunicorn para servir la aplicación ASGI con workers de uvicorn.
+
+Uso:
+    DJANGO_SETTINGS_MODULE=mcpsproject.settings.prod gunicorn mcpsproject.asgi:application
+"""
+from pathlib import Path
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mcpsproject.settings.prod')
+
+from django.conf import settings  # noqa: E402
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+worker_class = 'uvicorn.workers.UvicornWorker'
+workers = settings.ASGI_WORKERS
+timeout = settings.ASGI_WORKER_TIMEOUT
+graceful_timeout = 30
+keepalive = settings.ASGI_KEEPALIVE
+
+# Reinicia los workers periódicamente (con jitter para que no lo hagan todos a la vez)
+max_requests = settings.ASGI_MAX_REQUESTS
+max_requests_jitter = max_requests // 10
+
+
+# Métricas multiproceso: cada worker vuelca las suyas en MCP_METRICS_MULTIPROCESS_DIR y el endpoint
+# de métricas agrega las de todos. Los contadores de los workers que terminan se acumulan en un archivo.
+
+def on_starting(server):
+    directory = settings.MCP_METRICS_MULTIPROCESS_DIR
+    if settings.MCP_METRICS_ENABLED and directory:
+        # Los contadores de una ejecución anterior no deben sumarse a los de esta. Solo se borran los
+        # volcados de métricas (*.json): el directorio puede compartirse con otros archivos.
+        os.makedirs(directory, exist_ok=True)
+        for path in Path(directory).glob('*.json'):
+            path.unlink(missing_ok=True)
+
+
+def post_worker_init(worker):
+    from applications.mcps import metrics
+    metrics.registry.start_multiprocess_writer()
+
+
+def child_exit(server, worker):
+    if settings.MCP_METRICS_ENABLED and settings.MCP_METRICS_MULTIPROCESS_DIR:
+        from applications.mcps import metrics
+        metrics.mark_process_dead(settings.MCP_METRICS_MULTIPROCESS_DIR, worker.pid)
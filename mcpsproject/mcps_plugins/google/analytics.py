@@ -1,62 +1,161 @@
 from typing import Dict, List, Any, Optional
+import asyncio
+from applications.mcps import metrics
+from applications.mcps.base import AnalyticsMCPPlugin, ISODate, mcp_method
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from mcps_plugins.google.auth import user_credentials
 
-from ...applications.mcps.base import AnalyticsMCPPlugin
+# Dimensiones y métricas por defecto del informe en tiempo real
+REAL_TIME_DIMENSIONS = ['unifiedScreenName']
+REAL_TIME_METRICS = ['activeUsers']
+REAL_TIME_LIMIT = 50
 
 class GoogleAnalytics4MCP(AnalyticsMCPPlugin):
     """
     Google Analytics 4 MCP Plugin
     """
 
-    async def get_available_methods(self) -> List[Dict]:
+    async def authenticate(self) -> bool:
         """
-        Toma los métodos disponibles de Google Analytics 4.
+        Autentica el plugin con un informe mínimo de la propiedad configurada.
 
         Returns:
-            List[Dict]: Nos devuelve ningún método ya que Google Analytics 4 no tiene métodos disponibles.
-        """
-        return [
-            {
-                "name": "get_page_views",
-                "description": "Obtiene las vistas de página del sitio web.",
-                "parameters": {
-                    'property_id': 'GA4 property ID',
-                    'start_date': 'Fecha de inicio en formato YYYY-MM-DD',
-                    'end_date': 'Fecha de fin en formato YYYY-MM-DD',
-                    'dimensions': 'Dimensiones para agrupar los datos (opcional)',
-                    'limit': 'Número máximo de resultados a devolver (opcional)',
-            }
-            },
-            {
-                "name": "get_user_metrics",
-                "description": "Obtiene métricas de usuarios del sitio web.",
-                "parameters": {
-                    'property_id': 'GA4 property ID',
-                    'start_date': 'Fecha de inicio en formato YYYY-MM-DD',
-                    'end_date': 'Fecha de fin en formato YYYY-MM-DD',
-            }
+            bool: True si la autenticación es exitosa, False en caso contrario.
+        """
+        try:
+            await self._run_report('runReport', self._property_id(None), {
+                'dateRanges': [{'startDate': 'yesterday', 'endDate': 'today'}],
+                'metrics': [{'name': 'activeUsers'}],
+                'limit': 1,
+            })
+            return True
+        except Exception as e:
+            self.logger.error(f"Error durante la autentificación en GA4: {e}")
+            return False
+
+    @mcp_method(
+        description="Obtiene las vistas de página del sitio web.",
+        parameters={
+            'property_id': 'GA4 property ID',
+            'start_date': 'Fecha de inicio en formato YYYY-MM-DD',
+            'end_date': 'Fecha de fin en formato YYYY-MM-DD',
+            'dimensions': 'Dimensiones para agrupar los datos (opcional)',
+            'limit': 'Número máximo de resultados a devolver (opcional)',
         },
-        {
-            "name": "get_real_time_data",
-            "description": "Obtiene datos en tiempo real del sitio web.",
-        }
-    ]
+    )
+    async def get_page_views(self, property_id: str, start_date: ISODate, end_date: ISODate, dimensions: Optional[List[str]] = None, limit: Optional[int] = 10000) -> Dict:
+        """
+        Obtiene las vistas de página del sitio web.
+
+        Args:
+            property_id (str): ID de la propiedad de GA4.
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+            dimensions (Optional[List[str]]): Dimensiones para agrupar los datos. Por defecto ['pagePath'].
+            limit (Optional[int]): Número máximo de filas. Por defecto es 10000.
+
+        Returns:
+            Dict: Respuesta de runReport.
+        """
+        return await self.get_metrics(start_date, end_date, ['screenPageViews'], dimensions or ['pagePath'], property_id=property_id, limit=limit)
 
-    async def execute_method(self, method: str, params: Dict) -> Dict:
+    @mcp_method(
+        description="Obtiene métricas de usuarios del sitio web.",
+        parameters={
+            'property_id': 'GA4 property ID',
+            'start_date': 'Fecha de inicio en formato YYYY-MM-DD',
+            'end_date': 'Fecha de fin en formato YYYY-MM-DD',
+        },
+    )
+    async def get_user_metrics(self, property_id: str, start_date: ISODate, end_date: ISODate) -> Dict:
+        """
+        Obtiene usuarios activos, nuevos usuarios y sesiones por día.
+
+        Args:
+            property_id (str): ID de la propiedad de GA4.
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+
+        Returns:
+            Dict: Respuesta de runReport.
+        """
+        return await self.get_metrics(start_date, end_date, ['activeUsers', 'newUsers', 'sessions'], ['date'], property_id=property_id)
+
+    @mcp_method(
+        description="Obtiene datos en tiempo real del sitio web.",
+        parameters={
+            'property_id': 'GA4 property ID (opcional, por defecto la de la conexión)',
+        },
+        cache_ttl=0,
+    )
+    async def get_real_time_data(self, property_id: Optional[str] = None) -> Dict:
         """
-        Ejecuta un método de Google Analytics 4.
+        Obtiene los usuarios activos de los últimos 30 minutos por pantalla.
 
         Args:
-            method (str): El nombre del método a ejecutar.
-            params (Dict): Los parámetros necesarios para el método.
+            property_id (Optional[str]): ID de la propiedad de GA4. Por defecto, la de la configuración de la conexión.
 
         Returns:
-            Dict: El resultado de la ejecución del método.
-        """
-        if method == "get_page_views":
-            return await self.get_page_views(**params)
-        elif method == "get_user_metrics":
-            return await self.get_user_metrics(**params)
-        elif method == "get_real_time_data":
-            return await self.get_real_time_data(**params)
-        else:
-            raise ValueError(f"Method {method} not supported.")
\ No newline at end of file
+            Dict: Respuesta de runRealtimeReport.
+
+        Raises:
+            PermissionError: Si Google deniega el acceso a la propiedad.
+        """
+        try:
+            return await self._run_report('runRealtimeReport', self._property_id(property_id), {
+                'dimensions': [{'name': name} for name in REAL_TIME_DIMENSIONS],
+                'metrics': [{'name': name} for name in REAL_TIME_METRICS],
+                'limit': REAL_TIME_LIMIT,
+            })
+        except HttpError as e:
+            if e.resp.status in (401, 403):
+                raise PermissionError(f"Sin acceso a los datos en tiempo real de la propiedad: {e}") from e
+            raise
+
+    async def get_metrics(self, start_date: str, end_date: str, metrics: List[str], dimensions: List[str] = None, property_id: Optional[str] = None, limit: Optional[int] = None) -> Dict:
+        """
+        Obtiene un informe de GA4 con las métricas y dimensiones indicadas.
+
+        Args:
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+            metrics (List[str]): Métricas del informe.
+            dimensions (List[str]): Dimensiones del informe (opcional).
+            property_id (Optional[str]): ID de la propiedad. Por defecto, la de la configuración de la conexión.
+            limit (Optional[int]): Número máximo de filas (opcional).
+
+        Returns:
+            Dict: Respuesta de runReport.
+        """
+        body = {
+            'dateRanges': [{'startDate': start_date, 'endDate': end_date}],
+            'dimensions': [{'name': name} for name in dimensions or []],
+            'metrics': [{'name': name} for name in metrics],
+        }
+        if limit:
+            body['limit'] = limit
+        return await self._run_report('runReport', self._property_id(property_id), body)
+
+    async def _run_report(self, method: str, property_id: str, body: Dict) -> Dict:
+        service = self._build_service()
+        metrics.count_upstream(self.metrics_provider, f"properties.{method}")
+        request = getattr(service.properties(), method)(property=f"properties/{property_id}", body=body)
+        # googleapiclient es síncrono: la petición se ejecuta en un hilo para no bloquear el event loop
+        return await asyncio.to_thread(request.execute)
+
+    def _property_id(self, property_id: Optional[str]) -> str:
+        property_id = str(property_id or (self.config or {}).get('property_id') or '')
+        if not property_id:
+            raise ValueError("La conexión no tiene ninguna propiedad de GA4 configurada.")
+        return property_id.removeprefix('properties/')
+
+    def _build_service(self):
+        """
+        Construye el cliente de la GA4 Data API con las credenciales del usuario.
+
+        Returns:
+            Resource: Servicio de googleapiclient para la Data API.
+        """
+        creds = user_credentials(self.credentials)
+        return build('analyticsdata', 'v1beta', credentials=creds)
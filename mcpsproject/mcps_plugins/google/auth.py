@@ -0,0 +1,38 @@
+from typing import Dict
+import datetime
+from google.oauth2.credentials import Credentials
+
+# Endpoint de Google para refrescar tokens OAuth cuando las credenciales guardadas no lo indican
+GOOGLE_TOKEN_URI = 'https://oauth2.googleapis.com/token'
+
+def user_credentials(info: Dict) -> Credentials:
+    """
+    Construye las credenciales OAuth de usuario de google-auth a partir de las guardadas en la conexión.
+    Acepta el formato de `Credentials.to_json()`: token, refresh_token, token_uri, client_id,
+    client_secret, scopes y expiry. Con refresh_token y cliente, google-auth renueva el token caducado.
+
+    Args:
+        info (Dict): Credenciales descifradas de la conexión.
+
+    Returns:
+        Credentials: Credenciales listas para `googleapiclient.discovery.build`.
+
+    Raises:
+        ValueError: Si no hay ni token ni refresh_token.
+    """
+    if not info.get('token') and not info.get('refresh_token'):
+        raise ValueError("Las credenciales de la conexión no tienen token ni refresh_token.")
+    expiry = info.get('expiry')
+    if expiry:
+        # google-auth trabaja con fechas UTC sin zona horaria, como las escribe to_json()
+        expiry = datetime.datetime.strptime(expiry.rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S')
+    scopes = info.get('scopes')
+    return Credentials(
+        token=info.get('token'),
+        refresh_token=info.get('refresh_token'),
+        token_uri=info.get('token_uri') or GOOGLE_TOKEN_URI,
+        client_id=info.get('client_id'),
+        client_secret=info.get('client_secret'),
+        scopes=scopes.split() if isinstance(scopes, str) else scopes,
+        expiry=expiry or None,
+    )
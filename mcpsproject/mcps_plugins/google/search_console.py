@@ -1,7 +1,15 @@
-from typing import Dict, List, Any, Optional
-from ...applications.mcps.base import BaseMCPPlugin
-from googleapliclient.discovery import build
-from google.auth.credentials import Credentials
+from typing import AsyncIterator, Dict, List, Any, Optional
+import asyncio
+from applications.mcps import metrics
+from applications.mcps.base import BaseMCPPlugin, ISODate, mcp_method
+from applications.mcps.rollups import SearchConsoleRollups
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from mcps_plugins.google.auth import user_credentials
+
+# Número de consultas por petición batch de googleapiclient y número de batches en vuelo a la vez.
+MULTI_SITE_BATCH_SIZE = 50
+MULTI_SITE_MAX_CONCURRENCY = 4
 
 class GoogleSearchConsoleMCP(BaseMCPPlugin):
     """
@@ -17,103 +25,259 @@ class GoogleSearchConsoleMCP(BaseMCPPlugin):
             bool: True si la autenticación es exitosa, False en caso contrario.
         """
         try:
-            creds = Credentials(**self.credentials)
-            service = build('searchconsole', 'v1', credentials=creds)
+            service = self._build_service()
             # Test con una llamada simple llamada
-            sites  = service.sites().list().execute()
+            metrics.count_upstream(self.metrics_provider, 'sites.list')
+            sites  = await asyncio.to_thread(service.sites().list().execute)
             return True
         except Exception as e:
             self.logger.error(f"Error durante la autentificación en GSC: {e}")
             return False
-        
 
-        async def get_available_methods(self) -> list[Dict]:
-            """
-            Obtiene los métodos disponibles del plugin.
-            
-            Returns:
-                list: Lista de métodos disponibles.
-            """
-            return [
-                {
-                    "name": "get_search_analytics",
-                    "description": "Obtiene datos de rendimiento de Google Search Console.",
-                    "parameters": {
-                        'site_url': 'Website URL',
-                        'start_date': 'Fecha de inicio (YYYY-MM-DD)',
-                        'end_date': 'Fecha de fin (YYYY-MM-DD)',
-                        'dimensions': 'Dimensiones a incluir (ej. ["query", "page"])',
-                        'row_limit': 'Límite de filas a retornar (opcional, por defecto 1000)',
-                    }
-                },
-                {
-                    "name": "get_top_pages",
-                    "description": "Obtiene las páginas más relevantes del sitio web.", 
-                    "parameters": {
-                        'site_url': 'Website URL',
-                        'start_date': 'Fecha de inicio (YYYY-MM-DD)',
-                        'end_date': 'Fecha de fin (YYYY-MM-DD)',
-                        'limit': 'Número de páginas a retornar (opcional, por defecto 10)',
-                    }
-                },
-                {
-                    "name": "get_top_queries",
-                    "description": "Obtiene las consultas de búsqueda más relevantes.",
-                    "parameters": {
-                        'site_url': 'Website URL',
-                        'start_date': 'Fecha de inicio (YYYY-MM-DD)',
-                        'end_date': 'Fecha de fin (YYYY-MM-DD)',
-                        'limit': 'Número de queries a retornar (opcional, por defecto 10)',
-                    }
-
-                }
-            ]
-        
-    async def execute_method(self, method: str, params: Dict) -> Dict:
-        """
-        Ejecuta un método específico del plugin.
+    @mcp_method(
+        description="Obtiene datos de rendimiento de Google Search Console.",
+        parameters={
+            'site_url': 'Website URL',
+            'start_date': 'Fecha de inicio (YYYY-MM-DD)',
+            'end_date': 'Fecha de fin (YYYY-MM-DD)',
+            'dimensions': 'Dimensiones a incluir (ej. ["query", "page"])',
+            'row_limit': 'Límite de filas a retornar (opcional, por defecto 1000)',
+            'start_row': 'Primera fila a retornar, para paginar (opcional, por defecto 0)',
+        },
+    )
+    async def get_search_analytics(self, site_url: str, start_date: ISODate, end_date: ISODate, dimensions: Optional[List[str]] = None, row_limit: Optional[int] = 1000, start_row: int = 0) -> Dict:
+        """
+        Obtiene datos de rendimiento de Google Search Console.
         
         Args:
-            method (str): El nombre del método a ejecutar.
-            params (Dict): Los parámetros necesarios para el método.
+            site_url (str): URL del sitio web.
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+            dimensions (Optional[List[str]]): Dimensiones a incluir en la consulta. Por defecto ['page'].
+            row_limit (Optional[int]): Límite de filas a retornar. Por defecto es 1000.
+            start_row (int): Primera fila a retornar, para paginar. Por defecto es 0.
         
         Returns:
-            Dict: Resultado de la ejecución del método.
+            Dict: Datos de rendimiento del sitio web.
+        """
+        service = self._build_service()
+        request_body = {
+            'startDate': start_date,
+            'endDate': end_date,
+            'dimensions': dimensions or ['page'],
+            'rowLimit': row_limit,
+            'startRow': start_row
+        }
+
+        metrics.count_upstream(self.metrics_provider, 'searchanalytics.query')
+        request = service.searchanalytics().query(
+            siteUrl=site_url, 
+            body=request_body
+            )
+        # googleapiclient es síncrono: la petición se ejecuta en un hilo para no bloquear el event loop
+        response = await asyncio.to_thread(request.execute)
+        return response
+
+    @mcp_method(
+        description="Obtiene las páginas más relevantes del sitio web.",
+        parameters={
+            'site_url': 'Website URL',
+            'start_date': 'Fecha de inicio (YYYY-MM-DD)',
+            'end_date': 'Fecha de fin (YYYY-MM-DD)',
+            'limit': 'Número de páginas a retornar (opcional, por defecto 10)',
+        },
+        proves_access=False,
+    )
+    async def get_top_pages(self, site_url: str, start_date: ISODate, end_date: ISODate, limit: Optional[int] = 10) -> Dict:
         """
-        if method == "get_search_analytics":
-            return await self.get_search_analytics(**params)
-        elif method == "get_top_pages":
-            return await self.get_top_pages(**params)
-        elif method == "get_top_queries":
-            return await self.get_top_queries(**params)
-        else:
-            raise ValueError(f"Método {method} no implementado.")
+        Obtiene las páginas con más clicks del rango a partir de los rollups diarios.
         
-    async def _get_search_analytics(self, site_url: str, start_date: str, end_date: str, dimensions: List[str], row_limit: Optional[int] = 1000) -> Dict:
+        Args:
+            site_url (str): URL del sitio web.
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+            limit (Optional[int]): Número de páginas a retornar. Por defecto es 10.
+        
+        Returns:
+            Dict: Páginas ordenadas por clicks.
         """
-        Obtiene datos de rendimiento de Google Search Console.
+        return await SearchConsoleRollups(self).top(site_url, 'page', start_date, end_date, limit)
+
+    @mcp_method(
+        description="Obtiene las consultas de búsqueda más relevantes.",
+        parameters={
+            'site_url': 'Website URL',
+            'start_date': 'Fecha de inicio (YYYY-MM-DD)',
+            'end_date': 'Fecha de fin (YYYY-MM-DD)',
+            'limit': 'Número de queries a retornar (opcional, por defecto 10)',
+        },
+        proves_access=False,
+    )
+    async def get_top_queries(self, site_url: str, start_date: ISODate, end_date: ISODate, limit: Optional[int] = 10) -> Dict:
+        """
+        Obtiene las queries con más clicks del rango a partir de los rollups diarios.
         
         Args:
             site_url (str): URL del sitio web.
             start_date (str): Fecha de inicio en formato YYYY-MM-DD.
             end_date (str): Fecha de fin en formato YYYY-MM-DD.
-            dimensions (List[str]): Dimensiones a incluir en la consulta.
-            row_limit (Optional[int]): Límite de filas a retornar. Por defecto es 1000.
+            limit (Optional[int]): Número de queries a retornar. Por defecto es 10.
         
         Returns:
-            Dict: Datos de rendimiento del sitio web.
+            Dict: Queries ordenadas por clicks.
+        """
+        return await SearchConsoleRollups(self).top(site_url, 'query', start_date, end_date, limit)
+
+    @mcp_method(
+        description="Obtiene datos de rendimiento de varios sitios agrupando las consultas en peticiones batch.",
+        parameters={
+            'site_urls': 'Lista de URLs de los sitios',
+            'start_date': 'Fecha de inicio (YYYY-MM-DD)',
+            'end_date': 'Fecha de fin (YYYY-MM-DD)',
+            'dimensions': 'Dimensiones a incluir (ej. ["query", "page"])',
+            'row_limit': 'Límite de filas por sitio (opcional, por defecto 1000)',
+        },
+    )
+    async def get_multi_site_analytics(self, site_urls: List[str], start_date: ISODate, end_date: ISODate, dimensions: Optional[List[str]] = None, row_limit: Optional[int] = 1000) -> Dict:
+        """
+        Obtiene datos de rendimiento de varios sitios en pocas peticiones HTTP.
+        
+        Args:
+            site_urls (List[str]): URLs de los sitios a consultar.
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+            dimensions (Optional[List[str]]): Dimensiones a incluir en la consulta.
+            row_limit (Optional[int]): Límite de filas por sitio. Por defecto es 1000.
+        
+        Returns:
+            Dict: Respuestas por sitio en 'sites' y errores por sitio en 'errors'.
         """
-        creds = Credentials(**self.credentials)
-        service = build('searchconsole', 'v1', credentials=creds)
+        result = {'sites': {}, 'errors': {}}
+        async for site_result in self.iter_multi_site_analytics(site_urls, start_date, end_date, dimensions, row_limit):
+            if 'error' in site_result:
+                result['errors'][site_result['site_url']] = site_result['error']
+            else:
+                result['sites'][site_result['site_url']] = site_result['data']
+        return result
+
+    async def iter_multi_site_analytics(
+        self,
+        site_urls: List[str],
+        start_date: str,
+        end_date: str,
+        dimensions: Optional[List[str]] = None,
+        row_limit: Optional[int] = 1000,
+        batch_size: int = MULTI_SITE_BATCH_SIZE,
+        max_concurrency: int = MULTI_SITE_MAX_CONCURRENCY,
+    ) -> AsyncIterator[Dict]:
+        """
+        Consulta varios sitios agrupando las consultas en peticiones batch de googleapiclient.
+        Como mucho `max_concurrency` batches están en vuelo a la vez y los resultados
+        se devuelven a medida que termina cada batch.
+        
+        Args:
+            site_urls (List[str]): URLs de los sitios a consultar.
+            start_date (str): Fecha de inicio en formato YYYY-MM-DD.
+            end_date (str): Fecha de fin en formato YYYY-MM-DD.
+            dimensions (Optional[List[str]]): Dimensiones a incluir en la consulta.
+            row_limit (Optional[int]): Límite de filas por sitio. Por defecto es 1000.
+            batch_size (int): Número de consultas por petición batch.
+            max_concurrency (int): Número máximo de batches ejecutándose a la vez.
+        
+        Yields:
+            Dict: {'site_url': ..., 'data': ...} o {'site_url': ..., 'error': ...} por cada sitio.
+        """
+        if batch_size < 1 or max_concurrency < 1:
+            raise ValueError("batch_size y max_concurrency deben ser mayores que 0.")
+
         request_body = {
             'startDate': start_date,
             'endDate': end_date,
             'dimensions': dimensions or ['page'],
             'rowLimit': row_limit
         }
+        # Elimina duplicados conservando el orden para no pagar dos veces la misma consulta
+        unique_sites = list(dict.fromkeys(site_urls))
+        chunks = [unique_sites[i:i + batch_size] for i in range(0, len(unique_sites), batch_size)]
+        semaphore = asyncio.Semaphore(max_concurrency)
 
-        response = service.searchanalytics().query(
-            siteUrl=site_url, 
-            body=request_body
-            ).execute()
-        return response
\ No newline at end of file
+        async def run_chunk(chunk: List[str]) -> List[Dict]:
+            async with semaphore:
+                # googleapiclient es síncrono: cada batch se ejecuta en un hilo aparte
+                return await asyncio.to_thread(self._execute_batch, chunk, request_body)
+
+        tasks = [asyncio.create_task(run_chunk(chunk)) for chunk in chunks]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                for site_result in await finished:
+                    yield site_result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def verify_site_access(self, site_url: str) -> bool:
+        """
+        Comprueba con una llamada barata a Google si las credenciales del usuario pueden leer el sitio.
+        
+        Args:
+            site_url (str): URL del sitio web.
+        
+        Returns:
+            bool: True si Google devuelve el sitio, False si responde que no existe o no hay permiso.
+        """
+        service = self._build_service()
+        metrics.count_upstream(self.metrics_provider, 'sites.get')
+        try:
+            await asyncio.to_thread(service.sites().get(siteUrl=site_url).execute)
+        except HttpError as e:
+            if e.resp.status in (401, 403, 404):
+                return False
+            raise
+        return True
+
+    def _execute_batch(self, site_urls: List[str], request_body: Dict) -> List[Dict]:
+        """
+        Ejecuta una petición batch con una consulta de searchanalytics por sitio.
+        
+        Args:
+            site_urls (List[str]): URLs de los sitios del batch.
+            request_body (Dict): Cuerpo de la consulta, común a todos los sitios.
+        
+        Returns:
+            List[Dict]: Resultado o error de cada sitio del batch.
+        """
+        # Cada hilo construye su propio servicio porque el transporte http no es thread-safe
+        service = self._build_service()
+        results = []
+
+        def callback(request_id, response, exception):
+            if exception is not None:
+                results.append({'site_url': request_id, 'error': str(exception)})
+            else:
+                results.append({'site_url': request_id, 'data': response})
+
+        batch = service.new_batch_http_request(callback=callback)
+        for site_url in site_urls:
+            batch.add(
+                service.searchanalytics().query(siteUrl=site_url, body=request_body),
+                request_id=site_url,
+            )
+        try:
+            metrics.count_upstream(self.metrics_provider, 'batch')
+            batch.execute()
+        except Exception as e:
+            # Un fallo de la petición batch completa afecta a todos los sitios que aún no tienen respuesta
+            self.logger.error(f"Error en la petición batch de GSC: {e}")
+            answered = {result['site_url'] for result in results}
+            results.extend({'site_url': site_url, 'error': str(e)} for site_url in site_urls if site_url not in answered)
+        return results
+
+    def _build_service(self):
+        """
+        Construye el cliente de la API de Search Console con las credenciales del usuario.
+        
+        Returns:
+            Resource: Servicio de googleapiclient para Search Console.
+        """
+        creds = user_credentials(self.credentials)
+        return build('searchconsole', 'v1', credentials=creds)
@@ -11,6 +11,11 @@ import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mcpsproject.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mcpsproject.settings.prod')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Se importa con las apps ya cargadas: al parar el worker aplica los eventos de webhook pendientes
+from applications.mcps.lifespan import LifespanMiddleware  # noqa: E402
+
+application = LifespanMiddleware(django_application)
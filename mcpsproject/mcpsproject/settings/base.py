@@ -90,3 +90,13 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Instrumentación de los MCP (endpoint /mcps/metrics/ en formato Prometheus)
+
+MCP_METRICS_ENABLED = False
+
+MCP_METRICS_TOKEN = None
+
+# Directorio en el que cada worker vuelca sus métricas para que el endpoint agregue las de todos.
+# Sin él, cada scrape solo ve las del worker que lo atiende.
+MCP_METRICS_MULTIPROCESS_DIR = None
@@ -0,0 +1,113 @@
+import os
+
+from .base import *
+
+# Toda la configuración sensible o dependiente del despliegue llega por variables de entorno.
+
+DEBUG = False
+
+# Debe ser una clave Fernet válida: se usa también para cifrar las credenciales de las conexiones.
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host]
+
+ASGI_APPLICATION = 'mcpsproject.asgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/databases/#connection-pool
+#
+# Con ASGI las conexiones persistentes (CONN_MAX_AGE) no se reutilizan entre peticiones, así que
+# por defecto se usa el pool de psycopg. Si delante hay un pooler externo (PgBouncer) se desactiva
+# el pool con DB_POOL=0 y se usan conexiones persistentes con health checks.
+
+DB_POOL = os.environ.get('DB_POOL', '1') == '1'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DB_NAME', 'mcpsproject'),
+        'USER': os.environ.get('DB_USER', 'mcpsproject'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': not DB_POOL,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+            },
+        } if DB_POOL else {},
+    }
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/#redis
+#
+# Caché compartida por todos los workers: resultados de los plugins (nivel de usuario y compartido),
+# permisos de acceso y sesiones.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://localhost:6379/0'),
+        'KEY_PREFIX': 'mcps',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'max_connections': int(os.environ.get('REDIS_MAX_CONNECTIONS', '50')),
+        },
+    }
+}
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+
+# MCPs
+
+MCP_CACHE_ALIAS = 'default'
+
+MCP_CACHE_TTL = int(os.environ.get('MCP_CACHE_TTL', '600'))
+
+MCP_METRICS_TOKEN = os.environ.get('MCP_METRICS_TOKEN') or None
+
+# El endpoint de métricas expone nombres de proveedores, métodos y volumen de uso: por defecto
+# solo se activa si está protegido con un token (ver el check mcps.W006).
+MCP_METRICS_ENABLED = os.environ.get('MCP_METRICS_ENABLED', '1' if MCP_METRICS_TOKEN else '0') == '1'
+
+# gunicorn.conf.py lo vacía al arrancar y arranca en cada worker el volcado de sus métricas.
+MCP_METRICS_MULTIPROCESS_DIR = os.environ.get('MCP_METRICS_MULTIPROCESS_DIR', '/tmp/mcps-metrics')
+
+
+# Workers ASGI (gunicorn.conf.py los lee de aquí)
+#
+# Cada worker tiene su propio event loop, pool de base de datos y hub de tiempo real (los hubs se
+# reparten por Redis el sondeo de cada propiedad), así que DB_POOL_MAX_SIZE * ASGI_WORKERS no debe
+# superar max_connections de PostgreSQL.
+
+ASGI_WORKERS = int(os.environ.get('ASGI_WORKERS', str(min((os.cpu_count() or 1) * 2 + 1, 8))))
+
+ASGI_WORKER_TIMEOUT = int(os.environ.get('ASGI_WORKER_TIMEOUT', '120'))
+
+ASGI_KEEPALIVE = int(os.environ.get('ASGI_KEEPALIVE', '5'))
+
+ASGI_MAX_REQUESTS = int(os.environ.get('ASGI_MAX_REQUESTS', '10000'))
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/5.2/howto/static-files/
+
+STATIC_URL = 'static/'
+
+STATIC_ROOT = BASE_DIR.parent / 'staticfiles'
+
+
+# Security
+
+SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+
+SESSION_COOKIE_SECURE = True
+
+CSRF_COOKIE_SECURE = True